@@ -0,0 +1,352 @@
+"""
+游戏建议引擎
+根据游戏状态生成购买、站位、升级建议和场面分析，并提供在状态变化时后台预先计算建议的工作线程
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from board_analytics import BoardAnalytics
+
+
+# 后台预计算的建议类型，按计算开销从小到大排列（"board" 为场面分析）
+ADVICE_KINDS = ("buy", "upgrade", "board", "position")
+
+
+def minions_signature(minions: List[Dict[str, Any]]) -> Tuple:
+    """随从列表的签名：顺序、名称、属性和是否金色"""
+    return tuple((m.get("name", ""), m.get("attack", 0), m.get("health", 0), bool(m.get("golden")))
+                 for m in minions)
+
+
+def advice_signature(kind: str, game_state: Dict[str, Any], context: Any = None) -> Tuple:
+    """某类建议依赖的状态签名，签名不变时无需重新计算"""
+    board = minions_signature(game_state.get("board", {}).get("minions", []))
+    tier = game_state.get("tavern_tier", 1)
+    if kind == "buy":
+        return minions_signature(game_state.get("shop", {}).get("minions", [])), board, tier
+    if kind == "upgrade":
+        return game_state.get("turn"), tier, game_state.get("gold"), board
+    if kind == "position":
+        return board, tier, context
+    return (board,)
+
+
+class AdviceEngine(ABC):
+    """根据游戏状态生成建议
+
+    刷新概率、升级规划和站位搜索由子类实现，返回结果字典，失败时返回包含error的字典。
+    建议依赖的商店、场面、回合、金币和酒馆等级都从传入的游戏状态显式放入参数，
+    子类不应再读取其他来源的“最新状态”（后台预计算时它可能已经比任务的状态更新）。
+    """
+
+    board_analytics: Optional[BoardAnalytics] = None
+    # MCP的多个请求线程和后台预计算线程可能同时更新场面统计
+    _board_lock = threading.Lock()
+
+    @abstractmethod
+    def _shop_odds(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """刷新概率"""
+
+    @abstractmethod
+    def _plan_economy(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """升级曲线规划"""
+
+    @abstractmethod
+    def _optimize_position(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """站位搜索"""
+
+    def game_advice(self, advice_type: str, game_state: Dict[str, Any],
+                    parameters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """按建议类型生成建议"""
+        if advice_type == "buy":
+            shop_minions = game_state.get("shop", {}).get("minions", [])
+            request = {"rolls": 3, "tier": game_state.get("tavern_tier", 1), "shop": shop_minions,
+                       "board": game_state.get("board", {}).get("minions", [])}
+            odds = self._shop_odds(request) if shop_minions else {}
+            if odds.get("candidates"):
+                return self._buy_advice(odds["candidates"])
+            if shop_minions:
+                best_minion = max(shop_minions, key=lambda x: x.get("tier", 0))
+                return {
+                    "advice": f"建议购买 {best_minion['name']}",
+                    "reason": f"这是商店中最高等级的随从（{best_minion['tier']}星）",
+                    "priority": "high"
+                }
+            else:
+                return {
+                    "advice": "商店中没有随从，建议刷新",
+                    "reason": "商店为空，需要刷新寻找更好的选择",
+                    "priority": "medium"
+                }
+
+        elif advice_type == "position":
+            board_minions = game_state.get("board", {}).get("minions", [])
+            if len(board_minions) > 1:
+                # 未提供对手场面时由识别服务使用战斗阶段记录的对手场面
+                request = {"board": board_minions, "tier": game_state.get("tavern_tier", 1)}
+                if (parameters or {}).get("opponents"):
+                    request["opponents"] = parameters["opponents"]
+                result = self._optimize_position(request)
+                if "error" not in result or request.get("opponents"):
+                    return self._position_advice(result)
+            if board_minions:
+                # 没有对手场面时给出通用站位建议
+                return {
+                    "advice": "圣盾随从放前排，高攻击随从放后排",
+                    "reason": "保护圣盾随从，最大化输出",
+                    "priority": "medium"
+                }
+            else:
+                return {
+                    "advice": "暂无随从，无需考虑站位",
+                    "reason": "场面上没有随从",
+                    "priority": "low"
+                }
+
+        elif advice_type == "upgrade":
+            current_tier = game_state.get("tavern_tier", 1)
+            request = {"turn": game_state.get("turn"), "gold": game_state.get("gold"), "tier": current_tier,
+                       "board": game_state.get("board", {}).get("minions", [])}
+            if (parameters or {}).get("upgrade_cost") is not None:
+                request["upgrade_cost"] = parameters["upgrade_cost"]
+            plan = self._plan_economy(request) if current_tier < 6 else {}
+            if plan.get("plan"):
+                return self._upgrade_advice(plan)
+            if current_tier < 6:
+                return {
+                    "advice": f"建议升级到 {current_tier + 1} 本",
+                    "reason": "升级可以获得更高等级的随从",
+                    "priority": "high"
+                }
+            else:
+                return {
+                    "advice": "已达到最高等级，无需升级",
+                    "reason": "当前已经是6本，无法继续升级",
+                    "priority": "low"
+                }
+
+        else:
+            return {
+                "advice": "建议类型无效",
+                "reason": f"不支持的建议类型: {advice_type}",
+                "priority": "low"
+            }
+
+    def _buy_advice(self, candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """按三连、随从等级和再次刷到的概率选择购买目标"""
+        best = max(candidates, key=lambda c: (c["triple"], c["tier"], c["owned"], -c["seen_again"]))
+        if best["triple"]:
+            reason = f"场上已有2张{best['name']}，购买即可三连"
+        else:
+            reason = (f"这是商店中最高等级的随从（{best['tier']}星），"
+                      f"不买的话3次刷新内再看到它的概率为 {best['seen_again']:.0%}")
+        return {
+            "advice": f"建议购买 {best['name']}",
+            "reason": reason,
+            "priority": "high",
+            "candidates": candidates,
+        }
+
+    def _upgrade_advice(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """将升级曲线规划转换为建议"""
+        curve = " → ".join(str(tier) for tier in plan["curve"])
+        if plan["level_now"]:
+            advice = f"建议本回合升级到 {plan['plan'][0]['tier']} 本（费用 {plan['upgrade_cost']}）"
+        else:
+            upgrades = [action["turn"] for action in plan["plan"] if action["level"]]
+            advice = (f"本回合不升级，建议第 {upgrades[0]} 回合升级" if upgrades
+                      else "未来几回合保持当前等级，专注购买和刷新")
+        reason = f"未来{len(plan['curve'])}回合的酒馆等级：{curve}"
+        if plan.get("alternative") is not None:
+            reason += f"，场面价值 {plan['score']} 对比另一选择 {plan['alternative']}"
+        gain = plan["score"] - plan["alternative"] if plan.get("alternative") is not None else 0
+        return {
+            "advice": advice,
+            "reason": reason,
+            "priority": "high" if plan["level_now"] and gain >= 5 else "medium",
+            "plan": plan["plan"],
+        }
+
+    def _position_advice(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """将站位搜索结果转换为建议"""
+        if "error" in result:
+            return result
+        best, current = result["best"], result["current"]
+        if result.get("inconclusive"):
+            advice = "截止时间内未完成最终评估，暂时保持当前站位"
+            priority = "low"
+        elif best["positions"] == current["positions"] or best["win_delta"] <= 0:
+            advice = "当前站位已是模拟中的最佳站位"
+            priority = "low"
+        else:
+            advice = "建议站位：" + " → ".join(best["order"])
+            priority = "high" if best["win_delta"] >= 0.05 else "medium"
+        return {
+            "advice": advice,
+            "reason": (f"对{result['opponents']}个对手场面模拟，胜率 {current['win']:.1%} → {best['win']:.1%}"
+                       f"（{best['win_delta']:+.1%}），负率 {current['loss']:.1%} → {best['loss']:.1%}"),
+            "priority": priority,
+            "order": best["order"],
+            "win_delta": best["win_delta"],
+            "loss_delta": best["loss_delta"],
+            "alternatives": result["alternatives"],
+            "search": {key: result[key] for key in ("orderings", "rounds", "simulated_trials", "timed_out",
+                                                 "inconclusive", "elapsed_ms")},
+            "opponents": result.get("ghosts"),
+            "precomputed": result.get("precomputed", False),
+            "age_ms": result.get("age_ms"),
+        }
+
+    def _board_stats(self, game_state: Dict[str, Any]) -> Dict[str, Any]:
+        """场面聚合统计：用传入状态中的场面增量更新引擎持有的统计（不读取识别线程维护的最新统计）"""
+        with self._board_lock:
+            if self.board_analytics is None:
+                self.board_analytics = BoardAnalytics()
+            self.board_analytics.update(game_state.get("board", {}).get("minions", []))
+            return self.board_analytics.stats()
+
+    def board_analysis(self, game_state: Dict[str, Any]) -> Dict[str, Any]:
+        """分析场面的种族构成和强度"""
+        stats = self._board_stats(game_state)
+        if not stats["count"]:
+            return {
+                "current_composition": "空场",
+                "strength": "极弱",
+                "suggestions": ["尽快购买随从", "考虑升级酒馆"]
+            }
+
+        main_tribe = stats["main_tribe"]
+        golden_count = stats["golden"]
+
+        # 评估强度
+        if stats["count"] >= 7 and golden_count >= 3:
+            strength = "极强"
+        elif stats["count"] >= 5 and golden_count >= 1:
+            strength = "强"
+        elif stats["count"] >= 3:
+            strength = "中等"
+        else:
+            strength = "弱"
+
+        # 生成建议
+        suggestions = []
+        if stats["count"] < 7:
+            suggestions.append("继续购买随从填满场面")
+        if golden_count == 0:
+            suggestions.append("寻找机会制作金色随从")
+        if stats["pairs"]:
+            suggestions.append(f"场上有{stats['pairs']}对同名随从，留意三连机会")
+        if main_tribe != "neutral" and stats["main_tribe_count"] >= 3:
+            suggestions.append(f"继续强化{main_tribe}种族阵容")
+
+        return {
+            "current_composition": f"{main_tribe}种族阵容 ({stats['main_tribe_count']}个)",
+            "strength": strength,
+            "suggestions": suggestions,
+            "analytics": stats
+        }
+
+    def compute(self, kind: str, game_state: Dict[str, Any]) -> Dict[str, Any]:
+        """计算一类建议（"board" 为场面分析）"""
+        if kind == "board":
+            return self.board_analysis(game_state)
+        return self.game_advice(kind, game_state)
+
+
+class AdviceWorker:
+    """后台预先计算建议
+
+    识别线程每帧调用 ``submit``，只保留最新的待计算状态；每类建议只在它依赖的状态（商店、场面、
+    回合、金币等）变化时重新计算。计算过程中有更新的状态到达时放弃当前任务剩余的建议，转而计算新状态。
+    """
+
+    def __init__(self, engine: AdviceEngine, on_update: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.engine = engine
+        self.on_update = on_update
+        self.computed = 0
+        self.cancelled = 0
+        self.failures = 0
+        self._results: Dict[str, Tuple[Tuple, Dict[str, Any], float]] = {}
+        self._pending: Optional[Tuple[Dict[str, Any], Any]] = None
+        self._submitted: Dict[str, Tuple] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, game_state: Dict[str, Any], context: Any = None) -> bool:
+        """提交最新状态，``context`` 为站位建议额外依赖的版本（如对手场面缓存版本），返回是否产生了新任务"""
+        signatures = {kind: advice_signature(kind, game_state, context) for kind in ADVICE_KINDS}
+        with self._lock:
+            if signatures == self._submitted:
+                return False
+            self._submitted = signatures
+            self._pending = (game_state, context)
+        self._start()
+        self._wakeup.set()
+        return True
+
+    def _start(self):
+        """按需启动后台线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._worker, daemon=True, name="advice-worker")
+        self._thread.start()
+
+    def _worker(self):
+        """后台线程：按开销从小到大计算签名已变化的建议，有新状态时放弃剩余部分"""
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                job, self._pending = self._pending, None
+                self._wakeup.clear()
+            if job is None:
+                continue
+            game_state, context = job
+            for kind in ADVICE_KINDS:
+                if self._pending is not None:
+                    self.cancelled += 1
+                    break
+                signature = advice_signature(kind, game_state, context)
+                cached = self._results.get(kind)
+                if cached is not None and cached[0] == signature:
+                    continue
+                try:
+                    result = self.engine.compute(kind, game_state)
+                except Exception as e:
+                    self.failures += 1
+                    print(f"建议预计算失败（{kind}）: {e}")
+                    continue
+                self._results[kind] = (signature, result, time.monotonic())
+                self.computed += 1
+                if self.on_update is not None:
+                    self.on_update(self.snapshot())
+
+    def lookup(self, kind: str, game_state: Dict[str, Any], context: Any = None) -> Optional[Dict[str, Any]]:
+        """与当前状态一致的预计算建议，附带结果的已存在毫秒数；尚未算好或已过期时返回None"""
+        cached = self._results.get(kind)
+        if cached is None or cached[0] != advice_signature(kind, game_state, context):
+            return None
+        signature, result, computed_at = cached
+        result = dict(result)
+        result["speculative"] = True
+        result["age_ms"] = round((time.monotonic() - computed_at) * 1000, 1)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """最近一次算好的各类建议（不校验是否过期），用于推送给订阅advice主题的客户端"""
+        now = time.monotonic()
+        return {kind: dict(result, age_ms=round((now - computed_at) * 1000, 1))
+                for kind, (_, result, computed_at) in list(self._results.items())}
+
+    def stats(self) -> Dict[str, Any]:
+        """预计算统计"""
+        return {
+            "computed": self.computed,
+            "cancelled": self.cancelled,
+            "failures": self.failures,
+            "pending": self._pending is not None,
+            "ready": sorted(self._results),
+        }
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+离线批量识别工具
+将截图目录或录像文件分片交给多进程识别，按帧顺序输出JSONL
+
+用法:
+    python batch_recognize.py screenshots/ -o results.jsonl
+    python batch_recognize.py game.mp4 --stride 5 --workers 8
+    python batch_recognize.py screenshots/ --strategy pyramid --verify   # 与全分辨率匹配对比结果
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from recognition_engine import FRAME_SIZE, RecognitionEngine, fit_frame
+
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp"}
+
+# 每个工作进程持有一个识别引擎，避免每帧重复加载模板
+_engine: Optional[RecognitionEngine] = None
+# --verify 时用于对照的全分辨率匹配引擎
+_reference: Optional[RecognitionEngine] = None
+
+
+def _init_worker(strategy: str = "exhaustive", verify: bool = False):
+    """工作进程初始化：加载识别引擎"""
+    global _engine, _reference
+    # 进程间已经并行，限制OpenCV内部线程避免过度订阅
+    cv2.setNumThreads(1)
+    # 各帧相互独立，出现对手英雄即判定为战斗阶段，不要求连续多帧
+    _engine = RecognitionEngine(match_strategy=strategy, combat_frames=1)
+    if verify:
+        _reference = RecognitionEngine(match_strategy="exhaustive", combat_frames=1)
+
+
+def _recognized_names(game_state) -> Dict[str, Any]:
+    """对比两种策略时关心的识别结果：英雄、商店、场面和对手"""
+    state = game_state.to_dict()
+
+    def names(minions):
+        return [(m["position"], m["name"]) for m in minions]
+
+    opponent = state["opponent"] or {}
+    return {
+        "hero": state["hero"]["name"],
+        "phase": state["phase"],
+        "shop": names(state["shop"]["minions"]),
+        "board": names(state["board"]["minions"]),
+        "opponent": [opponent.get("hero"), names(opponent.get("minions", []))],
+    }
+
+
+def _recognize(frame, source: str, index: int, frame_no: Optional[int] = None) -> Dict[str, Any]:
+    """识别单帧并生成一条输出记录
+
+    其他分辨率的帧先缩放到ROI布局的1920x1080（记录原尺寸）；单帧识别失败时输出带 ``error`` 的记录，
+    不影响同一任务中的其余帧。
+    """
+    record: Dict[str, Any] = {"index": index, "source": source}
+    if frame_no is not None:
+        record["frame"] = frame_no
+    try:
+        size = [int(frame.shape[1]), int(frame.shape[0])]
+        frame = fit_frame(frame)
+        if tuple(size) != FRAME_SIZE:
+            record["resized_from"] = size
+        start = time.perf_counter()
+        game_state = _engine.recognize_frame(frame)
+        record["game_state"] = game_state.to_dict()
+        record["recognize_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        if _reference is not None:
+            record["verify"] = _verify(frame, game_state)
+    except Exception as e:
+        record.pop("game_state", None)
+        record.pop("verify", None)
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def _verify(frame, game_state) -> Dict[str, Any]:
+    """用全分辨率匹配识别同一帧并对比结果"""
+    start = time.perf_counter()
+    expected = _recognized_names(_reference.recognize_frame(frame))
+    actual = _recognized_names(game_state)
+    return {
+        "match": expected == actual,
+        "mismatched": [field for field in expected if expected[field] != actual[field]],
+        "reference_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def _process_images(chunk: List[Tuple[int, str]]) -> List[Dict[str, Any]]:
+    """识别一组截图文件（在工作进程中运行）"""
+    records = []
+    for index, path in chunk:
+        frame = cv2.imread(path)
+        if frame is None:
+            records.append({"index": index, "source": path, "error": "无法读取图像"})
+            continue
+        records.append(_recognize(frame, path, index))
+    return records
+
+
+def _process_video(task: Tuple[str, int, int, int, int]) -> List[Dict[str, Any]]:
+    """识别录像中的一段连续帧（在工作进程中运行）
+
+    每个工作进程自行打开录像并定位，只在进程间传递帧号而不是像素数据。
+    """
+    path, first_index, start_frame, count, stride = task
+    capture = cv2.VideoCapture(path)
+    capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    records = []
+    try:
+        for i in range(count):
+            frame_no = start_frame + i * stride
+            ok = capture.grab()
+            if not ok:
+                break
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            records.append(_recognize(frame, path, first_index + i, frame_no))
+            # 跳过步长内的其余帧（grab不解码，开销很小）
+            for _ in range(stride - 1):
+                if not capture.grab():
+                    break
+    finally:
+        capture.release()
+    return records
+
+
+def image_tasks(directory: Path, chunk_size: int) -> Iterator[List[Tuple[int, str]]]:
+    """按文件名顺序将截图目录切分为任务"""
+    files = sorted(p for p in directory.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    for start in range(0, len(files), chunk_size):
+        yield [(start + i, str(p)) for i, p in enumerate(files[start:start + chunk_size])]
+
+
+def video_tasks(path: Path, chunk_size: int, stride: int) -> Iterator[Tuple[str, int, int, int, int]]:
+    """将录像按帧区间切分为任务"""
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise ValueError(f"无法打开录像: {path}")
+    total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+
+    sampled = (total_frames + stride - 1) // stride
+    for first_index in range(0, sampled, chunk_size):
+        count = min(chunk_size, sampled - first_index)
+        yield (str(path), first_index, first_index * stride, count, stride)
+
+
+def run(input_path: Path, output, workers: int, chunk_size: int, stride: int,
+        strategy: str = "exhaustive", verify: bool = False) -> Dict[str, Any]:
+    """执行批量识别，按顺序流式写出结果"""
+    if input_path.is_dir():
+        tasks, func = image_tasks(input_path, chunk_size), _process_images
+    else:
+        tasks, func = video_tasks(input_path, chunk_size, stride), _process_video
+
+    frames = 0
+    errors = 0
+    mismatches = 0
+    started = time.perf_counter()
+    last_report = started
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(strategy, verify)) as executor:
+        # 有界的在途任务窗口：按提交顺序取回结果，保证输出有序且内存占用稳定
+        pending = deque()
+        max_pending = workers * 2
+
+        def drain_one():
+            nonlocal frames, errors, mismatches, last_report
+            for record in pending.popleft().result():
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                frames += 1
+                errors += "error" in record
+                mismatches += not record.get("verify", {}).get("match", True)
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                print(f"已处理 {frames} 帧，{frames / (now - started):.1f} 帧/秒", file=sys.stderr)
+                last_report = now
+
+        for task in tasks:
+            pending.append(executor.submit(func, task))
+            if len(pending) >= max_pending:
+                drain_one()
+        while pending:
+            drain_one()
+
+    output.flush()
+    elapsed = time.perf_counter() - started
+    summary = {
+        "frames": frames,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "workers": workers,
+        "strategy": strategy,
+    }
+    if verify:
+        summary["mismatches"] = mismatches
+    return summary
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量识别截图目录或录像，输出JSONL")
+    parser.add_argument("input", type=Path, help="截图目录或录像文件")
+    parser.add_argument("-o", "--output", type=Path, help="输出JSONL文件（默认标准输出）")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 4, help="工作进程数")
+    parser.add_argument("--chunk-size", type=int, default=16, help="每个任务包含的帧数")
+    parser.add_argument("--stride", type=int, default=1, help="录像采样步长（每N帧识别一帧）")
+    parser.add_argument("--strategy", choices=RecognitionEngine.MATCH_STRATEGIES, default="exhaustive",
+                        help="模板匹配策略（默认全分辨率匹配）")
+    parser.add_argument("--verify", action="store_true",
+                        help="同时用全分辨率匹配识别每帧并报告结果不一致的帧")
+    args = parser.parse_args()
+
+    if not args.input.exists():
+        parser.error(f"输入不存在: {args.input}")
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        summary = run(args.input, output, args.workers, args.chunk_size, max(1, args.stride),
+                      args.strategy, args.verify)
+    finally:
+        if args.output:
+            output.close()
+
+    print(f"完成: {summary['frames']} 帧（失败 {summary['errors']}），"
+          f"耗时 {summary['seconds']} 秒，{summary['fps']} 帧/秒，{summary['workers']} 个进程",
+          file=sys.stderr)
+    if args.verify:
+        print(f"与全分辨率匹配结果不一致: {summary['mismatches']} 帧", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
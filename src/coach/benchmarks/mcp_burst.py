@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+MCP工具调用延迟基准
+启动MCP服务器子进程，一次性发出一批tools/call请求，统计每个请求的响应延迟
+
+用法:
+    python benchmarks/mcp_burst.py --count 200
+    python benchmarks/mcp_burst.py --server simple_mcp_server.py --batch
+    python benchmarks/mcp_burst.py --tool get_game_advice --arguments '{"advice_type": "buy"}'
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+COACH_DIR = Path(__file__).resolve().parent.parent
+
+
+def percentile(values: List[float], p: float) -> float:
+    """计算百分位数（最近秩）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_burst(server: Path, count: int, tool: str, arguments: Dict[str, Any],
+              batch: bool, server_args: List[str]) -> Dict[str, Any]:
+    """向服务器发送一批请求并统计延迟"""
+    process = subprocess.Popen(
+        [sys.executable, str(server), *server_args],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        text=True, encoding="utf-8", bufsize=1, cwd=str(COACH_DIR.parent.parent),
+    )
+
+    sent_at: Dict[int, float] = {}
+    latencies: Dict[int, float] = {}
+    done = threading.Event()
+
+    def reader():
+        for line in process.stdout:
+            received = time.perf_counter()
+            message = json.loads(line)
+            for response in (message if isinstance(message, list) else [message]):
+                request_id = response.get("id")
+                if request_id in sent_at:
+                    latencies[request_id] = (received - sent_at[request_id]) * 1000
+            if len(latencies) >= count:
+                done.set()
+                return
+
+    threading.Thread(target=reader, daemon=True).start()
+
+    # 预热：确认服务器已就绪
+    warmup = {"jsonrpc": "2.0", "id": -1, "method": "tools/list"}
+    sent_at[-1] = time.perf_counter()
+    process.stdin.write(json.dumps(warmup) + "\n")
+    process.stdin.flush()
+    while -1 not in latencies:
+        time.sleep(0.01)
+    del sent_at[-1], latencies[-1]
+
+    requests = [
+        {"jsonrpc": "2.0", "id": i, "method": "tools/call", "params": {"name": tool, "arguments": arguments}}
+        for i in range(count)
+    ]
+    started = time.perf_counter()
+    if batch:
+        for request in requests:
+            sent_at[request["id"]] = started
+        process.stdin.write(json.dumps(requests) + "\n")
+    else:
+        for request in requests:
+            sent_at[request["id"]] = time.perf_counter()
+            process.stdin.write(json.dumps(request) + "\n")
+    process.stdin.flush()
+
+    completed = done.wait(timeout=120)
+    elapsed = time.perf_counter() - started
+    process.stdin.close()
+    process.terminate()
+
+    values = list(latencies.values())
+    return {
+        "server": server.name,
+        "server_args": server_args,
+        "tool": tool,
+        "requests": count,
+        "completed": len(values),
+        "timed_out": not completed,
+        "batch": batch,
+        "total_ms": round(elapsed * 1000, 2),
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(max(values), 3) if values else 0.0,
+        },
+    }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="MCP工具调用突发延迟基准")
+    parser.add_argument("--server", default="mcp_server.py", help="MCP服务器脚本（相对src/coach）")
+    parser.add_argument("--server-arg", action="append", default=[], help="传给服务器的额外参数")
+    parser.add_argument("--count", type=int, default=200, help="请求数量")
+    parser.add_argument("--tool", default="get_game_state", help="调用的工具")
+    parser.add_argument("--arguments", default="{}", help="工具参数（JSON）")
+    parser.add_argument("--batch", action="store_true", help="以单个JSON-RPC批量请求发送")
+    args = parser.parse_args()
+
+    result = run_burst(COACH_DIR / args.server, args.count, args.tool,
+                       json.loads(args.arguments), args.batch, args.server_arg)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+识别基准
+在固定的带标注帧集上运行 RecognitionEngine.recognize_frame，按匹配策略统计各阶段耗时分位数、
+每秒帧数、峰值内存和商店/场面/英雄的top-1准确率，并与JSON基线比较，速度或准确率退化时以状态码1退出。
+每个策略在独立的子进程中运行，峰值内存只反映该策略（含帧集本身），不受之前运行的策略影响。
+基线不存在时以状态码2退出，需先用 --write-baseline 记录（基线与机器有关，不纳入版本库）。
+
+不需要图形界面，可在无显示器的Linux上运行。未指定 --corpus 时按随机种子用 frame_generator 在内存中
+合成1920x1080的帧（尺度抖动、金色色调、空位置、模糊、JPEG压缩和战斗阶段均按默认比例抽样）。
+
+用法:
+    python benchmarks/recognition_bench.py --frames 4
+    python benchmarks/recognition_bench.py --strategies pyramid,exhaustive --frames 2
+    python benchmarks/recognition_bench.py --corpus corpus_dir --write-baseline
+
+--corpus 目录由 frame_generator.py 生成，或自行提供同样格式的 labels.json:
+    {"frames": [{"file": "0000.png", "shop": [{"position": 0, "name": "<模板名>"}],
+                 "board": [...], "hero": "<模板名>", "opponent": {"hero": "<模板名>", "minions": [...]}}]}
+模板名为 static/media 下去掉扩展名的文件名，空位置不列出，没有英雄或对手时为null。
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+COACH_DIR = Path(__file__).resolve().parent.parent
+REPO_DIR = COACH_DIR.parent.parent
+sys.path.insert(0, str(COACH_DIR))
+
+from frame_generator import BASE_SIZE, FrameGenerator, GeneratorConfig  # noqa: E402
+from metrics import MetricsRegistry  # noqa: E402
+from recognition_engine import RecognitionEngine  # noqa: E402
+
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "recognition_baseline.json"
+SECTIONS = ("shop", "board", "opponent_board")
+HEROES = ("hero", "opponent_hero")
+
+
+def percentile(values: List[float], p: float) -> float:
+    """计算百分位数（最近秩）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存（MB），Linux上ru_maxrss以KB为单位；只在运行单个策略的子进程中有意义"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def compose_corpus(count: int, seed: int) -> List[Tuple[np.ndarray, Dict[str, Any]]]:
+    """按随机种子合成带标注的帧"""
+    generator = FrameGenerator(GeneratorConfig(seed=seed))
+    return [generator.generate(index) for index in range(count)]
+
+
+def load_corpus(directory: Path) -> List[Tuple[np.ndarray, Dict[str, Any]]]:
+    """读取目录中的帧和 labels.json，识别引擎的ROI基于1920x1080，其他分辨率的帧先缩放"""
+    with open(directory / "labels.json", "r", encoding="utf-8") as f:
+        entries = json.load(f)["frames"]
+    corpus = []
+    for labels in entries:
+        frame = cv2.imread(str(directory / labels["file"]))
+        if frame is None:
+            raise ValueError(f"无法读取帧: {labels['file']}")
+        if frame.shape[1::-1] != BASE_SIZE:
+            frame = cv2.resize(frame, BASE_SIZE, interpolation=cv2.INTER_LINEAR)
+        corpus.append((frame, labels))
+    return corpus
+
+
+def _sections(state=None, labels: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """识别结果或标注中各区域的随从列表和英雄名，对手相关项不存在时为空"""
+    if state is not None:
+        opponent = state.opponent or {}
+        return {"shop": state.shop["minions"], "board": state.board["minions"],
+                "opponent_board": opponent.get("minions", []), "hero": state.hero.name,
+                "opponent_hero": opponent.get("hero")}
+    opponent = labels.get("opponent") or {}
+    return {"shop": labels.get("shop", []), "board": labels.get("board", []),
+            "opponent_board": opponent.get("minions", []), "hero": labels.get("hero"),
+            "opponent_hero": opponent.get("hero")}
+
+
+class Accuracy:
+    """按区域累计的top-1准确率：标注位置识别正确的比例，以及空位置被误识别的次数"""
+
+    def __init__(self):
+        self.correct = {section: 0 for section in SECTIONS + HEROES}
+        self.total = {section: 0 for section in SECTIONS + HEROES}
+        self.false_positives = {section: 0 for section in SECTIONS + HEROES}
+
+    def add(self, state, labels: Dict[str, Any]):
+        """累计一帧的识别结果"""
+        actual, truth = _sections(state=state), _sections(labels=labels)
+        for section in SECTIONS:
+            predicted = {m["position"]: m["name"] for m in actual[section]}
+            expected = {item["position"]: item["name"] for item in truth[section]}
+            self.total[section] += len(expected)
+            self.correct[section] += sum(predicted.get(p) == name for p, name in expected.items())
+            self.false_positives[section] += sum(p not in expected for p in predicted)
+        for section in HEROES:
+            if truth[section]:
+                self.total[section] += 1
+                self.correct[section] += actual[section] == truth[section]
+            elif actual[section] not in (None, "Unknown"):
+                self.false_positives[section] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """各区域的准确率（没有标注时为None）和误识别次数"""
+        result = {section: round(self.correct[section] / self.total[section], 4) if self.total[section] else None
+                  for section in self.total}
+        result["labelled"] = dict(self.total)
+        result["false_positives"] = dict(self.false_positives)
+        return result
+
+
+def run_strategy(strategy: str, corpus: List[Tuple[np.ndarray, Dict[str, Any]]],
+                 warmup: int) -> Dict[str, Any]:
+    """用一种匹配策略识别整个帧集"""
+    # 合成帧相互独立，不要求连续多帧出现对手英雄
+    engine = RecognitionEngine(strategy, combat_frames=1)
+    for frame, _ in corpus[:warmup]:
+        # 预热缩放模板缓存，不计入统计
+        engine.recognize_frame(frame)
+    engine.metrics = MetricsRegistry()
+
+    accuracy = Accuracy()
+    latencies = []
+    started = time.perf_counter()
+    for frame, labels in corpus:
+        frame_started = time.perf_counter()
+        state = engine.recognize_frame(frame)
+        latencies.append((time.perf_counter() - frame_started) * 1000)
+        accuracy.add(state, labels)
+    elapsed = time.perf_counter() - started
+
+    _, match_sum, frames = engine.metrics.matches_per_frame.cumulative()
+    return {
+        "frames": len(corpus),
+        "total_s": round(elapsed, 3),
+        "fps": round(len(corpus) / elapsed, 4) if elapsed > 0 else 0.0,
+        "frame_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "max": round(max(latencies), 2) if latencies else 0.0,
+        },
+        "stages": engine.metrics.stage_summary(),
+        "template_matches_per_frame": round(match_sum / frames, 1) if frames else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "accuracy": accuracy.summary(),
+    }
+
+
+def measure(strategy: str, corpus_dir: Optional[str], frames: int, seed: int, warmup: int) -> Dict[str, Any]:
+    """在子进程中准备帧集并运行一种策略（子进程以spawn方式启动，峰值内存从零开始计）"""
+    # 模板和卡牌数据按仓库根目录的相对路径加载
+    os.chdir(REPO_DIR)
+    corpus = load_corpus(Path(corpus_dir)) if corpus_dir else compose_corpus(frames, seed)
+    return run_strategy(strategy, corpus, warmup)
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], speed_tolerance: float,
+            accuracy_tolerance: float) -> List[str]:
+    """与基线比较，返回退化项说明；帧集不同时无法比较"""
+    if baseline.get("corpus") != results["corpus"]:
+        return [f"帧集与基线不同（基线 {baseline.get('corpus')}），请用 --write-baseline 重新记录"]
+    regressions = []
+    for strategy, current in results["strategies"].items():
+        previous = baseline.get("strategies", {}).get(strategy)
+        if previous is None:
+            print(f"基线中没有策略 {strategy}，跳过比较")
+            continue
+        if current["fps"] < previous["fps"] * (1 - speed_tolerance):
+            regressions.append(f"{strategy}: 每秒帧数 {current['fps']} < 基线 {previous['fps']}")
+        if current["frame_ms"]["p95"] > previous["frame_ms"]["p95"] * (1 + speed_tolerance):
+            regressions.append(f"{strategy}: 单帧p95 {current['frame_ms']['p95']}ms > 基线 {previous['frame_ms']['p95']}ms")
+        if current["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + speed_tolerance):
+            regressions.append(f"{strategy}: 峰值内存 {current['peak_rss_mb']}MB > 基线 {previous['peak_rss_mb']}MB")
+        for section in SECTIONS + HEROES:
+            now, before = current["accuracy"][section], previous["accuracy"].get(section)
+            if before is not None and (now is None or now < before - accuracy_tolerance):
+                regressions.append(f"{strategy}: {section}准确率 {now} < 基线 {before}")
+    return regressions
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="识别延迟与准确率基准")
+    parser.add_argument("--corpus", help="带 labels.json 的帧目录，默认按种子合成")
+    parser.add_argument("--frames", type=int, default=4, help="合成的帧数")
+    parser.add_argument("--seed", type=int, default=0, help="合成帧的随机种子")
+    parser.add_argument("--strategies", default="pyramid", help="逗号分隔的匹配策略")
+    parser.add_argument("--warmup", type=int, default=1, help="预热帧数（不计入统计）")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="基线JSON文件")
+    parser.add_argument("--write-baseline", "--update-baseline", dest="write_baseline", action="store_true",
+                        help="用本次结果写入（覆盖）基线；基线不存在时必须指定")
+    parser.add_argument("--speed-tolerance", type=float, default=0.25, help="速度和内存允许的相对退化")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.02, help="准确率允许的绝对下降")
+    parser.add_argument("--output", help="另存本次结果的JSON文件")
+    args = parser.parse_args()
+
+    strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    for strategy in strategies:
+        if strategy not in RecognitionEngine.MATCH_STRATEGIES:
+            parser.error(f"未知的匹配策略: {strategy}")
+
+    baseline_path = Path(args.baseline)
+    if not args.write_baseline and not baseline_path.exists():
+        print(f"基线不存在: {baseline_path}，请先用 --write-baseline 记录", file=sys.stderr)
+        sys.exit(2)
+
+    corpus_dir = str(Path(args.corpus).resolve()) if args.corpus else None
+    if corpus_dir:
+        with open(Path(corpus_dir) / "labels.json", "r", encoding="utf-8") as f:
+            frames = len(json.load(f)["frames"])
+        corpus_info: Dict[str, Any] = {"source": Path(args.corpus).name, "frames": frames}
+    else:
+        frames = args.frames
+        corpus_info = {"source": "synthetic", "seed": args.seed, "frames": frames,
+                       "generator": json.loads(json.dumps(asdict(GeneratorConfig(seed=args.seed))))}
+
+    results: Dict[str, Any] = {"corpus": corpus_info, "strategies": {}}
+    context = multiprocessing.get_context("spawn")
+    for strategy in strategies:
+        print(f"运行策略 {strategy}（{frames} 帧）...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results["strategies"][strategy] = executor.submit(
+                measure, strategy, corpus_dir, args.frames, args.seed, args.warmup).result()
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.write_baseline:
+        baseline_path.write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"已记录基线: {baseline_path}", file=sys.stderr)
+        return
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.speed_tolerance, args.accuracy_tolerance)
+    if regressions:
+        for line in regressions:
+            print(f"退化: {line}", file=sys.stderr)
+        sys.exit(1)
+    print("未发现退化", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+场面增量统计
+按状态差异增量维护我方场面的种族、关键字、金色随从和属性总和，查询时直接读取聚合结果
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from card_database import ALL_TRIBES_MASK, KEYWORDS, TRIBE_BITS, CardDatabase, get_card_database
+
+
+MAX_SLOTS = 7
+
+KEYWORD_NAMES = list(KEYWORDS.values())
+KEYWORD_INDEX = {name: i for i, name in enumerate(KEYWORD_NAMES)}
+TRIBE_NAMES = list(TRIBE_BITS)
+
+# 一个场面位置的内容：（随从编号, 攻击, 生命, 金色, 关键字位掩码）
+SlotEntry = Tuple[int, int, int, bool, int]
+
+
+class BoardAnalytics:
+    """我方场面的增量聚合统计
+
+    ``update`` 逐个位置比较新旧场面，只对新增、移除或属性变化的位置做加减，
+    站位调整（同一批随从换位置）不改变聚合结果。种族来自卡牌数据库，全部类型的随从计入每个种族。
+    """
+
+    def __init__(self, card_db: Optional[CardDatabase] = None):
+        self.card_db = card_db or get_card_database()
+        self._keyword_masks = [sum(1 << KEYWORD_INDEX[k] for k in keywords) for keywords in self.card_db.keywords]
+        self.clear()
+
+    def clear(self):
+        """清空场面（新的一局开始时）"""
+        self.slots: List[Optional[SlotEntry]] = [None] * MAX_SLOTS
+        self.tribe_counts = np.zeros(len(TRIBE_NAMES), dtype=np.int32)
+        self.keyword_counts = np.zeros(len(KEYWORD_NAMES), dtype=np.int32)
+        self.card_counts: Dict[int, int] = {}
+        self.count = 0
+        self.golden = 0
+        self.amalgams = 0
+        self.neutral = 0
+        self.attack = 0
+        self.health = 0
+        self.pairs = 0
+        self.version = 0
+        self._stats: Optional[Dict[str, Any]] = None
+
+    def _entry(self, minion: Dict[str, Any]) -> SlotEntry:
+        """把识别到的随从转换为位置内容，属性缺失（None）时使用卡牌数据，识别到的0保留"""
+        index = self.card_db.minion_index(minion.get("name", ""))
+        attack = minion.get("attack")
+        if attack is None:
+            attack = self.card_db.attack[index]
+        health = minion.get("health")
+        if health is None:
+            health = self.card_db.health[index]
+        keywords = self._keyword_masks[index]
+        for flag in ("divine_shield", "reborn"):
+            if minion.get(flag):
+                keywords |= 1 << KEYWORD_INDEX[flag]
+        return index, int(attack), int(health), bool(minion.get("golden")), keywords
+
+    def _apply(self, entry: SlotEntry, sign: int):
+        """把一个位置的内容加入（sign=1）或移出（sign=-1）聚合结果"""
+        index, attack, health, golden, keywords = entry
+        self.count += sign
+        self.attack += sign * attack
+        self.health += sign * health
+        self.golden += sign * golden
+        tribes = int(self.card_db.tribes[index])
+        if tribes == ALL_TRIBES_MASK:
+            self.amalgams += sign
+            self.tribe_counts += sign
+        elif tribes:
+            for bit in range(len(TRIBE_NAMES)):
+                if tribes & (1 << bit):
+                    self.tribe_counts[bit] += sign
+        else:
+            self.neutral += sign
+        while keywords:
+            bit = keywords & -keywords
+            self.keyword_counts[bit.bit_length() - 1] += sign
+            keywords ^= bit
+        # 非金色的同名随从计数，凑齐2张即为一对（差1张三连）
+        if index and not golden:
+            before = self.card_counts.get(index, 0)
+            after = before + sign
+            self.card_counts[index] = after
+            self.pairs += (after == 2) - (before == 2)
+
+    def update(self, minions: List[Dict[str, Any]]) -> Dict[str, int]:
+        """按新的场面更新聚合结果，返回新增、移除和变化的位置数"""
+        entries: List[Optional[SlotEntry]] = [None] * MAX_SLOTS
+        for i, minion in enumerate(minions[:MAX_SLOTS]):
+            slot = minion.get("position", i)
+            if not isinstance(slot, int) or not 0 <= slot < MAX_SLOTS or entries[slot] is not None:
+                slot = i
+            entries[slot] = self._entry(minion)
+        delta = {"added": 0, "removed": 0, "changed": 0}
+        for slot, (old, new) in enumerate(zip(self.slots, entries)):
+            if old == new:
+                continue
+            if old is not None:
+                self._apply(old, -1)
+            if new is not None:
+                self._apply(new, 1)
+            delta["added" if old is None else "removed" if new is None else "changed"] += 1
+        if any(delta.values()):
+            self.slots = entries
+            self.version += 1
+            self._stats = None
+        return delta
+
+    def stats(self) -> Dict[str, Any]:
+        """聚合结果（按版本缓存，场面不变时重复查询直接返回）"""
+        if self._stats is None:
+            tribes = {name: int(n) for name, n in zip(TRIBE_NAMES, self.tribe_counts) if n}
+            main_tribe = max(tribes, key=tribes.get) if tribes else "neutral"
+            self._stats = {
+                "count": self.count,
+                "golden": self.golden,
+                "attack": self.attack,
+                "health": self.health,
+                "tribes": tribes,
+                "main_tribe": main_tribe,
+                "main_tribe_count": tribes.get(main_tribe, self.neutral),
+                "amalgams": self.amalgams,
+                "neutral": self.neutral,
+                "keywords": {name: int(n) for name, n in zip(KEYWORD_NAMES, self.keyword_counts) if n},
+                "pairs": self.pairs,
+                "version": self.version,
+            }
+        return dict(self._stats)
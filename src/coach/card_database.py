@@ -0,0 +1,185 @@
+"""
+卡牌数据库
+加载data/bgs中的随从和英雄数据，提供名称解析和按编号索引的紧凑属性数组
+"""
+
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# 仓库根目录：相对的数据目录按它解析，与启动服务时的工作目录无关
+REPO_DIR = Path(__file__).resolve().parent.parent.parent
+
+# 随从类型（minionTypeId）
+TRIBES = {
+    11: "undead",
+    14: "murloc",
+    15: "demon",
+    17: "mech",
+    18: "elemental",
+    20: "beast",
+    23: "pirate",
+    24: "dragon",
+    26: "all",
+    43: "quilboar",
+    92: "naga",
+}
+
+# 种族位掩码中的位序号，"all"（全部类型）视为拥有所有种族
+TRIBE_BITS = {name: bit for bit, name in enumerate(
+    ["undead", "murloc", "demon", "mech", "elemental", "beast", "pirate", "dragon", "quilboar", "naga"])}
+ALL_TRIBES_MASK = (1 << len(TRIBE_BITS)) - 1
+
+# 关键字（keywordIds）
+KEYWORDS = {
+    1: "taunt",
+    3: "divine_shield",
+    6: "stealth",
+    8: "battlecry",
+    11: "windfury",
+    12: "deathrattle",
+    21: "discover",
+    32: "poisonous",
+    66: "magnetic",
+    78: "reborn",
+    109: "blood_gem",
+    196: "refresh",
+    198: "avenge",
+    234: "spellcraft",
+    261: "venomous",
+    300: "pass",
+    360: "rally",
+    379: "bounty",
+}
+
+# 模板文件名形如 "101130_101130-capn-hoggarr" 或带 "_gold" 后缀
+_TEMPLATE_STEM = re.compile(r"^(\d+)_")
+
+
+def tribe_mask(card: Dict) -> int:
+    """计算卡牌的种族位掩码"""
+    mask = 0
+    for type_id in [card.get("minionTypeId")] + list(card.get("multiTypeIds") or []):
+        tribe = TRIBES.get(type_id)
+        if tribe == "all":
+            return ALL_TRIBES_MASK
+        if tribe:
+            mask |= 1 << TRIBE_BITS[tribe]
+    return mask
+
+
+def tribes_from_mask(mask: int) -> List[str]:
+    """将种族位掩码还原为种族名称列表"""
+    if mask == ALL_TRIBES_MASK:
+        return ["all"]
+    return [name for name, bit in TRIBE_BITS.items() if mask & (1 << bit)]
+
+
+class CardDatabase:
+    """卡牌数据库
+
+    随从按加载顺序分配从1开始的紧凑编号（0表示未知/空位），
+    攻击、生命、等级、种族等属性保存在按编号索引的数组中。
+    相对路径的 ``data_dir`` 按仓库根目录解析。
+    """
+
+    def __init__(self, data_dir: str = "data/bgs"):
+        self.data_dir = Path(data_dir)
+        if not self.data_dir.is_absolute():
+            self.data_dir = REPO_DIR / self.data_dir
+        self.minions: List[Dict] = self._load("minions.json")
+        self.heroes: List[Dict] = self._load("heroes.json")
+
+        count = len(self.minions) + 1
+        self.card_ids = np.zeros(count, dtype=np.int32)
+        self.attack = np.zeros(count, dtype=np.int16)
+        self.health = np.zeros(count, dtype=np.int16)
+        self.tier = np.zeros(count, dtype=np.int8)
+        self.tribes = np.zeros(count, dtype=np.uint16)
+        self.keywords: List[List[str]] = [[]]
+
+        self._minion_lookup: Dict[str, int] = {}
+        for index, card in enumerate(self.minions, start=1):
+            self.card_ids[index] = card["id"]
+            self.attack[index] = card.get("attack", 0)
+            self.health[index] = card.get("health", 0)
+            self.tier[index] = (card.get("battlegrounds") or {}).get("tier", 0)
+            self.tribes[index] = tribe_mask(card)
+            self.keywords.append([KEYWORDS[k] for k in card.get("keywordIds") or [] if k in KEYWORDS])
+            self._register(self._minion_lookup, card, index)
+
+        self._hero_lookup: Dict[str, int] = {}
+        for index, hero in enumerate(self.heroes, start=1):
+            self._register(self._hero_lookup, hero, index)
+
+    def _load(self, filename: str) -> List[Dict]:
+        """加载JSON数据文件，不存在时给出警告并返回空列表（刷新概率、升级规划等结果将没有意义）"""
+        try:
+            with open(self.data_dir / filename, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            print(f"警告: 没有找到卡牌数据 {self.data_dir / filename}，卡池为空")
+            return []
+
+    @staticmethod
+    def _register(lookup: Dict[str, int], card: Dict, index: int):
+        """登记卡牌的各种可识别名称"""
+        for key in (str(card["id"]), card.get("slug", ""), card.get("name", "")):
+            if key:
+                lookup.setdefault(key.lower(), index)
+
+    @staticmethod
+    def _lookup(lookup: Dict[str, int], name: str) -> int:
+        """按卡牌ID、slug、名称或模板文件名查找编号"""
+        if not name:
+            return 0
+        key = name.lower()
+        if key.endswith("_gold"):
+            key = key[:-5]
+        index = lookup.get(key)
+        if index is None:
+            match = _TEMPLATE_STEM.match(key)
+            if match:
+                index = lookup.get(match.group(1))
+        return index or 0
+
+    def minion_index(self, name: str) -> int:
+        """随从名称对应的编号，未知时返回0"""
+        return self._lookup(self._minion_lookup, name)
+
+    def hero_index(self, name: str) -> int:
+        """英雄名称对应的编号，未知时返回0"""
+        return self._lookup(self._hero_lookup, name)
+
+    def get_minion(self, name: str) -> Optional[Dict]:
+        """获取随从的原始数据"""
+        index = self.minion_index(name)
+        return self.minions[index - 1] if index else None
+
+    def get_hero(self, name: str) -> Optional[Dict]:
+        """获取英雄的原始数据"""
+        index = self.hero_index(name)
+        return self.heroes[index - 1] if index else None
+
+    def minion_name(self, index: int) -> str:
+        """编号对应的随从名称"""
+        return self.minions[index - 1]["name"] if 0 < index <= len(self.minions) else ""
+
+    def hero_name(self, index: int) -> str:
+        """编号对应的英雄名称"""
+        return self.heroes[index - 1]["name"] if 0 < index <= len(self.heroes) else ""
+
+    def tribes_of(self, name: str) -> List[str]:
+        """随从的种族列表（中立随从返回空列表）"""
+        return tribes_from_mask(int(self.tribes[self.minion_index(name)]))
+
+
+@lru_cache(maxsize=None)
+def get_card_database(data_dir: str = "data/bgs") -> CardDatabase:
+    """获取共享的卡牌数据库实例"""
+    return CardDatabase(data_dir)
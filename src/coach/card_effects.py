@@ -0,0 +1,384 @@
+"""
+卡牌效果编译器
+把data/bgs/minions.json中每张随从的关键字（keywordIds）、文本效果（亡语召唤、复仇、战斗开始时、进击）
+和金色版本（battlegrounds.upgradeId）编译为紧凑的整数操作码表，模拟器和分析器按编号查表分派，
+运行时不再解析卡牌文本；无法编译的效果逐条记录，用于统计覆盖率
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from card_database import KEYWORDS, TRIBE_BITS, CardDatabase, get_card_database
+
+
+# 关键字位（keywordIds对应的关键字，另加文本中的顺劈）
+FLAGS = {name: 1 << bit for bit, name in enumerate(list(KEYWORDS.values()) + ["cleave"])}
+
+# 触发时机
+TRIGGER_DEATHRATTLE = 1
+TRIGGER_AVENGE = 2
+TRIGGER_START_OF_COMBAT = 3
+TRIGGER_RALLY = 4
+TRIGGERS = {
+    TRIGGER_DEATHRATTLE: "deathrattle",
+    TRIGGER_AVENGE: "avenge",
+    TRIGGER_START_OF_COMBAT: "start_of_combat",
+    TRIGGER_RALLY: "rally",
+}
+
+# 操作码及其参数（每条效果固定4个参数）
+OP_SUMMON = 1               # 召唤：数量, 攻击力, 生命值, 关键字位
+OP_SUMMON_BY_ATTACK = 2     # 召唤数量等同于本随从攻击力：-, 攻击力, 生命值, 关键字位
+OP_DAMAGE_ALL = 3           # 对所有随从造成伤害：伤害, 排除的种族位（-1表示不排除）
+OP_BUFF = 4                 # 获得属性值：目标, 攻击力, 生命值, 关键字位；目标种族位见 ``EffectTables.tribes``
+OP_DOUBLE_STATS = 5         # 本随从的属性值翻倍
+OP_GAIN_TIER_STATS = 6      # 获得等同于当前酒馆等级的属性值
+OP_DESTROY_KILLER = 7       # 消灭击杀本随从的随从
+OPCODES = {
+    OP_SUMMON: "summon",
+    OP_SUMMON_BY_ATTACK: "summon_by_attack",
+    OP_DAMAGE_ALL: "damage_all",
+    OP_BUFF: "buff",
+    OP_DOUBLE_STATS: "double_stats",
+    OP_GAIN_TIER_STATS: "gain_tier_stats",
+    OP_DESTROY_KILLER: "destroy_killer",
+}
+
+# 模拟器目前执行的操作码
+SIMULATED = {(TRIGGER_DEATHRATTLE, OP_SUMMON), (TRIGGER_DEATHRATTLE, OP_SUMMON_BY_ATTACK)}
+
+# 金色随从各参数的倍数（按操作码查表）
+GOLDEN_SCALE = np.ones((len(OPCODES) + 1, 4), dtype=np.int16)
+GOLDEN_SCALE[OP_SUMMON] = [2, 1, 1, 1]
+GOLDEN_SCALE[OP_DAMAGE_ALL] = [2, 1, 1, 1]
+GOLDEN_SCALE[OP_BUFF] = [1, 2, 2, 1]
+
+# OP_BUFF的目标
+TARGET_SELF = 0
+TARGET_ALL = 1              # 你的（种族）
+TARGET_OTHERS = 2           # 你的其他（种族）
+TARGET_LEFTMOST = 3
+TARGET_RIGHTMOST = 4
+TARGET_RANDOM = 5           # 一个/另一个友方（种族）
+TARGETS = {TARGET_SELF: "self", TARGET_ALL: "all", TARGET_OTHERS: "others",
+           TARGET_LEFTMOST: "leftmost", TARGET_RIGHTMOST: "rightmost", TARGET_RANDOM: "random"}
+
+_TRIBE_WORDS = {
+    "野兽": "beast", "龙": "dragon", "恶魔": "demon", "鱼人": "murloc", "机械": "mech",
+    "元素": "elemental", "海盗": "pirate", "亡灵": "undead", "野猪人": "quilboar", "纳迦": "naga",
+}
+_KEYWORD_WORDS = {
+    "嘲讽": "taunt", "圣盾": "divine_shield", "复生": "reborn", "风怒": "windfury",
+    "剧毒": "poisonous", "烈毒": "venomous", "潜行": "stealth", "磁力": "magnetic",
+}
+_CHINESE_NUMBERS = {"一": 1, "两": 2, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7}
+
+_TAG = re.compile(r"<[^>]+>")
+_QUOTED = re.compile(r"“[^”]*”")
+_REMARK = re.compile(r"（[^（）]*）")
+_TRIGGER_WORD = r"(?:战吼|亡语|进击|战斗开始时|复仇（\s*\d*\s*）)"
+_HEADER = re.compile(_TRIGGER_WORD + r"(?:\s*[，、]\s*" + _TRIGGER_WORD + r")*\s*：")
+_AVENGE = re.compile(r"复仇（\s*(\d*)\s*）")
+_KEYWORD_SENTENCE = re.compile(r"^(?:(?:" + "|".join(_KEYWORD_WORDS) + r")\s*[，、 ]?\s*)+$")
+_SUMMON = re.compile(r"^召唤\s*(若干|[一两二三四五六七]|\d+)?\s*[个只条张]?\s*(\d+)/(\d+)(?:并具有([^的]*))?的[^，。]*"
+                     r"(?:，数量等同于本随从的攻击力)?$")
+_DAMAGE_ALL = re.compile(r"^对所有(?:非(\S+?))?随从造成(\d+)点伤害$")
+_TRIBE_PATTERN = "|".join(sorted(_TRIBE_WORDS, key=len, reverse=True))
+_BUFF = re.compile(
+    r"^使(?P<target>你的其他|你的|你最左边的|你最右边的|另一(?:个|条)友方的?|一个友方的?|本随从)"
+    r"(?P<tribe>" + _TRIBE_PATTERN + r"|随从)?(?P<permanent>永久)?获得"
+    r"(?:\+(?P<attack>\d+)/\+(?P<health>\d+))?(?P<keywords>(?:" + "|".join(_KEYWORD_WORDS) + r"|和)*)$")
+_BUFF_TARGETS = {"你的其他": TARGET_OTHERS, "你的": TARGET_ALL, "你最左边的": TARGET_LEFTMOST,
+                 "你最右边的": TARGET_RIGHTMOST, "本随从": TARGET_SELF}
+_CONSTANT_EFFECTS = {
+    "本随从的属性值翻倍": OP_DOUBLE_STATS,
+    "获得等同于你当前等级的属性值": OP_GAIN_TIER_STATS,
+    "消灭击杀本随从的随从": OP_DESTROY_KILLER,
+}
+
+
+def _keyword_flags(words: str) -> int:
+    """文本中关键字词对应的关键字位"""
+    return sum(FLAGS[name] for word, name in _KEYWORD_WORDS.items() if word in (words or ""))
+
+
+def _tribe_bit(word: Optional[str]) -> int:
+    """种族词对应的种族位序号，随从或未指定时返回-1"""
+    tribe = _TRIBE_WORDS.get(word or "")
+    return TRIBE_BITS[tribe] if tribe else -1
+
+
+def compile_sentence(sentence: str) -> Optional[Tuple[int, Tuple[int, int, int, int], int]]:
+    """把一句效果文本编译为 (操作码, 参数, 目标种族位)，无法识别时返回None"""
+    sentence = sentence.strip()
+    if sentence in _CONSTANT_EFFECTS:
+        return _CONSTANT_EFFECTS[sentence], (0, 0, 0, 0), -1
+    match = _SUMMON.match(sentence)
+    if match:
+        count, attack, health, keywords = match.groups()
+        flags = _keyword_flags(keywords)
+        if count == "若干" or "数量等同于本随从的攻击力" in sentence:
+            return OP_SUMMON_BY_ATTACK, (0, int(attack), int(health), flags), -1
+        number = _CHINESE_NUMBERS.get(count, int(count) if count and count.isdigit() else 1)
+        return OP_SUMMON, (number, int(attack), int(health), flags), -1
+    match = _DAMAGE_ALL.match(sentence)
+    if match:
+        excluded, amount = match.groups()
+        return OP_DAMAGE_ALL, (int(amount), _tribe_bit(excluded), 0, 0), -1
+    match = _BUFF.match(sentence)
+    if match and (match["attack"] or _keyword_flags(match["keywords"])):
+        target = _BUFF_TARGETS.get(match["target"], TARGET_RANDOM)
+        args = (target, int(match["attack"] or 0), int(match["health"] or 0), _keyword_flags(match["keywords"]))
+        return OP_BUFF, args, _tribe_bit(match["tribe"])
+    return None
+
+
+def split_effects(text: str) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """把卡牌文本拆成 [(触发标题, 效果文本)] 和不属于任何触发的句子
+
+    引号中的文本（如召唤物自带的亡语）不视为触发标题。
+    """
+    text = _TAG.sub("", text or "").replace("\xa0", " ").strip()
+    masked = _QUOTED.sub(lambda m: "_" * len(m.group()), text)
+    headers = list(_HEADER.finditer(masked))
+    effects = []
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        effects.append((header.group(), _REMARK.sub("", text[header.end():end])))
+    loose = _REMARK.sub("", text[:headers[0].start()] if headers else text)
+    return effects, split_sentences(loose)
+
+
+def split_sentences(text: str) -> List[str]:
+    """按句号和换行拆分效果文本"""
+    return [s.strip() for s in re.split(r"[。\n]", text) if s.strip()]
+
+
+@dataclass
+class EffectTables:
+    """编译后的效果表
+
+    随从编号与 ``CardDatabase`` 相同（从1开始，0为未知）。第i张卡的效果位于
+    ``offsets[i]:offsets[i+1]`` 区间，各列按效果下标索引。
+    """
+    flags: np.ndarray            # uint32[随从数+1]，关键字位
+    combat: np.ndarray           # bool[随从数+1]，是否有战斗中触发的效果（亡语、复仇、战斗开始时、进击）
+    avenge: np.ndarray           # int8[随从数+1]，复仇次数（0表示没有或数值缺失）
+    golden_ids: np.ndarray       # int32[随从数+1]，金色版本的卡牌ID
+    offsets: np.ndarray          # int32[随从数+2]
+    triggers: np.ndarray         # int8[效果数]
+    opcodes: np.ndarray          # int8[效果数]
+    args: np.ndarray             # int16[效果数, 4]
+    tribes: np.ndarray           # int8[效果数]，效果目标的种族位（-1为不限）
+    unsupported_cards: np.ndarray    # int16[条数]，无法编译的效果所属随从编号
+    unsupported_text: np.ndarray     # str[条数]，无法编译的效果文本
+    source: str = ""             # minions.json内容的摘要
+    names: List[str] = field(default_factory=list)
+
+    def effects_of(self, index: int, trigger: Optional[int] = None) -> List[Tuple[int, int, np.ndarray, int]]:
+        """随从的效果列表 [(触发时机, 操作码, 参数, 种族位)]"""
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return [(int(self.triggers[i]), int(self.opcodes[i]), self.args[i], int(self.tribes[i]))
+                for i in range(start, end) if trigger is None or self.triggers[i] == trigger]
+
+    def find(self, index: int, trigger: int, opcodes: Tuple[int, ...], golden: bool = False
+             ) -> Optional[Tuple[int, np.ndarray]]:
+        """随从在指定时机的第一个匹配操作码的效果，金色随从的参数按 ``GOLDEN_SCALE`` 放大"""
+        for i in range(self.offsets[index], self.offsets[index + 1]):
+            if self.triggers[i] == trigger and self.opcodes[i] in opcodes:
+                opcode = int(self.opcodes[i])
+                return opcode, self.args[i] * GOLDEN_SCALE[opcode] if golden else self.args[i]
+        return None
+
+    def coverage(self) -> Dict[str, Any]:
+        """编译覆盖率：有战斗触发效果的随从中完全编译、可被模拟的比例，以及无法编译的效果"""
+        count = len(self.flags) - 1
+        unsupported = set(int(i) for i in self.unsupported_cards)
+        combat = set(int(i) for i in np.flatnonzero(self.combat))
+        compiled = combat - unsupported
+        simulated = {i for i in compiled
+                     if all((int(t), int(o)) in SIMULATED for t, o, _, _ in self.effects_of(i))}
+        by_trigger: Dict[str, Dict[str, int]] = {}
+        for trigger, opcode in zip(self.triggers, self.opcodes):
+            stats = by_trigger.setdefault(TRIGGERS[int(trigger)], {})
+            stats[OPCODES[int(opcode)]] = stats.get(OPCODES[int(opcode)], 0) + 1
+        return {
+            "minions": count,
+            "combat": len(combat),
+            "compiled": len(compiled),
+            "simulated": len(simulated),
+            "coverage": round(len(compiled) / len(combat), 4) if combat else 1.0,
+            # 招募阶段或光环类文本无法编译的随从
+            "passive_unsupported": len(unsupported - combat),
+            "effects": int(len(self.opcodes)),
+            "by_trigger": by_trigger,
+            "golden": int(np.count_nonzero(self.golden_ids)),
+            "unsupported": [{"name": self.names[int(i)] if int(i) < len(self.names) else "", "text": str(text)}
+                            for i, text in zip(self.unsupported_cards, self.unsupported_text)],
+        }
+
+    def save(self, path: Path):
+        """写入npz文件（先写临时文件再替换，多个进程同时编译时不会读到不完整的文件）"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez_compressed(temporary, flags=self.flags, combat=self.combat, avenge=self.avenge, golden_ids=self.golden_ids,
+                            offsets=self.offsets, triggers=self.triggers, opcodes=self.opcodes, args=self.args,
+                            tribes=self.tribes, unsupported_cards=self.unsupported_cards,
+                            unsupported_text=self.unsupported_text, source=np.array(self.source),
+                            names=np.array(self.names))
+        temporary.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "EffectTables":
+        """从npz文件读取"""
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files}
+        arrays["source"] = str(arrays["source"])
+        arrays["names"] = [str(name) for name in arrays["names"]]
+        return cls(**arrays)
+
+
+def source_digest(card_db: CardDatabase) -> str:
+    """卡牌数据文件的摘要，用于判断编译结果是否过期"""
+    try:
+        return hashlib.blake2b((card_db.data_dir / "minions.json").read_bytes(), digest_size=16).hexdigest()
+    except FileNotFoundError:
+        return ""
+
+
+def compile_effects(card_db: CardDatabase) -> EffectTables:
+    """编译卡牌数据库中全部随从的效果"""
+    count = len(card_db.minions) + 1
+    flags = np.zeros(count, dtype=np.uint32)
+    combat = np.zeros(count, dtype=np.bool_)
+    avenge = np.zeros(count, dtype=np.int8)
+    golden_ids = np.zeros(count, dtype=np.int32)
+    offsets = np.zeros(count + 1, dtype=np.int32)
+    rows: List[Tuple[int, int, Tuple[int, int, int, int], int]] = []
+    unsupported: List[Tuple[int, str]] = []
+
+    for index, card in enumerate(card_db.minions, start=1):
+        offsets[index] = len(rows)
+        text = card.get("text", "")
+        for name in card_db.keywords[index]:
+            flags[index] |= FLAGS[name]
+        if "攻击目标相邻" in _TAG.sub("", text):
+            flags[index] |= FLAGS["cleave"]
+        golden_ids[index] = (card.get("battlegrounds") or {}).get("upgradeId") or 0
+
+        effects, loose = split_effects(text)
+        for sentence in loose:
+            # 关键字和顺劈已编入关键字位
+            if not _KEYWORD_SENTENCE.match(sentence) and "攻击目标相邻" not in sentence:
+                unsupported.append((index, sentence))
+        for header, body in effects:
+            triggers = []
+            if "亡语" in header:
+                triggers.append(TRIGGER_DEATHRATTLE)
+            if "战斗开始时" in header:
+                triggers.append(TRIGGER_START_OF_COMBAT)
+            if "进击" in header:
+                triggers.append(TRIGGER_RALLY)
+            match = _AVENGE.search(header)
+            if match:
+                triggers.append(TRIGGER_AVENGE)
+                if match.group(1):
+                    avenge[index] = int(match.group(1))
+                else:
+                    unsupported.append((index, f"{header}（复仇次数缺失）"))
+            if not triggers:
+                # 只有战吼：招募阶段效果，不参与战斗
+                continue
+            combat[index] = True
+            for sentence in split_sentences(body):
+                compiled = compile_sentence(sentence)
+                if compiled is None:
+                    unsupported.append((index, f"{header}{sentence}"))
+                    continue
+                opcode, args, tribe = compiled
+                rows.extend((trigger, opcode, args, tribe) for trigger in triggers)
+    offsets[count] = len(rows)
+
+    return EffectTables(
+        flags=flags,
+        combat=combat,
+        avenge=avenge,
+        golden_ids=golden_ids,
+        offsets=offsets,
+        triggers=np.array([row[0] for row in rows], dtype=np.int8),
+        opcodes=np.array([row[1] for row in rows], dtype=np.int8),
+        args=np.array([row[2] for row in rows], dtype=np.int16).reshape(-1, 4),
+        tribes=np.array([row[3] for row in rows], dtype=np.int8),
+        unsupported_cards=np.array([index for index, _ in unsupported], dtype=np.int16),
+        unsupported_text=np.array([text for _, text in unsupported], dtype=str),
+        source=source_digest(card_db),
+        names=[""] + [card.get("name", "") for card in card_db.minions],
+    )
+
+
+def default_path() -> Path:
+    """编译结果的默认路径"""
+    return Path(__file__).parent / "output" / "card_effects.npz"
+
+
+@lru_cache(maxsize=None)
+def get_effect_tables(card_db: Optional[CardDatabase] = None) -> EffectTables:
+    """获取效果表：编译结果与卡牌数据一致时直接读取，否则重新编译并保存"""
+    card_db = card_db or get_card_database()
+    path = default_path()
+    digest = source_digest(card_db)
+    try:
+        tables = EffectTables.load(path)
+        if tables.source == digest and len(tables.flags) == len(card_db.minions) + 1:
+            return tables
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        pass
+    tables = compile_effects(card_db)
+    if digest:
+        try:
+            tables.save(path)
+        except OSError as e:
+            print(f"保存效果表失败: {e}")
+    return tables
+
+
+def main():
+    """命令行入口：编译效果表并报告覆盖率"""
+    parser = argparse.ArgumentParser(description="把随从数据编译为模拟器操作码表")
+    parser.add_argument("--data-dir", default="data/bgs", help="卡牌数据目录")
+    parser.add_argument("-o", "--output", type=Path, default=default_path(), help="输出npz文件")
+    parser.add_argument("--report", action="store_true", help="列出无法编译的效果")
+    args = parser.parse_args()
+
+    card_db = CardDatabase(args.data_dir)
+    if not card_db.minions:
+        parser.error(f"没有找到随从数据: {args.data_dir}")
+    tables = compile_effects(card_db)
+    tables.save(args.output)
+
+    coverage = tables.coverage()
+    print(f"已编译 {coverage['effects']} 条效果 -> {args.output}")
+    print(f"有战斗触发效果的随从 {coverage['combat']} 张，完全编译 {coverage['compiled']} 张"
+          f"（{coverage['coverage']:.1%}），可模拟 {coverage['simulated']} 张；"
+          f"另有 {coverage['passive_unsupported']} 张招募阶段或光环类效果未编译")
+    for trigger, opcodes in coverage["by_trigger"].items():
+        print(f"  {trigger}: " + ", ".join(f"{op} {n}" for op, n in opcodes.items()))
+    if args.report:
+        print(f"无法编译的效果（{len(coverage['unsupported'])} 条）:")
+        for item in coverage["unsupported"]:
+            print(f"  {item['name']}: {item['text']}")
+    else:
+        print(f"无法编译的效果 {len(coverage['unsupported'])} 条，使用 --report 查看", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
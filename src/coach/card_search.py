@@ -0,0 +1,393 @@
+"""
+卡牌搜索索引
+对data/bgs中随从和英雄的名称、描述（去除HTML标签）、背景文字、关键字和种族建立内存倒排索引，
+中文按单字和相邻两字切分，按BM25排序，支持等级、种族、关键字过滤；索引构建一次后保存，之后直接读取
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from card_database import (ALL_TRIBES_MASK, KEYWORDS, TRIBE_BITS, CardDatabase, get_card_database,
+                           tribes_from_mask)
+
+
+# 索引格式版本，切分或打分方式变化时递增，使已保存的索引失效
+INDEX_VERSION = 1
+
+# 字段权重：名称命中最重要，背景文字最不重要
+FIELD_WEIGHTS = {"name": 3.0, "keywords": 2.0, "text": 1.0, "flavor": 0.5}
+
+# BM25参数
+K1 = 1.2
+B = 0.75
+
+KIND_MINION = 0
+KIND_HERO = 1
+KINDS = {"minion": KIND_MINION, "hero": KIND_HERO}
+
+KEYWORD_NAMES = list(KEYWORDS.values())
+KEYWORD_BITS = {name: bit for bit, name in enumerate(KEYWORD_NAMES)}
+
+_TAG = re.compile(r"<[^>]+>")
+_BOLD = re.compile(r"<b>(.*?)</b>")
+# 中文连续片段和英文/数字单词
+_RUN = re.compile(r"[㐀-鿿]+|[a-z0-9]+")
+
+
+def strip_html(text: str) -> str:
+    """去除卡牌文本中的HTML标签和排版标记"""
+    return _TAG.sub("", text or "").replace("[x]", "").strip()
+
+
+def normalize(text: str) -> str:
+    """全角转半角并转为小写"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """建索引用的切分：中文片段切为单字和相邻两字，英文和数字按单词"""
+    tokens = []
+    for run in _RUN.findall(normalize(text)):
+        if run.isascii():
+            tokens.append(run)
+            continue
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def query_terms(text: str) -> List[str]:
+    """查询用的切分：两字以上的中文片段只取相邻两字（比单字更准确），去除重复"""
+    terms = []
+    for run in _RUN.findall(normalize(text)):
+        if run.isascii() or len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(terms))
+
+
+def card_fields(card: Dict[str, Any], keywords: Iterable[str] = (), tribes: Iterable[str] = ()) -> Dict[str, str]:
+    """卡牌各字段的待索引文本；加粗的关键字、英文关键字和种族名计入关键字字段"""
+    text = card.get("text", "") or ""
+    slug = re.sub(r"^\d+-", "", card.get("slug", "") or "").replace("-", " ")
+    return {
+        "name": f"{card.get('name', '')} {slug}",
+        "keywords": " ".join(_BOLD.findall(text) + [k.replace("_", " ") for k in keywords] + list(tribes)),
+        "text": strip_html(text),
+        "flavor": strip_html(card.get("flavorText", "") or ""),
+    }
+
+
+def source_digest(card_db: CardDatabase) -> str:
+    """卡牌数据文件和索引版本的摘要，用于判断保存的索引是否过期"""
+    digest = hashlib.blake2b(str(INDEX_VERSION).encode(), digest_size=16)
+    try:
+        for filename in ("minions.json", "heroes.json"):
+            digest.update((card_db.data_dir / filename).read_bytes())
+    except FileNotFoundError:
+        return ""
+    return digest.hexdigest()
+
+
+@dataclass
+class CardSearchIndex:
+    """倒排索引
+
+    词表按字典序排列，``offsets[i]:offsets[i+1]`` 为第i个词的倒排表：文档编号和该词对文档的BM25得分
+    （各字段按权重求和），查询时只需把各词的得分累加。文档按随从（数据库编号减1）、英雄的顺序排列。
+    """
+
+    terms: np.ndarray            # str[词数]
+    offsets: np.ndarray          # int32[词数+1]
+    postings: np.ndarray         # int32[倒排项数]，文档编号
+    weights: np.ndarray          # float32[倒排项数]
+    kinds: np.ndarray            # int8[文档数]
+    indices: np.ndarray          # int32[文档数]，随从或英雄在数据库中的编号
+    tiers: np.ndarray            # int8[文档数]
+    tribes: np.ndarray           # uint16[文档数]
+    keywords: np.ndarray         # uint32[文档数]，关键字位掩码
+    names: np.ndarray            # str[文档数]，规范化后的名称，用于名称整体匹配
+    source: str = ""
+
+    def __post_init__(self):
+        self._lookup = {str(term): i for i, term in enumerate(self.terms)}
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def _filter(self, tier: Union[int, Iterable[int], None] = None, tribe: Optional[str] = None,
+                keyword: Optional[str] = None, kind: Optional[str] = None) -> Optional[np.ndarray]:
+        """过滤条件对应的文档掩码，没有过滤条件时返回None"""
+        mask = None
+
+        def narrow(condition: np.ndarray):
+            nonlocal mask
+            mask = condition if mask is None else mask & condition
+
+        if kind is not None:
+            if kind not in KINDS:
+                raise ValueError(f"未知卡牌类型: {kind}")
+            narrow(self.kinds == KINDS[kind])
+        if tier is not None:
+            tiers = [tier] if isinstance(tier, int) else list(tier)
+            narrow(np.isin(self.tiers, [int(t) for t in tiers]) & (self.kinds == KIND_MINION))
+        if tribe is not None:
+            if tribe == "neutral":
+                narrow((self.tribes == 0) & (self.kinds == KIND_MINION))
+            elif tribe == "all":
+                narrow(self.tribes == ALL_TRIBES_MASK)
+            elif tribe in TRIBE_BITS:
+                narrow((self.tribes & (1 << TRIBE_BITS[tribe])) != 0)
+            else:
+                raise ValueError(f"未知种族: {tribe}")
+        if keyword is not None:
+            if keyword not in KEYWORD_BITS:
+                raise ValueError(f"未知关键字: {keyword}")
+            narrow((self.keywords & (1 << KEYWORD_BITS[keyword])) != 0)
+        return mask
+
+    def search(self, query: str = "", limit: int = 10, **filters) -> List[Tuple[int, float]]:
+        """按查询文本和过滤条件返回 [(文档编号, 得分)]，按得分从高到低排列
+
+        多个查询词时要求至少命中一半，得分乘以命中比例；名称包含整个查询文本的文档优先。
+        没有查询文本时按等级和名称列出满足过滤条件的文档。
+        """
+        mask = self._filter(**filters)
+        terms = query_terms(query)
+        if not terms:
+            if mask is None:
+                raise ValueError("请提供查询文本或过滤条件")
+            docs = np.flatnonzero(mask)
+            docs = docs[np.lexsort((self.names[docs], self.tiers[docs]))]
+            return [(int(doc), 0.0) for doc in docs[:limit]]
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        hits = np.zeros(len(self), dtype=np.int16)
+        for term in terms:
+            row = self._lookup.get(term)
+            if row is None:
+                continue
+            start, end = self.offsets[row], self.offsets[row + 1]
+            docs = self.postings[start:end]
+            scores[docs] += self.weights[start:end]
+            hits[docs] += 1
+        candidates = np.flatnonzero(hits * 2 >= len(terms)) if len(terms) > 1 else np.flatnonzero(hits)
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        if not len(candidates):
+            return []
+        ranked = scores[candidates] * hits[candidates] / len(terms)
+        phrase = normalize(query).strip()
+        if phrase:
+            ranked = ranked + np.array([phrase in str(self.names[doc]) for doc in candidates]) * ranked.max()
+        order = np.argsort(-ranked, kind="stable")[:limit]
+        return [(int(candidates[i]), float(ranked[i])) for i in order]
+
+    def save(self, path: Path):
+        """写入npz文件（先写临时文件再替换，多个进程同时构建时不会读到不完整的文件）"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez_compressed(temporary, terms=self.terms, offsets=self.offsets, postings=self.postings,
+                            weights=self.weights, kinds=self.kinds, indices=self.indices, tiers=self.tiers,
+                            tribes=self.tribes, keywords=self.keywords, names=self.names,
+                            source=np.array(self.source))
+        temporary.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "CardSearchIndex":
+        """从npz文件读取"""
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files}
+        arrays["source"] = str(arrays["source"])
+        return cls(**arrays)
+
+
+def build_index(card_db: CardDatabase) -> CardSearchIndex:
+    """为卡牌数据库中的全部随从和英雄建立倒排索引"""
+    documents: List[Dict[str, str]] = []
+    kinds, indices, tiers, tribes, keywords, names = [], [], [], [], [], []
+    for index, card in enumerate(card_db.minions, start=1):
+        mask = int(card_db.tribes[index])
+        documents.append(card_fields(card, card_db.keywords[index], tribes_from_mask(mask)))
+        kinds.append(KIND_MINION)
+        indices.append(index)
+        tiers.append(int(card_db.tier[index]))
+        tribes.append(mask)
+        keywords.append(sum(1 << KEYWORD_BITS[k] for k in card_db.keywords[index]))
+        names.append(normalize(card.get("name", "")))
+    for index, hero in enumerate(card_db.heroes, start=1):
+        documents.append(card_fields(hero))
+        kinds.append(KIND_HERO)
+        indices.append(index)
+        tiers.append(0)
+        tribes.append(0)
+        keywords.append(0)
+        names.append(normalize(hero.get("name", "")))
+
+    # 各字段的词频和长度
+    frequencies: Dict[str, Dict[int, Dict[str, int]]] = {}
+    lengths = {field: np.zeros(len(documents)) for field in FIELD_WEIGHTS}
+    for doc, fields in enumerate(documents):
+        for field, text in fields.items():
+            tokens = tokenize(text)
+            lengths[field][doc] = len(tokens)
+            for token in tokens:
+                counts = frequencies.setdefault(token, {}).setdefault(doc, {})
+                counts[field] = counts.get(field, 0) + 1
+    average = {field: max(float(values.mean()), 1.0) if len(values) else 1.0 for field, values in lengths.items()}
+
+    terms = sorted(frequencies)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int32)
+    postings: List[int] = []
+    weights: List[float] = []
+    for row, term in enumerate(terms):
+        docs = frequencies[term]
+        idf = np.log(1.0 + (len(documents) - len(docs) + 0.5) / (len(docs) + 0.5))
+        for doc in sorted(docs):
+            score = 0.0
+            for field, tf in docs[doc].items():
+                norm = 1.0 - B + B * lengths[field][doc] / average[field]
+                score += FIELD_WEIGHTS[field] * tf * (K1 + 1) / (tf + K1 * norm)
+            postings.append(doc)
+            weights.append(idf * score)
+        offsets[row + 1] = len(postings)
+
+    return CardSearchIndex(
+        terms=np.array(terms, dtype=str),
+        offsets=offsets,
+        postings=np.array(postings, dtype=np.int32),
+        weights=np.array(weights, dtype=np.float32),
+        kinds=np.array(kinds, dtype=np.int8),
+        indices=np.array(indices, dtype=np.int32),
+        tiers=np.array(tiers, dtype=np.int8),
+        tribes=np.array(tribes, dtype=np.uint16),
+        keywords=np.array(keywords, dtype=np.uint32),
+        names=np.array(names, dtype=str),
+        source=source_digest(card_db),
+    )
+
+
+def default_path() -> Path:
+    """索引的默认保存路径"""
+    return Path(__file__).parent / "output" / "card_search.npz"
+
+
+class CardSearch:
+    """卡牌搜索：把索引的查询结果还原为卡牌信息"""
+
+    def __init__(self, card_db: Optional[CardDatabase] = None, index: Optional[CardSearchIndex] = None):
+        self.card_db = card_db or get_card_database()
+        self.index = index or load_index(self.card_db)
+
+    def card(self, doc: int) -> Dict[str, Any]:
+        """文档编号对应的卡牌信息"""
+        index = int(self.index.indices[doc])
+        if self.index.kinds[doc] == KIND_HERO:
+            hero = self.card_db.heroes[index - 1]
+            return {
+                "kind": "hero",
+                "id": hero.get("id"),
+                "name": hero.get("name", ""),
+                "health": hero.get("health"),
+                "armor": hero.get("armor"),
+                "text": strip_html(hero.get("text", "")),
+            }
+        minion = self.card_db.minions[index - 1]
+        return {
+            "kind": "minion",
+            "id": minion.get("id"),
+            "name": minion.get("name", ""),
+            "tier": int(self.card_db.tier[index]),
+            "attack": int(self.card_db.attack[index]),
+            "health": int(self.card_db.health[index]),
+            "tribes": tribes_from_mask(int(self.card_db.tribes[index])),
+            "keywords": self.card_db.keywords[index],
+            "text": strip_html(minion.get("text", "")),
+        }
+
+    def search(self, query: str = "", limit: int = 10, **filters) -> Dict[str, Any]:
+        """搜索卡牌，过滤条件无效时抛出ValueError"""
+        started = time.perf_counter()
+        if limit < 1:
+            raise ValueError("limit 应为正整数")
+        hits = self.index.search(query, limit=limit, **filters)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return {
+            "query": query,
+            "terms": query_terms(query),
+            "results": [dict(self.card(doc), score=round(score, 3)) for doc, score in hits],
+            "elapsed_ms": round(elapsed_ms, 3),
+        }
+
+
+def load_index(card_db: CardDatabase, path: Optional[Path] = None) -> CardSearchIndex:
+    """读取保存的索引，与卡牌数据不一致时重新构建并保存"""
+    path = path or default_path()
+    digest = source_digest(card_db)
+    try:
+        index = CardSearchIndex.load(path)
+        if index.source == digest and len(index) == len(card_db.minions) + len(card_db.heroes):
+            return index
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        pass
+    index = build_index(card_db)
+    if digest:
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"保存搜索索引失败: {e}")
+    return index
+
+
+@lru_cache(maxsize=None)
+def get_card_search() -> CardSearch:
+    """获取共享的卡牌搜索实例"""
+    return CardSearch()
+
+
+def main():
+    """命令行入口：构建索引并执行查询"""
+    parser = argparse.ArgumentParser(description="建立卡牌搜索索引并查询")
+    parser.add_argument("query", nargs="?", default="", help="查询文本")
+    parser.add_argument("--data-dir", default="data/bgs", help="卡牌数据目录")
+    parser.add_argument("-o", "--output", type=Path, default=default_path(), help="输出npz文件")
+    parser.add_argument("--tier", type=int, help="按随从等级过滤")
+    parser.add_argument("--tribe", help="按种族过滤，如 beast、neutral")
+    parser.add_argument("--keyword", help="按关键字过滤，如 divine_shield")
+    parser.add_argument("--kind", choices=list(KINDS), help="只搜索随从或英雄")
+    parser.add_argument("--limit", type=int, default=10, help="最多返回的结果数")
+    args = parser.parse_args()
+
+    card_db = CardDatabase(args.data_dir)
+    if not card_db.minions:
+        parser.error(f"没有找到随从数据: {args.data_dir}")
+    started = time.perf_counter()
+    index = build_index(card_db)
+    index.save(args.output)
+    print(f"已索引 {len(index)} 张卡牌、{len(index.terms)} 个词、{len(index.postings)} 个倒排项 -> {args.output}"
+          f"（{(time.perf_counter() - started) * 1000:.0f} ms）")
+    if not args.query and not any((args.tier, args.tribe, args.keyword, args.kind)):
+        return
+    try:
+        result = CardSearch(card_db, index).search(args.query, limit=args.limit, tier=args.tier,
+                                                   tribe=args.tribe, keyword=args.keyword, kind=args.kind)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"查询用时 {result['elapsed_ms']} ms")
+    for card in result["results"]:
+        print(f"  [{card['score']:.2f}] {card['name']}（{card.get('tier', '英雄')}）{card['text']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""
+战斗模拟器
+以结构数组（struct-of-arrays）表示双方场面，成千上万次随机战斗作为批量NumPy运算同时推演，
+输出胜/平/负概率和伤害分布
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from card_database import CardDatabase, get_card_database
+from card_effects import FLAGS, OP_SUMMON, OP_SUMMON_BY_ATTACK, TRIGGER_DEATHRATTLE, get_effect_tables
+
+
+MAX_BOARD = 7
+MAX_STEPS = 200
+# 批次中的战斗数不超过该值时不再移除已结束的战斗
+COMPACT_MIN_TRIALS = 256
+
+# 每个随从槽位的属性列及其类型
+FIELDS = {
+    "attack": np.int16,
+    "health": np.int16,
+    "base_attack": np.int16,     # 复生时恢复的攻击力
+    "tier": np.int8,             # 胜利时造成伤害的等级
+    "taunt": np.bool_,
+    "shield": np.bool_,
+    "base_shield": np.bool_,     # 复生时是否恢复圣盾
+    "reborn": np.bool_,
+    "poisonous": np.bool_,
+    "venomous": np.bool_,        # 烈毒：造成伤害后失效
+    "windfury": np.bool_,
+    "cleave": np.bool_,          # 同时对目标相邻的随从造成伤害
+    "summon_count": np.int8,     # 亡语召唤数量
+    "summon_by_attack": np.bool_,  # 召唤数量等同于本随从的攻击力
+    "summon_attack": np.int16,
+    "summon_health": np.int16,
+    "summon_taunt": np.bool_,
+    "summon_shield": np.bool_,
+    "summon_reborn": np.bool_,
+}
+
+# 召唤物的属性来源：取自死亡随从的亡语列，或固定值
+TOKEN_FIELDS = {
+    "attack": "summon_attack",
+    "health": "summon_health",
+    "base_attack": "summon_attack",
+    "tier": 1,
+    "taunt": "summon_taunt",
+    "shield": "summon_shield",
+    "base_shield": "summon_shield",
+    "reborn": "summon_reborn",
+}
+
+# 复生随从的属性来源：恢复初始攻击力和圣盾，生命值为1且失去复生
+REVIVE_FIELDS = {
+    "attack": "base_attack",
+    "health": 1,
+    "shield": "base_shield",
+    "reborn": False,
+}
+
+
+@dataclass
+class CombatMinion:
+    """参与战斗的随从"""
+    attack: int
+    health: int
+    tier: int = 1
+    taunt: bool = False
+    divine_shield: bool = False
+    reborn: bool = False
+    poisonous: bool = False
+    venomous: bool = False
+    windfury: bool = False
+    cleave: bool = False
+    summon_count: int = 0
+    summon_by_attack: bool = False
+    summon_attack: int = 0
+    summon_health: int = 0
+    summon_taunt: bool = False
+    summon_shield: bool = False
+    summon_reborn: bool = False
+    card_id: int = 0
+    name: str = ""
+
+
+@dataclass
+class CombatOutcome:
+    """一批战斗的原始结果（以第一方为视角）"""
+    winner: np.ndarray           # 1: 胜，0: 平，-1: 负
+    damage: np.ndarray           # 胜方对败方英雄造成的伤害，平局为0
+    steps: int = 0
+    elapsed_ms: float = 0.0
+    boards: Tuple[List[CombatMinion], List[CombatMinion]] = field(default_factory=lambda: ([], []))
+
+
+def combat_minion(minion: Any, card_db: Optional[CardDatabase] = None) -> CombatMinion:
+    """由MinionInfo或其字典形式构造战斗随从，关键字和亡语取自编译后的效果表
+
+    名称未知且未同时给出 attack 和 health 时抛出ValueError。
+    """
+    card_db = card_db or get_card_database()
+    effects = get_effect_tables(card_db)
+    info = minion if isinstance(minion, dict) else vars(minion)
+    index = card_db.minion_index(info.get("name", ""))
+    if not index and (info.get("attack") is None or info.get("health") is None):
+        # 未知随从没有卡牌数据可用，缺少身材时会变成0/0
+        raise ValueError(f"未知随从: {info.get('name', '')}，请提供 attack 和 health")
+    golden = bool(info.get("golden"))
+    multiplier = 2 if golden else 1
+    flags = int(effects.flags[index])
+
+    # 只有缺省（None）时才取卡牌身材，明确给出的0攻（被削弱或0攻墙）保留
+    attack = info.get("attack")
+    if attack is None:
+        attack = int(card_db.attack[index]) * multiplier
+    health = info.get("health")
+    if health is None:
+        health = int(card_db.health[index]) * multiplier
+    result = CombatMinion(
+        attack=int(attack),
+        health=int(health),
+        tier=int(info.get("tier") or card_db.tier[index] or 1),
+        taunt=bool(flags & FLAGS["taunt"]),
+        divine_shield=bool(info.get("divine_shield")) or bool(flags & FLAGS["divine_shield"]),
+        reborn=bool(info.get("reborn")) or bool(flags & FLAGS["reborn"]),
+        poisonous=bool(flags & FLAGS["poisonous"]),
+        venomous=bool(flags & FLAGS["venomous"]),
+        windfury=bool(flags & FLAGS["windfury"]),
+        cleave=bool(flags & FLAGS["cleave"]),
+        card_id=int(card_db.card_ids[index]),
+        name=info.get("name", ""),
+    )
+    # 金色随从的亡语触发两次（召唤数量按 GOLDEN_SCALE 加倍）
+    summon = effects.find(index, TRIGGER_DEATHRATTLE, (OP_SUMMON, OP_SUMMON_BY_ATTACK), golden) if index else None
+    if summon:
+        opcode, (count, summon_attack, summon_health, summon_flags) = summon
+        result.summon_count = int(count)
+        result.summon_by_attack = opcode == OP_SUMMON_BY_ATTACK
+        result.summon_attack = int(summon_attack)
+        result.summon_health = int(summon_health)
+        result.summon_taunt = bool(summon_flags & FLAGS["taunt"])
+        result.summon_shield = bool(summon_flags & FLAGS["divine_shield"])
+        result.summon_reborn = bool(summon_flags & FLAGS["reborn"])
+    return result
+
+
+def build_board(minions: Iterable[Any], card_db: Optional[CardDatabase] = None) -> List[CombatMinion]:
+    """按位置排序构造战斗场面（最多7个随从）"""
+    board = []
+    for minion in minions:
+        if isinstance(minion, CombatMinion):
+            board.append(minion)
+        else:
+            board.append(combat_minion(minion, card_db))
+    return board[:MAX_BOARD]
+
+
+class BoardBatch:
+    """批量场面：每列形状为 (场面组数 * trials * 2, 7)，第 2t 行为第t场战斗的第一方，第 2t+1 行为第二方
+
+    同一组场面的trials场战斗连续排列。场面始终保持紧凑（存活随从位于前count个槽位），
+    随从死亡后召唤物和复生随从插入原位置。
+    """
+
+    def __init__(self, pairs: Sequence[Tuple[List[CombatMinion], List[CombatMinion]]], trials: int):
+        # 相同的随从对象只展开一次属性，各场面用下标引用（-1为空位，对应末尾的全零行）
+        lookup: Dict[int, int] = {}
+        minions: List[CombatMinion] = []
+
+        def slot_index(minion: CombatMinion) -> int:
+            index = lookup.get(id(minion))
+            if index is None:
+                index = lookup[id(minion)] = len(minions)
+                minions.append(minion)
+            return index
+
+        layout = np.array([[[slot_index(minion) for minion in board] + [-1] * (MAX_BOARD - len(board))
+                            for board in pair] for pair in pairs], dtype=np.intp).reshape(len(pairs), 2, MAX_BOARD)
+        values = [self._minion_values(minion) for minion in minions]
+        layout = np.repeat(layout, trials, axis=0).reshape(-1, MAX_BOARD)
+
+        self.columns: Dict[str, np.ndarray] = {}
+        for name, dtype in FIELDS.items():
+            table = np.zeros(len(minions) + 1, dtype=dtype)
+            table[:len(minions)] = [value[name] for value in values]
+            self.columns[name] = table[layout]
+        self.count = (layout >= 0).sum(axis=1).astype(np.int8)
+
+    @staticmethod
+    def _minion_values(minion: CombatMinion) -> Dict[str, Any]:
+        """战斗随从各属性列的初始值"""
+        return {
+            "attack": minion.attack,
+            "health": minion.health,
+            "base_attack": minion.attack,
+            "tier": minion.tier,
+            "taunt": minion.taunt,
+            "shield": minion.divine_shield,
+            "base_shield": minion.divine_shield,
+            "reborn": minion.reborn,
+            "poisonous": minion.poisonous,
+            "venomous": minion.venomous,
+            "windfury": minion.windfury,
+            "cleave": minion.cleave,
+            "summon_count": minion.summon_count,
+            "summon_by_attack": minion.summon_by_attack,
+            "summon_attack": minion.summon_attack,
+            "summon_health": minion.summon_health,
+            "summon_taunt": minion.summon_taunt,
+            "summon_shield": minion.summon_shield,
+            "summon_reborn": minion.summon_reborn,
+        }
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        columns = self.__dict__.get("columns")
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def keep(self, trials: np.ndarray):
+        """只保留指定的战斗（用于移除已结束的战斗）"""
+        rows = (trials[:, None] * 2 + np.arange(2)).ravel()
+        for name, column in self.columns.items():
+            self.columns[name] = column[rows]
+        self.count = self.count[rows]
+
+    def live(self) -> np.ndarray:
+        """存活槽位掩码"""
+        return np.arange(MAX_BOARD) < self.count[:, None]
+
+    def resolve_deaths(self) -> np.ndarray:
+        """移除死亡随从并插入亡语召唤物与复生随从
+
+        返回每行的位置映射 (rows, 8)：原槽位i的内容（含其召唤物）在新场面中的起始位置，
+        最后一列为新的随从数量。
+        """
+        rows = len(self.count)
+        slots = np.arange(MAX_BOARD)
+        live = self.live()
+        dead = live & (self.health <= 0)
+
+        starts = np.empty((rows, MAX_BOARD + 1), dtype=np.int16)
+        starts[:, :MAX_BOARD] = np.minimum(slots, self.count[:, None])
+        starts[:, MAX_BOARD] = self.count
+        changed = np.flatnonzero(dead.any(axis=1))
+        if not len(changed):
+            return starts
+
+        dead = dead[changed]
+        survivors = live[changed] & ~dead
+        reborn = dead & self.reborn[changed]
+        summons = np.where(self.summon_by_attack[changed], np.maximum(self.attack[changed], 0),
+                           self.summon_count[changed])
+        summons = np.where(dead, np.minimum(summons, MAX_BOARD), 0).astype(np.int16)
+
+        # 空位按从左到右的死亡顺序分配给召唤物，存活和复生随从优先占位
+        free = MAX_BOARD - survivors.sum(axis=1) - reborn.sum(axis=1)
+        before = np.cumsum(summons, axis=1) - summons
+        allowed = np.clip(free[:, None] - before, 0, summons)
+        expansion = survivors + allowed + reborn
+        sub_starts = np.zeros((len(changed), MAX_BOARD + 1), dtype=np.int16)
+        np.cumsum(expansion, axis=1, out=sub_starts[:, 1:])
+
+        # 为新场面的每个位置记录来源槽位和类型（0: 原随从，1: 召唤物，2: 复生随从，-1: 空）
+        source = np.zeros((len(changed), MAX_BOARD), dtype=np.intp)
+        kind = np.full((len(changed), MAX_BOARD), -1, dtype=np.int8)
+        r, s = np.nonzero(survivors)
+        source[r, sub_starts[r, s]] = s
+        kind[r, sub_starts[r, s]] = 0
+        for j in range(int(allowed.max(initial=0))):
+            r, s = np.nonzero(allowed > j)
+            source[r, sub_starts[r, s] + j] = s
+            kind[r, sub_starts[r, s] + j] = 1
+        r, s = np.nonzero(reborn)
+        source[r, sub_starts[r, s] + allowed[r, s]] = s
+        kind[r, sub_starts[r, s] + allowed[r, s]] = 2
+
+        flat = changed[:, None] * MAX_BOARD + source
+        token = np.nonzero(kind == 1)
+        revived = np.nonzero(kind == 2)
+        empty = np.nonzero(kind < 0)
+        previous = {name: column.take(flat) for name, column in self.columns.items()}
+        for name, values in previous.items():
+            origin = TOKEN_FIELDS.get(name, 0)
+            values = values.copy() if name in REVIVE_FIELDS or isinstance(origin, str) else values
+            values[token] = previous[origin][token] if isinstance(origin, str) else origin
+            if name in REVIVE_FIELDS:
+                origin = REVIVE_FIELDS[name]
+                values[revived] = previous[origin][revived] if isinstance(origin, str) else origin
+            values[empty] = 0
+            self.columns[name][changed] = values
+
+        self.count[changed] = sub_starts[:, MAX_BOARD]
+        starts[changed] = sub_starts
+        return starts
+
+
+class CombatSimulator:
+    """批量战斗模拟器
+
+    每一步所有未结束的战斗同时进行一次攻击：选择攻击者、按嘲讽随机选择目标、结算圣盾/剧毒/顺劈，
+    再统一处理死亡、亡语召唤和复生。战斗开始时和攻击触发的其他效果暂不模拟。
+    """
+
+    def __init__(self, card_db: Optional[CardDatabase] = None, max_steps: int = MAX_STEPS):
+        self.card_db = card_db or get_card_database()
+        self.max_steps = max_steps
+
+    def run(self, board: Iterable[Any], opponent: Iterable[Any], trials: int = 1000,
+            rng: Optional[np.random.Generator] = None, tier: int = 1, opponent_tier: int = 1) -> CombatOutcome:
+        """模拟trials次战斗，返回原始结果数组"""
+        boards = (build_board(board, self.card_db), build_board(opponent, self.card_db))
+        outcome = self.run_pairs([boards], trials, rng, tier, opponent_tier)
+        outcome.boards = boards
+        return outcome
+
+    def run_pairs(self, pairs: Sequence[Tuple[List[CombatMinion], List[CombatMinion]]], trials: int,
+                  rng: Optional[np.random.Generator] = None, tier: int = 1, opponent_tier: int = 1) -> CombatOutcome:
+        """在同一批次中模拟多组场面，每组trials次，结果按组连续排列（长度为组数 * trials）"""
+        started = time.perf_counter()
+        rng = rng if rng is not None else np.random.default_rng()
+        batch = BoardBatch(pairs, trials)
+        trials = len(pairs) * trials
+        # 批次中第i场战斗对应的原始序号，已结束的战斗超过一半时从批次中移除
+        trial_ids = np.arange(trials)
+        winner = np.zeros(trials, dtype=np.int8)
+        damage = np.zeros(trials, dtype=np.int16)
+
+        slots = np.arange(MAX_BOARD)
+        pointer = np.zeros(trials * 2, dtype=np.int16)
+        extra_attack = np.zeros(trials, dtype=bool)
+        # 随从多的一方先攻，数量相同时随机
+        sizes = batch.count.reshape(trials, 2)
+        side = np.where(sizes[:, 0] > sizes[:, 1], 0, 1).astype(np.int8)
+        tied = sizes[:, 0] == sizes[:, 1]
+        side[tied] = rng.integers(0, 2, int(tied.sum()), dtype=np.int8)
+        stalled = np.zeros(trials, dtype=bool)
+
+        steps = 0
+        while steps < self.max_steps:
+            counts = batch.count.reshape(-1, 2)
+            can_attack = (batch.live() & (batch.attack > 0)).any(axis=1).reshape(-1, 2)
+            # 双方都无法攻击（0攻随从）时判为平局
+            stalled |= (counts > 0).all(axis=1) & ~can_attack.any(axis=1)
+            active = np.flatnonzero((counts > 0).all(axis=1) & ~stalled)
+            if not len(active):
+                break
+            steps += 1
+            if len(active) * 2 <= len(trial_ids) and len(trial_ids) > COMPACT_MIN_TRIALS:
+                self._record(batch, trial_ids, stalled, winner, damage, tier, opponent_tier)
+                batch.keep(active)
+                trial_ids, side, stalled = trial_ids[active], side[active], stalled[active]
+                extra_attack = extra_attack[active]
+                pointer = pointer[(active[:, None] * 2 + np.arange(2)).ravel()]
+                can_attack = can_attack[active]
+                active = np.arange(len(active))
+
+            # 当前方无可攻击随从时由对方攻击
+            swap = ~can_attack[active, side[active]]
+            side[active[swap]] ^= 1
+            extra_attack[active[swap]] = False
+            attackers = active * 2 + side[active]
+            defenders = active * 2 + 1 - side[active]
+
+            # 攻击者：从指针位置起第一个攻击力大于0的随从，到末尾后回到最左边
+            candidates = batch.live()[attackers] & (batch.attack[attackers] > 0)
+            after = candidates & (slots >= pointer[attackers][:, None])
+            attacker_slot = np.where(after.any(axis=1), after.argmax(axis=1), candidates.argmax(axis=1))
+
+            # 目标：存在嘲讽时只能攻击嘲讽随从，否则在存活随从中均匀随机
+            targets = batch.live()[defenders]
+            taunts = targets & batch.taunt[defenders]
+            targets = np.where(taunts.any(axis=1)[:, None], taunts, targets)
+            choice = (rng.random(len(active)) * targets.sum(axis=1)).astype(np.int16)
+            target_slot = (np.cumsum(targets, axis=1) > choice[:, None]).argmax(axis=1)
+
+            attack = batch.attack[attackers, attacker_slot]
+            counter = batch.attack[defenders, target_slot]
+            attacker_poison = batch.poisonous[attackers, attacker_slot] | batch.venomous[attackers, attacker_slot]
+            target_poison = batch.poisonous[defenders, target_slot] | batch.venomous[defenders, target_slot]
+
+            hurt = self._hit(batch, defenders, target_slot, attack, attacker_poison)
+            cleave = batch.cleave[attackers, attacker_slot]
+            for offset in (-1, 1):
+                neighbour = target_slot + offset
+                valid = cleave & (neighbour >= 0) & (neighbour < batch.count[defenders])
+                hurt |= self._hit(batch, defenders[valid], neighbour[valid], attack[valid],
+                                  attacker_poison[valid], index=np.flatnonzero(valid), size=len(active))
+            counter_hurt = self._hit(batch, attackers, attacker_slot, counter, target_poison)
+            batch.venomous[attackers[hurt], attacker_slot[hurt]] = False
+            batch.venomous[defenders[counter_hurt], target_slot[counter_hurt]] = False
+
+            attacker_died = batch.health[attackers, attacker_slot] <= 0
+            defender_pointer = pointer[defenders]
+            starts = batch.resolve_deaths()
+
+            # 更新攻击指针：存活的攻击者之后的随从下次攻击，风怒随从再攻击一次
+            new_slot = starts[attackers, attacker_slot]
+            again = ~attacker_died & batch.windfury[attackers, np.minimum(new_slot, MAX_BOARD - 1)] & ~extra_attack[active]
+            pointer[attackers] = np.where(attacker_died, starts[attackers, attacker_slot + 1],
+                                          np.where(again, new_slot, new_slot + 1))
+            pointer[defenders] = starts[defenders, defender_pointer]
+            extra_attack[active] = again
+            side[active] = np.where(again, side[active], 1 - side[active])
+
+        self._record(batch, trial_ids, stalled, winner, damage, tier, opponent_tier)
+        return CombatOutcome(
+            winner=winner,
+            damage=damage,
+            steps=steps,
+            elapsed_ms=(time.perf_counter() - started) * 1000,
+        )
+
+    @staticmethod
+    def _record(batch: BoardBatch, trial_ids: np.ndarray, stalled: np.ndarray, winner: np.ndarray,
+                damage: np.ndarray, tier: int, opponent_tier: int):
+        """把批次中各场战斗的当前结果写入原始序号对应的位置（未结束的战斗稍后会被覆盖）"""
+        counts = batch.count.reshape(-1, 2).astype(np.int16)
+        result = np.where(stalled, 0, np.sign(counts[:, 0] - counts[:, 1]) * ((counts == 0).any(axis=1)))
+        tiers = batch.tier.astype(np.int16)
+        tiers[~batch.live()] = 0
+        remaining = tiers.sum(axis=1).reshape(-1, 2)
+        winner[trial_ids] = result
+        damage[trial_ids] = np.where(result > 0, remaining[:, 0] + tier,
+                                     np.where(result < 0, remaining[:, 1] + opponent_tier, 0))
+
+    @staticmethod
+    def _hit(batch: BoardBatch, rows: np.ndarray, slots: np.ndarray, damage: np.ndarray,
+             poison: np.ndarray, index: Optional[np.ndarray] = None, size: Optional[int] = None) -> np.ndarray:
+        """对指定随从造成伤害，返回是否实际造成了生命值伤害（用于烈毒失效）"""
+        dealt = damage > 0
+        shielded = batch.shield[rows, slots]
+        popped = dealt & shielded
+        batch.shield[rows[popped], slots[popped]] = False
+        hurt = dealt & ~shielded
+        batch.health[rows[hurt], slots[hurt]] -= damage[hurt]
+        killed = hurt & poison
+        batch.health[rows[killed], slots[killed]] = 0
+        if index is None:
+            return hurt
+        result = np.zeros(size, dtype=bool)
+        result[index] = hurt
+        return result
+
+    def simulate(self, board: Iterable[Any], opponent: Iterable[Any], trials: int = 1000,
+                 seed: Optional[int] = None, tier: int = 1, opponent_tier: int = 1) -> Dict[str, Any]:
+        """模拟战斗并汇总为胜率和伤害分布"""
+        outcome = self.run(board, opponent, trials, np.random.default_rng(seed), tier, opponent_tier)
+        return summarize(outcome)
+
+
+def summarize(outcome: CombatOutcome) -> Dict[str, Any]:
+    """将原始结果汇总为胜/平/负概率和伤害分布（正数为对手受到的伤害，负数为我方受到的伤害）"""
+    trials = len(outcome.winner)
+    signed = outcome.winner.astype(np.int16) * outcome.damage
+    values, counts = np.unique(signed, return_counts=True)
+    return {
+        "trials": trials,
+        "win": round(float(np.mean(outcome.winner > 0)), 4) if trials else 0.0,
+        "tie": round(float(np.mean(outcome.winner == 0)), 4) if trials else 0.0,
+        "loss": round(float(np.mean(outcome.winner < 0)), 4) if trials else 0.0,
+        "damage": {
+            "expected": round(float(signed.mean()), 3) if trials else 0.0,
+            "dealt": round(float(np.where(signed > 0, signed, 0).mean()), 3) if trials else 0.0,
+            "taken": round(float(np.where(signed < 0, -signed, 0).mean()), 3) if trials else 0.0,
+            "distribution": {int(v): round(float(c) / trials, 4) for v, c in zip(values, counts)},
+        },
+        "steps": outcome.steps,
+        "elapsed_ms": round(outcome.elapsed_ms, 2),
+    }
@@ -0,0 +1,166 @@
+"""
+经济规划器
+按回合收入、酒馆升级费用和随从池价值模型，搜索未来若干回合的升级、刷新和购买决策，给出最佳升级曲线
+"""
+
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from shop_odds import MAX_TIER, SHOP_SLOTS, ShopOdds, get_shop_odds, miss_table
+
+
+BUY_COST = 3
+ROLL_COST = 1
+MAX_GOLD = 10
+MAX_BOARD = 7
+
+# 升到各酒馆等级的基础费用，停留在当前等级的每个回合减少1
+UPGRADE_COSTS = {2: 5, 3: 7, 4: 8, 5: 11, 6: 10}
+MAX_TAVERN = max(UPGRADE_COSTS)
+
+
+def income(turn: int) -> int:
+    """回合开始时的金币"""
+    return min(turn + 2, MAX_GOLD)
+
+
+def upgrade_cost(tier: int, turns_at_tier: int) -> int:
+    """停留在当前等级 ``turns_at_tier`` 个回合后的升级费用"""
+    if tier >= MAX_TAVERN:
+        return 0
+    return max(0, UPGRADE_COSTS[tier + 1] - turns_at_tier)
+
+
+class EconomyPlanner:
+    """按回合搜索升级决策的规划器
+
+    每回合可以升级0次或多次（金币足够时），剩余金币在购买和刷新之间分配：每次购买的随从价值取
+    若干次商店中最好的随从的期望价值（由随从池的超几何分布精确计算），场面保留价值最高的7个随从。
+    目标为规划期内每回合战斗时场面价值之和，规划期之后再按不升级的方式估算 ``tail_turns`` 个回合。
+    升级分支用深度优先搜索，相同状态（回合、等级、升级费用、场面）的结果记忆化。
+    """
+
+    def __init__(self, odds: Optional[ShopOdds] = None, horizon: int = 5, tail_turns: int = 2,
+                 max_buys: int = 3):
+        self.odds = odds or get_shop_odds()
+        self.horizon = horizon
+        self.tail_turns = tail_turns
+        self.max_buys = max_buys
+        card_db = self.odds.card_db
+        # 随从价值：基础攻击力与生命值之和
+        self.values = card_db.attack.astype(np.float64) + card_db.health
+        self._distinct, self._inverse = np.unique(self.values, return_inverse=True)
+        self._quality: Dict[Tuple[int, int], float] = {}
+        for tier in range(1, MAX_TIER + 1):
+            for shops in range(1, MAX_GOLD + 2):
+                self.quality(tier, shops)
+
+    def quality(self, tier: int, shops: int) -> float:
+        """在 ``shops`` 次商店（每次刷新一次）中看到的最好随从的期望价值"""
+        key = (tier, shops)
+        cached = self._quality.get(key)
+        if cached is None:
+            available = np.where(self.odds.card_db.tier <= tier, self.odds.copies, 0)
+            total = int(available.sum())
+            values = self._distinct
+            copies = np.bincount(self._inverse, weights=available, minlength=len(values)).astype(np.int64)
+            # 价值高于各取值的份数，一次商店中最好的随从不超过该取值的概率为 P(份数)
+            above = total - np.cumsum(copies)
+            at_most = miss_table(total, SHOP_SLOTS[tier])[above] ** shops
+            cached = float((values * np.diff(at_most, prepend=0.0)).sum()) if total else 0.0
+            self._quality[key] = cached
+        return cached
+
+    def minion_value(self, minion: Dict[str, Any]) -> float:
+        """场上随从的价值：识别到的属性，缺失时使用卡牌数据"""
+        value = (minion.get("attack") or 0) + (minion.get("health") or 0)
+        if not value:
+            value = float(self.values[self.odds.card_db.minion_index(minion.get("name", ""))])
+        return float(value)
+
+    def _spend(self, tier: int, gold: int, board: Tuple[float, ...]) -> Tuple[int, int, Tuple[float, ...]]:
+        """把剩余金币分配给购买和刷新，返回场面价值最高的（购买数, 刷新数, 新场面）"""
+        best = (0, gold, board)
+        best_value = sum(board)
+        for buys in range(1, min(gold // BUY_COST, self.max_buys) + 1):
+            rolls = (gold - buys * BUY_COST) // ROLL_COST
+            value = round(self.quality(tier, 1 + rolls // buys), 1)
+            new_board = tuple(sorted(board + (value,) * buys, reverse=True)[:MAX_BOARD])
+            if sum(new_board) > best_value:
+                best, best_value = (buys, rolls, new_board), sum(new_board)
+        return best
+
+    def _tail(self, turn: int, tier: int, board: Tuple[float, ...]) -> float:
+        """规划期之后不再升级的若干回合的场面价值之和"""
+        total = 0.0
+        for offset in range(self.tail_turns):
+            _, _, board = self._spend(tier, income(turn + offset), board)
+            total += sum(board)
+        return total
+
+    def _search(self, step: int, turn: int, gold: int, tier: int, cost: int, board: Tuple[float, ...],
+                memo: Dict) -> Tuple[float, List[Dict[str, Any]]]:
+        """从第 ``step`` 个规划回合开始的最佳得分和决策序列"""
+        if step == self.horizon:
+            return self._tail(turn, tier, board), []
+        key = (step, tier, cost, board)
+        if key in memo:
+            return memo[key]
+        best: Tuple[float, List[Dict[str, Any]]] = (-1.0, [])
+        levels, remaining, level_tier, level_cost = 0, gold, tier, cost
+        while True:
+            buys, rolls, new_board = self._spend(level_tier, remaining, board)
+            future, actions = self._search(step + 1, turn + 1, income(turn + 1), level_tier,
+                                           upgrade_cost(level_tier, 1) if levels else max(0, level_cost - 1),
+                                           new_board, memo)
+            score = sum(new_board) + future
+            if score > best[0]:
+                action = {"turn": turn, "gold": gold, "level": levels, "tier": level_tier,
+                          "buys": buys, "rolls": rolls, "board_value": round(sum(new_board), 1)}
+                best = (score, [action] + actions)
+            if level_tier >= MAX_TAVERN or level_cost > remaining:
+                break
+            remaining -= level_cost
+            level_tier += 1
+            level_cost = upgrade_cost(level_tier, 0)
+            levels += 1
+        memo[key] = best
+        return best
+
+    def plan(self, turn: int, gold: int, tier: int, cost: Optional[int] = None,
+             board: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """规划未来 ``horizon`` 个回合；``cost`` 缺省为当前等级刚升级时的费用"""
+        started = time.perf_counter()
+        if turn < 1 or gold < 0 or not 1 <= tier <= MAX_TAVERN:
+            raise ValueError("回合、金币或酒馆等级无效")
+        cost = upgrade_cost(tier, 0) if cost is None else max(0, int(cost))
+        values = tuple(sorted((round(self.minion_value(m), 1) for m in board), reverse=True)[:MAX_BOARD])
+        memo: Dict = {}
+        score, actions = self._search(0, turn, gold, tier, cost, values, memo)
+        # 与本回合不升级（或本回合升级）的最佳方案比较，用于说明升级的收益
+        alternative = None
+        if tier < MAX_TAVERN and cost <= gold:
+            if actions[0]["level"]:
+                buys, rolls, new_board = self._spend(tier, gold, values)
+                future, _ = self._search(1, turn + 1, income(turn + 1), tier, max(0, cost - 1), new_board, memo)
+            else:
+                new_tier, new_gold = tier + 1, gold - cost
+                buys, rolls, new_board = self._spend(new_tier, new_gold, values)
+                future, _ = self._search(1, turn + 1, income(turn + 1), new_tier, upgrade_cost(new_tier, 1),
+                                         new_board, memo)
+            alternative = round(sum(new_board) + future, 1)
+        return {
+            "turn": turn,
+            "gold": gold,
+            "tier": tier,
+            "upgrade_cost": cost,
+            "level_now": actions[0]["level"] > 0,
+            "plan": actions,
+            "curve": [action["tier"] for action in actions],
+            "score": round(score, 1),
+            "alternative": alternative,
+            "states": len(memo),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
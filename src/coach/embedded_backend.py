@@ -0,0 +1,160 @@
+"""
+进程内MCP后端
+在MCP服务器进程中直接运行识别流水线，工具调用读取共享内存中的状态，不经过HTTP
+"""
+
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from mcp_interface import MCPInterface
+from main import GameRecognitionSystem
+from websocket_service import (WebSocketManager, archive_stats, metrics_snapshot, optimize_position, plan_economy,
+                               run_profile, run_simulation, search_cards, service_status, shop_odds,
+                               speculative_advice)
+
+
+class ManagerStateSource:
+    """直接读取WebSocketManager最新状态的状态源（与GameStateCache接口一致）"""
+
+    source = "embedded"
+
+    def __init__(self, system: GameRecognitionSystem):
+        self.system = system
+        self.manager: WebSocketManager = system.websocket_manager
+        self._cached_state: Optional[Dict[str, Any]] = None
+        self._cached_for = None
+
+    @property
+    def connected(self) -> bool:
+        """识别循环是否在运行"""
+        return self.system.running
+
+    def start(self):
+        """进程内状态无需订阅"""
+
+    def stop(self):
+        """进程内状态无需订阅"""
+
+    def fetch(self) -> bool:
+        """进程内状态始终是最新的"""
+        return self.manager.last_game_state is not None
+
+    def snapshot(self) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+        """读取最新状态及其距离识别完成的毫秒数"""
+        game_state = self.manager.last_game_state
+        published_at = self.manager.last_published_at
+        if game_state is None or published_at is None:
+            return None, None
+        # 同一状态只转换一次字典
+        if self._cached_for is not game_state:
+            self._cached_state = game_state.to_dict()
+            self._cached_for = game_state
+        return self._cached_state, (time.monotonic() - published_at) * 1000
+
+
+class EmbeddedMCPInterface(MCPInterface):
+    """进程内MCP接口：识别流水线与工具调用运行在同一进程"""
+
+    def __init__(self, autostart: bool = False):
+        super().__init__()
+        self.system = GameRecognitionSystem()
+        self.manager = self.system.websocket_manager
+        self.state_cache = ManagerStateSource(self.system)
+        if autostart:
+            self.system.start_recognition_loop()
+
+    def _start_recognition(self) -> Dict[str, Any]:
+        """启动进程内识别循环"""
+        if self.system.running:
+            return {"status": "success", "message": "识别循环已在运行"}
+        self.system.start_recognition_loop()
+        return {"status": "success", "message": "识别循环已启动"}
+
+    def _stop_recognition(self) -> Dict[str, Any]:
+        """停止进程内识别循环"""
+        if not self.system.running:
+            return {"status": "success", "message": "识别循环未运行"}
+        self.system.stop_recognition_loop()
+        return {"status": "success", "message": "识别循环已停止"}
+
+    def _get_recognition_status(self) -> Dict[str, Any]:
+        """识别状态"""
+        status = service_status()
+        status["mode"] = "embedded"
+        status["recognition_running"] = self.system.running
+        return status
+
+    def _query_history(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """直接查询内存中的状态历史"""
+        query = {key: parameters[key] for key in ("since", "until", "turn", "event", "limit")
+                 if parameters.get(key) is not None}
+        try:
+            records = self.manager.history.query(**query)
+        except ValueError as e:
+            return {"error": str(e)}
+        return {"records": records, "history": self.manager.history.stats()}
+
+    def _query_archive(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """直接查询对局存档"""
+        query_type = parameters.get("query", "hero_stats")
+        filters = {key: parameters.get(key) for key in ("hero", "tribe", "since", "until")}
+        try:
+            if query_type == "games":
+                return {"games": self.manager.archive.list_games(limit=parameters.get("limit") or 50, **filters)}
+            groups = {"hero_stats": "hero", "tribe_stats": "tribe", "tier_up_turns": "tier_up"}
+            if query_type not in groups:
+                return {"error": f"未知查询类型: {query_type}"}
+            return archive_stats(groups[query_type], **filters)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def _get_metrics(self) -> Dict[str, Any]:
+        """直接读取进程内的流水线指标"""
+        return metrics_snapshot()
+
+    def _profile(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """直接对进程内的识别线程采样"""
+        try:
+            return run_profile(parameters)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def _search_cards(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """直接查询进程内的卡牌搜索索引"""
+        filters = {key: parameters.get(key) for key in ("tier", "tribe", "keyword", "kind")}
+        try:
+            return search_cards(parameters.get("query", ""), limit=parameters.get("limit") or 10, **filters)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def _simulate_combat(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """直接调用进程内的模拟服务"""
+        try:
+            return run_simulation(parameters)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def _optimize_position(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """直接调用进程内的站位优化器"""
+        try:
+            return optimize_position(parameters)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def _shop_odds(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """直接调用进程内的商店概率引擎"""
+        try:
+            return shop_odds(parameters)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def _plan_economy(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """直接调用进程内的经济规划器"""
+        try:
+            return plan_economy(parameters)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def _speculative_advice(self, kind: str) -> Optional[Dict[str, Any]]:
+        """直接读取后台预先计算的建议"""
+        return speculative_advice(kind)
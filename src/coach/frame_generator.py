@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+合成带标注的识别帧
+把 static/media 下已知的随从和英雄模板按识别引擎的ROI布局放入画面，随机施加尺度抖动、金色色调、
+空位置、模糊和JPEG压缩，输出帧文件和逐帧的真实标注（labels.json），用于识别基准和阈值调整
+
+用法:
+    python frame_generator.py corpus/ --count 20000
+    python frame_generator.py corpus/ --count 5000 --resolution 1920x1080 --resolution 1280x720
+    python frame_generator.py corpus/ --count 100 --format png --blur-rate 0 --jpeg-rate 0
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from recognition_engine import ROIS, TemplateManager
+
+
+# ROI布局的基准分辨率，其他分辨率由基准画面按比例缩放得到
+BASE_SIZE = (1920, 1080)
+# 每个区域的随从位置数，与 recognize_minions 的网格分割一致
+SLOTS = 7
+# 金色色调（BGR）
+GOLD = (0, 200, 255)
+FORMATS = ("jpg", "png")
+
+
+@dataclass
+class GeneratorConfig:
+    """合成参数，各概率均为每帧（或每个位置）独立抽样"""
+    seed: int = 0
+    resolutions: List[Tuple[int, int]] = field(default_factory=lambda: [BASE_SIZE])
+    scale_jitter: float = 0.1       # 模板尺度在 1±scale_jitter 内均匀抽样
+    empty_rate: float = 0.3         # 随从位置留空的概率
+    golden_rate: float = 0.1        # 非金色随从加金色色调（干扰）的概率
+    combat_rate: float = 0.2        # 战斗阶段帧（对手英雄和场面，无商店）的比例
+    blur_rate: float = 0.3          # 整帧高斯模糊的概率
+    max_blur_sigma: float = 1.5
+    jpeg_rate: float = 0.5          # JPEG压缩的概率
+    jpeg_quality: Tuple[int, int] = (30, 90)
+
+    def validate(self):
+        """参数无效时抛出ValueError"""
+        for name in ("empty_rate", "golden_rate", "combat_rate", "blur_rate", "jpeg_rate"):
+            if not 0 <= getattr(self, name) <= 1:
+                raise ValueError(f"{name} 应在0到1之间")
+        if not 0 <= self.scale_jitter < 1:
+            raise ValueError("scale_jitter 应在0到1之间")
+        low, high = self.jpeg_quality
+        if not 1 <= low <= high <= 100:
+            raise ValueError("jpeg_quality 应为1到100之间的区间")
+        if not self.resolutions or any(w <= 0 or h <= 0 for w, h in self.resolutions):
+            raise ValueError("分辨率无效")
+
+
+def parse_resolution(text: str) -> Tuple[int, int]:
+    """解析 "宽x高" 形式的分辨率"""
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"分辨率格式应为 宽x高: {text}")
+    return width, height
+
+
+def _place(frame: np.ndarray, image: np.ndarray, x: int, y: int, w: int, h: int):
+    """把图像居中放入帧的 (x, y, w, h) 区域，超出区域的部分裁掉"""
+    ih, iw = image.shape[:2]
+    dx, dy = (w - iw) // 2, (h - ih) // 2
+    sx, sy = max(0, -dx), max(0, -dy)
+    tx, ty = x + max(0, dx), y + max(0, dy)
+    cw, ch = min(iw - sx, w - max(0, dx)), min(ih - sy, h - max(0, dy))
+    frame[ty:ty + ch, tx:tx + cw] = image[sy:sy + ch, sx:sx + cw]
+
+
+class FrameGenerator:
+    """按索引确定地合成帧：同一种子和索引总是得到同一帧，与生成顺序和进程数无关"""
+
+    def __init__(self, config: Optional[GeneratorConfig] = None, template_dir: str = "static/media",
+                 rois: Optional[Dict[str, Tuple[int, int, int, int]]] = None):
+        self.config = config or GeneratorConfig()
+        self.config.validate()
+        self.rois = dict(rois or ROIS)
+        templates = TemplateManager(template_dir).templates
+        self.templates = templates
+        self.minions = sorted(k for k in templates if k.startswith("minion_"))
+        self.heroes = sorted(k for k in templates if k.startswith("hero_"))
+        if not self.minions or not self.heroes:
+            raise ValueError(f"模板目录中没有随从或英雄模板: {template_dir}")
+
+    def _crop(self, template_id: str, w: int, h: int, scale: float) -> np.ndarray:
+        """模板按 ``scale`` 缩放后中央 w×h 的部分；只缩放会留在区域内的那部分模板"""
+        template = self.templates[template_id]
+        th, tw = template.shape[:2]
+        cw, ch = min(tw, int(np.ceil(w / scale)) + 2), min(th, int(np.ceil(h / scale)) + 2)
+        cx, cy = (tw - cw) // 2, (th - ch) // 2
+        crop = template[cy:cy + ch, cx:cx + cw]
+        size = (max(1, int(round(cw * scale))), max(1, int(round(ch * scale))))
+        return cv2.resize(crop, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+    def _background(self, rng: np.random.Generator) -> np.ndarray:
+        """深色背景：低频色块插值加细噪声"""
+        width, height = BASE_SIZE
+        coarse = rng.integers(10, 60, (9, 16, 3), dtype=np.uint8)
+        frame = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+        # 平铺一小块噪声并原地相加，整帧只分配两次
+        noise = rng.integers(0, 12, (height // 8, width // 8, 3), dtype=np.uint8)
+        return cv2.add(frame, np.tile(noise, (8, 8, 1)), dst=frame)
+
+    def _minions(self, frame: np.ndarray, roi_name: str, rng: np.random.Generator) -> List[Dict[str, Any]]:
+        """在区域的各位置随机放入随从，返回标注"""
+        config = self.config
+        x, y, w, h = self.rois[roi_name]
+        slot_width = w // SLOTS
+        minions = []
+        for position in range(SLOTS):
+            if rng.random() < config.empty_rate:
+                continue
+            template_id = self.minions[rng.integers(len(self.minions))]
+            scale = float(rng.uniform(1 - config.scale_jitter, 1 + config.scale_jitter))
+            image = self._crop(template_id, slot_width, h, scale)
+            name = template_id[len("minion_"):]
+            # 是否金色由模板决定（金色模板名以_gold结尾）；色调只是干扰，只加在非金色模板上
+            golden = name.endswith("_gold")
+            tinted = bool(rng.random() < config.golden_rate) and not golden
+            if tinted:
+                alpha = float(rng.uniform(0.15, 0.35))
+                image = cv2.addWeighted(image, 1 - alpha, np.full_like(image, GOLD), alpha, 0)
+            _place(frame, image, x + position * slot_width, y, slot_width, h)
+            minions.append({"position": position, "name": name, "golden": golden, "tinted": tinted,
+                            "scale": round(scale, 4)})
+        return minions
+
+    def _hero(self, frame: np.ndarray, roi_name: str, rng: np.random.Generator) -> str:
+        """在区域放入随机英雄，返回英雄模板名"""
+        config = self.config
+        x, y, w, h = self.rois[roi_name]
+        template_id = self.heroes[rng.integers(len(self.heroes))]
+        scale = float(rng.uniform(1 - config.scale_jitter, 1 + config.scale_jitter))
+        _place(frame, self._crop(template_id, w, h, scale), x, y, w, h)
+        return template_id[len("hero_"):]
+
+    def compose(self, index: int) -> Tuple[np.ndarray, Dict[str, Any], Optional[int]]:
+        """合成第 ``index`` 帧（未压缩），返回帧、标注和抽到的JPEG质量（不压缩时为None）"""
+        config = self.config
+        rng = np.random.default_rng([config.seed, index])
+        frame = self._background(rng)
+        labels: Dict[str, Any] = {"index": index}
+
+        if rng.random() < config.combat_rate:
+            labels["phase"] = "combat"
+            labels["shop"] = []
+            labels["opponent"] = {"hero": self._hero(frame, "opponent_hero", rng),
+                                  "minions": self._minions(frame, "opponent_board", rng)}
+        else:
+            labels["phase"] = "recruit"
+            labels["shop"] = self._minions(frame, "shop", rng)
+            labels["opponent"] = None
+        labels["board"] = self._minions(frame, "board", rng)
+        labels["hero"] = self._hero(frame, "hero", rng)
+
+        width, height = config.resolutions[index % len(config.resolutions)]
+        if (width, height) != BASE_SIZE:
+            fx, fy = width / BASE_SIZE[0], height / BASE_SIZE[1]
+            frame = cv2.resize(frame, (width, height),
+                               interpolation=cv2.INTER_AREA if fx * fy < 1 else cv2.INTER_LINEAR)
+            rois = {name: [round(x * fx), round(y * fy), round(w * fx), round(h * fy)]
+                    for name, (x, y, w, h) in self.rois.items()}
+        else:
+            rois = {name: list(roi) for name, roi in self.rois.items()}
+        labels["width"], labels["height"], labels["rois"] = width, height, rois
+
+        sigma = 0.0
+        if rng.random() < config.blur_rate:
+            sigma = float(rng.uniform(0.3, config.max_blur_sigma))
+            frame = cv2.GaussianBlur(frame, (0, 0), sigma)
+        labels["blur_sigma"] = round(sigma, 3)
+        quality = None
+        if rng.random() < config.jpeg_rate:
+            quality = int(rng.integers(config.jpeg_quality[0], config.jpeg_quality[1] + 1))
+        labels["jpeg_quality"] = quality
+        return frame, labels, quality
+
+    def generate(self, index: int) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """合成第 ``index`` 帧，抽到JPEG压缩时在内存中编解码一次"""
+        frame, labels, quality = self.compose(index)
+        if quality is not None:
+            _, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        return frame, labels
+
+    def encode(self, index: int, fmt: str = "jpg", save_quality: int = 95) -> Tuple[bytes, Dict[str, Any]]:
+        """合成第 ``index`` 帧并编码为文件内容
+
+        jpg格式只编码一次：抽到JPEG压缩时直接用抽到的质量，否则用 ``save_quality``，
+        标注中的 ``jpeg_quality`` 记录文件实际的压缩质量；png格式先在内存中做JPEG编解码再无损保存。
+        """
+        if fmt == "png":
+            frame, labels = self.generate(index)
+            params = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+        else:
+            frame, labels, quality = self.compose(index)
+            labels["jpeg_quality"] = quality or save_quality
+            params = [cv2.IMWRITE_JPEG_QUALITY, labels["jpeg_quality"]]
+        ok, data = cv2.imencode(f".{fmt}", frame, params)
+        if not ok:
+            raise ValueError(f"编码失败: {fmt}")
+        return data.tobytes(), labels
+
+
+# 每个工作进程持有一个生成器，避免每个任务重复加载模板
+_generator: Optional[FrameGenerator] = None
+
+
+def _init_worker(config: GeneratorConfig, template_dir: str):
+    """工作进程初始化：加载模板"""
+    global _generator
+    # 进程间已经并行，限制OpenCV内部线程避免过度订阅
+    cv2.setNumThreads(1)
+    _generator = FrameGenerator(config, template_dir)
+
+
+def _write_frames(task: Tuple[str, int, int, str]) -> List[Dict[str, Any]]:
+    """合成并写出一段连续索引的帧（在工作进程中运行），只把标注传回主进程"""
+    directory, start, count, fmt = task
+    records = []
+    for index in range(start, start + count):
+        data, labels = _generator.encode(index, fmt)
+        labels["file"] = f"{index:06d}.{fmt}"
+        with open(os.path.join(directory, labels["file"]), "wb") as f:
+            f.write(data)
+        records.append(labels)
+    return records
+
+
+def run(directory: Path, count: int, config: GeneratorConfig, workers: int, chunk_size: int,
+        fmt: str = "jpg", template_dir: str = "static/media") -> Dict[str, Any]:
+    """生成 ``count`` 帧到目录并写出 labels.json"""
+    config.validate()
+    directory.mkdir(parents=True, exist_ok=True)
+    frames: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    last_report = started
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(config, template_dir)) as executor:
+        # 有界的在途任务窗口，按提交顺序取回标注
+        pending = deque()
+        max_pending = workers * 2
+
+        def drain_one():
+            nonlocal last_report
+            frames.extend(pending.popleft().result())
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                print(f"已生成 {len(frames)} 帧，{len(frames) / (now - started):.1f} 帧/秒", file=sys.stderr)
+                last_report = now
+
+        for start in range(0, count, chunk_size):
+            pending.append(executor.submit(_write_frames, (str(directory), start,
+                                                           min(chunk_size, count - start), fmt)))
+            if len(pending) >= max_pending:
+                drain_one()
+        while pending:
+            drain_one()
+
+    config_dict = asdict(config)
+    with open(directory / "labels.json", "w", encoding="utf-8") as f:
+        json.dump({"config": config_dict, "format": fmt, "frames": frames}, f, ensure_ascii=False)
+    elapsed = time.perf_counter() - started
+    return {
+        "frames": len(frames),
+        "seconds": round(elapsed, 2),
+        "fps": round(len(frames) / elapsed, 1) if elapsed > 0 else 0.0,
+        "workers": workers,
+    }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="按识别ROI布局合成带标注的帧")
+    parser.add_argument("output", type=Path, help="输出目录（帧文件和labels.json）")
+    parser.add_argument("-n", "--count", type=int, default=1000, help="帧数")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 4, help="工作进程数")
+    parser.add_argument("--chunk-size", type=int, default=64, help="每个任务包含的帧数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--resolution", action="append", default=[],
+                        help="输出分辨率（宽x高，可重复，按帧轮换），默认1920x1080")
+    parser.add_argument("--format", choices=FORMATS, default="jpg", help="帧文件格式")
+    parser.add_argument("--templates", default="static/media", help="模板目录")
+    defaults = GeneratorConfig()
+    parser.add_argument("--scale-jitter", type=float, default=defaults.scale_jitter, help="模板尺度抖动幅度")
+    parser.add_argument("--empty-rate", type=float, default=defaults.empty_rate, help="随从位置留空的概率")
+    parser.add_argument("--golden-rate", type=float, default=defaults.golden_rate, help="非金色随从加金色色调的概率")
+    parser.add_argument("--combat-rate", type=float, default=defaults.combat_rate, help="战斗阶段帧的比例")
+    parser.add_argument("--blur-rate", type=float, default=defaults.blur_rate, help="高斯模糊的概率")
+    parser.add_argument("--max-blur-sigma", type=float, default=defaults.max_blur_sigma, help="最大模糊sigma")
+    parser.add_argument("--jpeg-rate", type=float, default=defaults.jpeg_rate, help="JPEG压缩的概率")
+    parser.add_argument("--jpeg-quality", default="30-90", help="JPEG质量区间（如30-90）")
+    args = parser.parse_args()
+
+    try:
+        low, high = (int(part) for part in args.jpeg_quality.split("-"))
+        config = GeneratorConfig(
+            seed=args.seed,
+            resolutions=[parse_resolution(text) for text in args.resolution] or [BASE_SIZE],
+            scale_jitter=args.scale_jitter,
+            empty_rate=args.empty_rate,
+            golden_rate=args.golden_rate,
+            combat_rate=args.combat_rate,
+            blur_rate=args.blur_rate,
+            max_blur_sigma=args.max_blur_sigma,
+            jpeg_rate=args.jpeg_rate,
+            jpeg_quality=(low, high),
+        )
+        config.validate()
+    except ValueError as e:
+        parser.error(str(e))
+    if args.count <= 0:
+        parser.error("帧数应为正数")
+
+    summary = run(args.output, args.count, config, args.workers, max(1, args.chunk_size),
+                  args.format, args.templates)
+    print(f"完成: {summary['frames']} 帧，耗时 {summary['seconds']} 秒，"
+          f"{summary['fps']} 帧/秒，{summary['workers']} 个进程", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
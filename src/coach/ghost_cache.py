@@ -0,0 +1,218 @@
+"""
+对手场面缓存
+战斗阶段记录每个对手的场面（幽灵场面），下一个招募阶段由后台线程预先计算我方场面对各个对手的胜率
+和最佳站位，玩家请求站位建议时直接返回已算好的结果
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from recognition_engine import GameState
+from simulation_service import SimulationService, get_simulation_service
+
+
+@dataclass
+class GhostBoard:
+    """一个对手最近一次战斗中的场面"""
+    hero: str
+    minions: List[Dict[str, Any]]
+    turn: int
+    combat: int                      # 记录时的战斗序号
+    seen_at: str
+    updated_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def tier(self) -> int:
+        """对手酒馆等级的估计值（场上随从的最高等级）"""
+        return max((int(minion.get("tier") or 1) for minion in self.minions), default=1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可JSON序列化的字典"""
+        return {"hero": self.hero, "minions": self.minions, "turn": self.turn, "tier": self.tier,
+                "seen_at": self.seen_at}
+
+
+def board_signature(minions: List[Dict[str, Any]]) -> Tuple:
+    """场面的签名：随从顺序、名称、属性和状态"""
+    return tuple((m.get("name", ""), m.get("attack", 0), m.get("health", 0), bool(m.get("golden")),
+                  bool(m.get("divine_shield")), bool(m.get("reborn"))) for m in minions)
+
+
+class GhostCache:
+    """按对手英雄保存最近一次战斗的场面
+
+    同一场战斗中随从会陆续死亡，因此只在场面随从数增加（战斗开始时的完整场面）或进入新的战斗时更新。
+    超过 ``max_age_turns`` 回合未再遇到的对手会被淘汰。
+    """
+
+    def __init__(self, capacity: int = 7, max_age_turns: int = 4):
+        self.capacity = capacity
+        self.max_age_turns = max_age_turns
+        self._ghosts: Dict[str, GhostBoard] = {}
+        self._lock = threading.Lock()
+        self._phase = "recruit"
+        self.combats = 0
+        self.version = 0
+
+    def observe(self, game_state: GameState) -> bool:
+        """根据识别结果更新缓存，返回缓存是否发生变化"""
+        with self._lock:
+            if game_state.phase != self._phase:
+                self._phase = game_state.phase
+                if game_state.phase == "combat":
+                    self.combats += 1
+            opponent = game_state.opponent
+            if game_state.phase != "combat" or not opponent or not opponent.get("minions"):
+                return False
+            hero = opponent.get("hero") or "Unknown"
+            minions = opponent["minions"]
+            ghost = self._ghosts.get(hero)
+            if ghost is not None and ghost.combat == self.combats and len(minions) <= len(ghost.minions):
+                return False
+            self._ghosts[hero] = GhostBoard(hero, minions, game_state.turn, self.combats, game_state.timestamp)
+            self._evict(game_state.turn)
+            self.version += 1
+            return True
+
+    def _evict(self, turn: int):
+        """淘汰过期的对手，超过容量时淘汰最久未更新的对手"""
+        for hero, ghost in list(self._ghosts.items()):
+            if turn - ghost.turn > self.max_age_turns:
+                del self._ghosts[hero]
+        while len(self._ghosts) > self.capacity:
+            oldest = min(self._ghosts.values(), key=lambda ghost: ghost.updated_at)
+            del self._ghosts[oldest.hero]
+
+    def ghosts(self) -> List[GhostBoard]:
+        """缓存中的对手场面（最近记录的在前）"""
+        with self._lock:
+            return sorted(self._ghosts.values(), key=lambda ghost: ghost.updated_at, reverse=True)
+
+    def clear(self):
+        """新的一局开始时清空"""
+        with self._lock:
+            self._ghosts.clear()
+            self._phase = "recruit"
+            self.version += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存状态"""
+        return {"opponents": len(self._ghosts), "combats": self.combats, "version": self.version,
+                "phase": self._phase}
+
+
+class GhostPrecomputer:
+    """招募阶段后台预计算我方场面对缓存中各个对手的胜率和最佳站位
+
+    识别线程每帧调用 ``submit``，只保留最新的待计算任务；场面和对手缓存都未变化时不重复计算。
+    模拟结果同时写入置换表，请求同一对战时也能直接命中。
+    """
+
+    def __init__(self, ghosts: GhostCache, optimizer=None, service: Optional[SimulationService] = None,
+                 trials: int = 2000, deadline_ms: float = 500.0):
+        self.ghosts = ghosts
+        self.optimizer = optimizer
+        self.service = service
+        self.trials = trials
+        self.deadline_ms = deadline_ms
+        self.latest: Optional[Dict[str, Any]] = None
+        self.computed = 0
+        self.failures = 0
+        self._pending: Optional[Tuple[Tuple, List[Dict[str, Any]], int]] = None
+        self._submitted: Optional[Tuple] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _key(self, board: List[Dict[str, Any]], tier: int) -> Tuple:
+        """任务键：我方场面、酒馆等级和对手缓存版本"""
+        return board_signature(board), tier, self.ghosts.version
+
+    def submit(self, game_state: GameState) -> bool:
+        """招募阶段提交预计算任务，返回是否产生了新任务"""
+        board = game_state.board.get("minions", [])
+        if game_state.phase != "recruit" or not board or not self.ghosts.ghosts():
+            return False
+        key = self._key(board, game_state.tavern_tier)
+        with self._lock:
+            if key == self._submitted:
+                return False
+            self._submitted = key
+            self._pending = (key, board, game_state.tavern_tier)
+        self._start()
+        self._wakeup.set()
+        return True
+
+    def _start(self):
+        """按需启动后台线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._worker, daemon=True, name="ghost-precompute")
+        self._thread.start()
+
+    def _worker(self):
+        """后台线程：每次计算最新提交的任务"""
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                job, self._pending = self._pending, None
+                self._wakeup.clear()
+            if job is None:
+                continue
+            try:
+                self.latest = self.compute(*job)
+                self.computed += 1
+            except Exception as e:
+                self.failures += 1
+                print(f"对手场面预计算失败: {e}")
+
+    def compute(self, key: Tuple, board: List[Dict[str, Any]], tier: int) -> Dict[str, Any]:
+        """计算我方场面对各个对手的胜率，我方随从多于1个时同时搜索最佳站位"""
+        started = time.perf_counter()
+        service = self.service or get_simulation_service()
+        ghosts = self.ghosts.ghosts()
+        odds = []
+        for ghost in ghosts:
+            summary = service.simulate(board, ghost.minions, trials=self.trials, tier=tier,
+                                       opponent_tier=ghost.tier)
+            odds.append({
+                "hero": ghost.hero,
+                "turn": ghost.turn,
+                "win": summary["win"],
+                "tie": summary["tie"],
+                "loss": summary["loss"],
+                "expected_damage": summary["damage"]["expected"],
+                "trials": summary["trials"],
+            })
+        position = None
+        if self.optimizer is not None and len(board) > 1:
+            position = self.optimizer.optimize(board, [ghost.minions for ghost in ghosts],
+                                               deadline_ms=self.deadline_ms, tier=tier)
+            position["ghosts"] = [ghost.hero for ghost in ghosts]
+        return {
+            "key": key,
+            "odds": odds,
+            "position": position,
+            "computed_at": time.monotonic(),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    def lookup(self, board: List[Dict[str, Any]], tier: int) -> Optional[Dict[str, Any]]:
+        """已为该场面和当前对手缓存算好的结果，附带结果的已存在毫秒数"""
+        latest = self.latest
+        if latest is None or latest["key"] != self._key(board, tier):
+            return None
+        result = dict(latest)
+        result["age_ms"] = round((time.monotonic() - latest["computed_at"]) * 1000, 1)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """预计算统计"""
+        return {
+            "computed": self.computed,
+            "failures": self.failures,
+            "pending": self._pending is not None,
+            "last_elapsed_ms": self.latest["elapsed_ms"] if self.latest else None,
+        }
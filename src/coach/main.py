@@ -16,17 +16,19 @@ from typing import Optional
 # 添加当前目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from recognition_engine import RecognitionEngine
-from websocket_service import WebSocketManager
-from overlay_coach import CoachApp
+from websocket_service import websocket_manager
+from recognition_engine import fit_frame
+from metrics import get_metrics
 
 
 class GameRecognitionSystem:
     """游戏识别系统主类"""
     
     def __init__(self):
-        self.recognition_engine = RecognitionEngine()
-        self.websocket_manager = WebSocketManager()
+        # 与WebSocket服务共用同一个管理器，识别结果才能推送给已连接的客户端
+        self.websocket_manager = websocket_manager
+        self.recognition_engine = websocket_manager.recognition_engine
+        self.metrics = get_metrics()
         self.running = False
         self.recognition_thread = None
         
@@ -36,8 +38,11 @@ class GameRecognitionSystem:
     
     def start_recognition_loop(self):
         """启动识别循环"""
+        if self.running:
+            return
         self.running = True
-        self.recognition_thread = threading.Thread(target=self._recognition_worker, daemon=True)
+        self.recognition_thread = threading.Thread(target=self._recognition_worker, daemon=True,
+                                                   name="recognition-worker")
         self.recognition_thread.start()
         print("识别循环已启动")
     
@@ -53,10 +58,14 @@ class GameRecognitionSystem:
         while self.running:
             try:
                 # 截取屏幕
+                started = time.perf_counter()
                 frame = self._capture_screen()
+                self.metrics.observe("capture", time.perf_counter() - started)
                 if frame is not None:
                     # 处理帧
                     asyncio.run(self.websocket_manager.process_frame(frame))
+                else:
+                    self.metrics.inc("coach_frames_dropped_total", reason="capture")
                 
                 # 控制识别频率
                 time.sleep(0.1)  # 100ms间隔
@@ -116,6 +125,8 @@ class GameRecognitionSystem:
             
             # 转换颜色空间（BGR -> RGB）
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # ROI按1920x1080定义，其他分辨率的屏幕先缩放
+            frame = fit_frame(frame)
             
             # 清理资源
             gdi32.DeleteObject(hbm)
@@ -136,6 +147,7 @@ class GameRecognitionSystem:
     def start_overlay(self):
         """启动Overlay界面"""
         try:
+            from overlay_coach import CoachApp
             app = CoachApp()
             app.exec()
         except Exception as e:
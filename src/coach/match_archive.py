@@ -0,0 +1,404 @@
+"""
+对局存档模块
+将结束的对局按列追加写入磁盘，按英雄、终局种族和日期建立索引，支持毫秒级聚合查询；
+自动存档的对局名次未知（0），只有通过 ``finish_session`` 给出名次的对局计入胜率统计
+"""
+
+import json
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from card_database import CardDatabase, TRIBE_BITS, get_card_database, tribes_from_mask
+
+
+MAX_SLOTS = 7
+MAX_TIER = 6
+
+# 对局表：每局一行。宽度大于1的列按 (行数, 宽度) 存储
+GAME_COLUMNS = {
+    "game_id": (np.int32, 1),
+    "started_at": (np.float64, 1),
+    "ended_at": (np.float64, 1),
+    "day": (np.int32, 1),           # 本地日期，自1970-01-01起的天数
+    "hero": (np.int32, 1),          # 英雄卡牌ID，0表示未识别
+    "placement": (np.int8, 1),      # 最终名次，0表示未知
+    "turns": (np.int16, 1),
+    "final_tier": (np.int8, 1),
+    "tier_up": (np.int8, MAX_TIER - 1),  # 升到2~6本的回合，0表示未达到
+    "tribe_mask": (np.uint16, 1),   # 终局场面的种族组合
+    "main_tribe": (np.int8, 1),     # 终局场面数量最多的种族位序号，-1表示中立或空场
+    "board_size": (np.int8, 1),
+    "turn_offset": (np.int64, 1),   # 该局第一回合在回合表中的行号
+    "turn_count": (np.int16, 1),
+}
+
+# 回合表：每局每回合一行，取该回合最后记录的状态
+TURN_COLUMNS = {
+    "game_id": (np.int32, 1),
+    "turn": (np.int16, 1),
+    "tier": (np.int8, 1),
+    "gold": (np.int8, 1),
+    "shop": (np.int32, MAX_SLOTS),          # 随从卡牌ID，0表示空位
+    "board": (np.int32, MAX_SLOTS),
+    "board_attack": (np.int16, MAX_SLOTS),
+    "board_health": (np.int16, MAX_SLOTS),
+    "board_golden": (np.bool_, MAX_SLOTS),
+}
+
+_EPOCH = date(1970, 1, 1)
+
+
+def _to_day(value: Union[str, date, None]) -> Optional[int]:
+    """将日期（ISO字符串或date）转换为天数"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value).date()
+    elif isinstance(value, datetime):
+        value = value.date()
+    return (value - _EPOCH).days
+
+
+def _from_day(day: int) -> str:
+    """天数转换为ISO日期"""
+    return date.fromordinal(_EPOCH.toordinal() + int(day)).isoformat()
+
+
+class ColumnTable:
+    """按列存储的追加表
+
+    每列一个原始二进制文件，追加只在文件末尾写入；
+    提交的行数记录在meta.json中，写入中断时多余的尾部数据在加载时被忽略。
+    """
+
+    def __init__(self, directory: Path, schema: Dict[str, Tuple[Any, int]]):
+        self.directory = directory
+        self.schema = schema
+        self.rows = 0
+        self.columns: Dict[str, np.ndarray] = {}
+        self.load()
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    def load(self):
+        """从磁盘加载所有列"""
+        rows = 0
+        if self._meta_path.exists():
+            rows = json.loads(self._meta_path.read_text(encoding="utf-8")).get("rows", 0)
+        self.rows = rows
+        for name, (dtype, width) in self.schema.items():
+            path = self.directory / f"{name}.bin"
+            data = np.fromfile(path, dtype=dtype) if path.exists() else np.zeros(0, dtype=dtype)
+            data = data[:rows * width]
+            self.columns[name] = data.reshape(-1, width) if width > 1 else data
+
+    def append(self, values: Dict[str, np.ndarray]):
+        """追加若干行（各列行数必须一致）"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        count = None
+        arrays = {}
+        for name, (dtype, width) in self.schema.items():
+            array = np.asarray(values[name], dtype=dtype)
+            array = array.reshape(-1, width) if width > 1 else array.reshape(-1)
+            if count is None:
+                count = len(array)
+            elif len(array) != count:
+                raise ValueError(f"列 {name} 行数不一致")
+            arrays[name] = array
+
+        for name, (dtype, width) in self.schema.items():
+            path = self.directory / f"{name}.bin"
+            # 截断到已提交的长度，丢弃上次中断写入的残留
+            with open(path, "ab") as f:
+                f.truncate(self.rows * width * np.dtype(dtype).itemsize)
+                f.write(arrays[name].tobytes())
+            self.columns[name] = np.concatenate([self.columns[name], arrays[name]])
+
+        self.rows += count
+        self._meta_path.write_text(json.dumps({"rows": self.rows}), encoding="utf-8")
+
+    def __len__(self) -> int:
+        return self.rows
+
+
+class MatchArchive:
+    """对局存档
+
+    对局和回合分别存为两张列式表，查询时在内存中的索引上完成过滤和聚合。
+    """
+
+    def __init__(self, directory: Optional[Union[str, Path]] = None,
+                 card_db: Optional[CardDatabase] = None):
+        self.directory = Path(directory) if directory else Path(__file__).parent / "output" / "archive"
+        self.card_db = card_db or get_card_database()
+        self.games = ColumnTable(self.directory / "games", GAME_COLUMNS)
+        self.turns = ColumnTable(self.directory / "turns", TURN_COLUMNS)
+        self._lock = threading.Lock()
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """建立英雄、终局种族和日期索引（种族索引按终局场面的种族组合，每个出现的种族都记一次）"""
+        self._hero_index = self._group_index(self.games.columns["hero"])
+        tribe_mask = self.games.columns["tribe_mask"].astype(np.int64)
+        self._tribe_index = {bit: np.flatnonzero(tribe_mask & (1 << bit)) for bit in TRIBE_BITS.values()}
+        days = self.games.columns["day"]
+        self._day_order = np.argsort(days, kind="stable")
+        self._sorted_days = days[self._day_order]
+
+    @staticmethod
+    def _group_index(keys: np.ndarray) -> Dict[int, np.ndarray]:
+        """按取值分组的行号索引"""
+        if len(keys) == 0:
+            return {}
+        order = np.argsort(keys, kind="stable")
+        values, starts = np.unique(keys[order], return_index=True)
+        return {int(v): rows for v, rows in zip(values, np.split(order, starts[1:]))}
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def archive_session(self, records: List[Dict[str, Any]], placement: int = 0) -> Optional[int]:
+        """将一局的历史记录（StateHistory.query的结果）写入存档，返回对局ID
+
+        没有识别出英雄的记录序列不会被存档。
+        """
+        hero_id = 0
+        for record in records:
+            hero = self.card_db.get_hero(record["hero"]["name"])
+            if hero:
+                hero_id = hero["id"]
+        if not records or not hero_id:
+            return None
+
+        # 每回合取最后一条记录
+        by_turn: Dict[int, Dict[str, Any]] = {}
+        for record in records:
+            by_turn[record["turn"]] = record
+        turns = sorted(by_turn)
+
+        with self._lock:
+            game_id = len(self.games)
+            turn_rows = {name: [] for name in TURN_COLUMNS}
+            for turn in turns:
+                record = by_turn[turn]
+                shop = np.zeros(MAX_SLOTS, dtype=np.int32)
+                for minion in record["shop"]:
+                    shop[minion["position"]] = self._card_id(minion["name"])
+                board = np.zeros(MAX_SLOTS, dtype=np.int32)
+                attack = np.zeros(MAX_SLOTS, dtype=np.int16)
+                health = np.zeros(MAX_SLOTS, dtype=np.int16)
+                golden = np.zeros(MAX_SLOTS, dtype=np.bool_)
+                for minion in record["board"]:
+                    slot = minion["position"]
+                    board[slot] = self._card_id(minion["name"])
+                    attack[slot] = minion["attack"]
+                    health[slot] = minion["health"]
+                    golden[slot] = minion["golden"]
+                turn_rows["game_id"].append(game_id)
+                turn_rows["turn"].append(turn)
+                turn_rows["tier"].append(record["tavern_tier"])
+                turn_rows["gold"].append(record["gold"])
+                turn_rows["shop"].append(shop)
+                turn_rows["board"].append(board)
+                turn_rows["board_attack"].append(attack)
+                turn_rows["board_health"].append(health)
+                turn_rows["board_golden"].append(golden)
+
+            tier_up = np.zeros(MAX_TIER - 1, dtype=np.int8)
+            for turn in turns:
+                tier = by_turn[turn]["tavern_tier"]
+                for t in range(2, min(tier, MAX_TIER) + 1):
+                    if not tier_up[t - 2]:
+                        tier_up[t - 2] = turn
+
+            final = records[-1]
+            mask, main_tribe = self._board_tribes(final["board"])
+            started_at = datetime.fromisoformat(records[0]["timestamp"])
+            game_row = {
+                "game_id": game_id,
+                "started_at": started_at.timestamp(),
+                "ended_at": datetime.fromisoformat(final["timestamp"]).timestamp(),
+                "day": _to_day(started_at),
+                "hero": hero_id,
+                "placement": placement,
+                "turns": turns[-1],
+                "final_tier": final["tavern_tier"],
+                "tier_up": tier_up,
+                "tribe_mask": mask,
+                "main_tribe": main_tribe,
+                "board_size": len(final["board"]),
+                "turn_offset": len(self.turns),
+                "turn_count": len(turns),
+            }
+
+            self.turns.append(turn_rows)
+            self.games.append(game_row)
+            self._build_indexes()
+        return game_id
+
+    def _card_id(self, name: str) -> int:
+        """随从名称对应的卡牌ID，未知时为0"""
+        card = self.card_db.get_minion(name)
+        return card["id"] if card else 0
+
+    def _board_tribes(self, board: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """终局场面的种族组合和主种族"""
+        mask = 0
+        counts = np.zeros(len(TRIBE_BITS), dtype=np.int32)
+        for minion in board:
+            tribe_bits = int(self.card_db.tribes[self.card_db.minion_index(minion["name"])])
+            mask |= tribe_bits
+            for bit in range(len(TRIBE_BITS)):
+                if tribe_bits & (1 << bit):
+                    counts[bit] += 1
+        main_tribe = int(np.argmax(counts)) if counts.any() else -1
+        return mask, main_tribe
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def select(self, hero: Optional[str] = None, tribe: Optional[str] = None,
+               since: Optional[str] = None, until: Optional[str] = None) -> np.ndarray:
+        """按英雄、终局场面包含的种族和日期范围筛选对局行号"""
+        mask = np.ones(len(self.games), dtype=np.bool_)
+        if hero:
+            hero_card = self.card_db.get_hero(hero)
+            mask &= self._row_mask(self._hero_index.get(hero_card["id"] if hero_card else -1))
+        if tribe:
+            if tribe not in TRIBE_BITS:
+                raise ValueError(f"未知种族: {tribe}，可选: {', '.join(TRIBE_BITS)}")
+            mask &= self._row_mask(self._tribe_index.get(TRIBE_BITS[tribe]))
+        since_day, until_day = _to_day(since), _to_day(until)
+        if since_day is not None or until_day is not None:
+            lo = np.searchsorted(self._sorted_days, since_day, "left") if since_day is not None else 0
+            hi = (np.searchsorted(self._sorted_days, until_day, "right")
+                  if until_day is not None else len(self._sorted_days))
+            mask &= self._row_mask(self._day_order[lo:hi])
+        return np.flatnonzero(mask)
+
+    def _row_mask(self, rows: Optional[np.ndarray]) -> np.ndarray:
+        """行号集合转换为布尔掩码"""
+        mask = np.zeros(len(self.games), dtype=np.bool_)
+        if rows is not None:
+            mask[rows] = True
+        return mask
+
+    def hero_stats(self, **filters) -> List[Dict[str, Any]]:
+        """按英雄聚合：场次、吃鸡率、前四率和平均名次（只统计名次已知的对局）"""
+        rows = self.select(**filters)
+        return self._group_stats(self.games.columns["hero"][rows], rows, "hero",
+                                 lambda hero_id: self._hero_name(hero_id))
+
+    def tribe_stats(self, **filters) -> List[Dict[str, Any]]:
+        """按终局主种族聚合"""
+        rows = self.select(**filters)
+        names = {bit: name for name, bit in TRIBE_BITS.items()}
+        return self._group_stats(self.games.columns["main_tribe"][rows], rows, "tribe",
+                                 lambda bit: names.get(bit, "neutral"))
+
+    def _group_stats(self, keys: np.ndarray, rows: np.ndarray, label: str, name_of) -> List[Dict[str, Any]]:
+        """分组统计场次与名次"""
+        if len(rows) == 0:
+            return []
+        placement = self.games.columns["placement"][rows].astype(np.int32)
+        values, inverse = np.unique(keys, return_inverse=True)
+        games = np.bincount(inverse)
+        rated = np.bincount(inverse, weights=placement > 0)
+        firsts = np.bincount(inverse, weights=placement == 1)
+        top4 = np.bincount(inverse, weights=(placement >= 1) & (placement <= 4))
+        placement_sum = np.bincount(inverse, weights=placement)
+        results = []
+        for i in np.argsort(-games, kind="stable"):
+            has_rated = rated[i] > 0
+            results.append({
+                label: name_of(int(values[i])),
+                "games": int(games[i]),
+                "rated_games": int(rated[i]),
+                "win_rate": round(float(firsts[i] / rated[i]), 4) if has_rated else None,
+                "top4_rate": round(float(top4[i] / rated[i]), 4) if has_rated else None,
+                "average_placement": round(float(placement_sum[i] / rated[i]), 2) if has_rated else None,
+            })
+        return results
+
+    def tier_up_turns(self, **filters) -> Dict[str, Any]:
+        """各酒馆等级的平均升级回合"""
+        rows = self.select(**filters)
+        tier_up = self.games.columns["tier_up"][rows].astype(np.float64)
+        reached = tier_up > 0
+        counts = reached.sum(axis=0)
+        sums = np.where(reached, tier_up, 0).sum(axis=0)
+        return {
+            "games": int(len(rows)),
+            "tiers": {
+                str(tier): {
+                    "average_turn": round(float(sums[i] / counts[i]), 2) if counts[i] else None,
+                    "games_reached": int(counts[i]),
+                }
+                for i, tier in enumerate(range(2, MAX_TIER + 1))
+            },
+        }
+
+    def list_games(self, limit: int = 50, **filters) -> List[Dict[str, Any]]:
+        """列出最近的对局摘要"""
+        rows = self.select(**filters)[-limit:][::-1]
+        columns = self.games.columns
+        return [
+            {
+                "game_id": int(columns["game_id"][row]),
+                "date": _from_day(columns["day"][row]),
+                "started_at": datetime.fromtimestamp(columns["started_at"][row]).isoformat(),
+                "hero": self._hero_name(int(columns["hero"][row])),
+                "placement": int(columns["placement"][row]) or None,
+                "turns": int(columns["turns"][row]),
+                "final_tier": int(columns["final_tier"][row]),
+                "tribes": tribes_from_mask(int(columns["tribe_mask"][row])),
+                "board_size": int(columns["board_size"][row]),
+            }
+            for row in rows
+        ]
+
+    def game_turns(self, game_id: int) -> List[Dict[str, Any]]:
+        """某局每回合的商店与场面"""
+        if not 0 <= game_id < len(self.games):
+            raise ValueError(f"对局不存在: {game_id}")
+        start = int(self.games.columns["turn_offset"][game_id])
+        end = start + int(self.games.columns["turn_count"][game_id])
+        columns = self.turns.columns
+        return [
+            {
+                "turn": int(columns["turn"][row]),
+                "tavern_tier": int(columns["tier"][row]),
+                "gold": int(columns["gold"][row]),
+                "shop": [self._minion_name(card_id) for card_id in columns["shop"][row] if card_id],
+                "board": [
+                    {
+                        "name": self._minion_name(columns["board"][row, slot]),
+                        "attack": int(columns["board_attack"][row, slot]),
+                        "health": int(columns["board_health"][row, slot]),
+                        "golden": bool(columns["board_golden"][row, slot]),
+                    }
+                    for slot in range(MAX_SLOTS) if columns["board"][row, slot]
+                ],
+            }
+            for row in range(start, end)
+        ]
+
+    def _hero_name(self, hero_id: int) -> str:
+        hero = self.card_db.get_hero(str(hero_id))
+        return hero["name"] if hero else str(hero_id)
+
+    def _minion_name(self, card_id: int) -> str:
+        minion = self.card_db.get_minion(str(card_id))
+        return minion["name"] if minion else str(card_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """存档规模"""
+        return {"games": len(self.games), "turns": len(self.turns), "directory": str(self.directory)}
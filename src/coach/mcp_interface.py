@@ -4,10 +4,25 @@ MCP集成接口
 """
 
 import json
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass, asdict
 
+from advice_engine import ADVICE_KINDS, AdviceEngine
+
+try:
+    from websockets.sync.client import connect as websocket_connect
+except ImportError:  # websockets未安装时退化为HTTP轮询
+    websocket_connect = None
+
+# 识别服务中组成完整游戏状态的WebSocket主题（与 websocket_service.STATE_TOPICS 一致）
+STATE_TOPICS = ("economy", "hero", "shop", "board", "phase")
+# 后台预计算建议的主题，单独缓存，不计入游戏状态
+ADVICE_TOPIC = "advice"
+
 
 @dataclass
 class MCPTool:
@@ -18,12 +33,143 @@ class MCPTool:
     outputSchema: Dict[str, Any]
 
 
-class MCPInterface:
+class GameStateCache:
+    """游戏状态缓存
+
+    后台线程订阅识别服务的WebSocket推送（websockets不可用时按间隔轮询 /api/state），
+    始终在内存中保留最新的游戏状态，工具调用直接读取缓存。
+    通过WebSocket订阅时同时订阅advice主题：状态消息带有与该状态一致的预计算建议，
+    建议算好时服务端也会单独推送，缓存中的建议与状态分开保存。
+    """
+    
+    def __init__(self, api_base_url: str, session: requests.Session,
+                 timeout: float = 1.0, poll_interval: float = 0.5):
+        self.api_base_url = api_base_url
+        # 显式订阅组成完整游戏状态的主题和建议主题，缓存的状态与 /api/state 的state一致
+        self.ws_url = (api_base_url.replace("http://", "ws://").replace("https://", "wss://")
+                       + "/ws?topics=" + ",".join(STATE_TOPICS + (ADVICE_TOPIC,)))
+        self.session = session
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.state: Optional[Dict[str, Any]] = None
+        self.source = "none"
+        self.connected = False
+        self.advice: Dict[str, Any] = {}
+        self._updated_at: Optional[float] = None
+        self._advice_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """启动后台订阅线程（重复调用无副作用）"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        target = self._subscribe_loop if websocket_connect else self._poll_loop
+        self._thread = threading.Thread(target=target, daemon=True, name="game-state-cache")
+        self._thread.start()
+    
+    def stop(self):
+        """停止后台订阅线程"""
+        self._stop.set()
+    
+    def update(self, state: Dict[str, Any], source: str):
+        """写入最新状态"""
+        with self._lock:
+            self.state = state
+            self.source = source
+            self._updated_at = time.monotonic()
+    
+    @property
+    def streaming(self) -> bool:
+        """是否正通过WebSocket订阅（此时预计算建议随推送缓存）"""
+        return self.connected and websocket_connect is not None
+    
+    def update_advice(self, advice: Dict[str, Any]):
+        """写入服务端推送的预计算建议（整体替换：未包含的类型尚未算好或已过期）"""
+        with self._lock:
+            self.advice = advice
+            self._advice_at = time.monotonic()
+    
+    def lookup_advice(self, kind: str) -> Optional[Dict[str, Any]]:
+        """缓存的某类预计算建议，``age_ms`` 计入收到推送后经过的时间；没有时返回None"""
+        with self._lock:
+            advice = self.advice.get(kind)
+            if advice is None or self._advice_at is None:
+                return None
+            elapsed = (time.monotonic() - self._advice_at) * 1000
+        return dict(advice, age_ms=round((advice.get("age_ms") or 0) + elapsed, 1))
+    
+    def snapshot(self):
+        """读取最新状态及其已缓存的毫秒数"""
+        with self._lock:
+            if self._updated_at is None:
+                return None, None
+            return self.state, (time.monotonic() - self._updated_at) * 1000
+    
+    def fetch(self) -> bool:
+        """通过HTTP主动拉取一次最新状态"""
+        try:
+            response = self.session.get(f"{self.api_base_url}/api/state", timeout=self.timeout)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("state"):
+                    self.update(data["state"], "http")
+                    return True
+        except (requests.RequestException, ValueError):
+            pass
+        return False
+    
+    def _subscribe_loop(self):
+        """WebSocket订阅循环，断线后指数退避重连"""
+        backoff = 0.5
+        while not self._stop.is_set():
+            try:
+                with websocket_connect(self.ws_url, open_timeout=self.timeout) as connection:
+                    self.connected = True
+                    backoff = 0.5
+                    while not self._stop.is_set():
+                        try:
+                            message = connection.recv(timeout=1.0)
+                        except TimeoutError:
+                            continue
+                        data = json.loads(message)
+                        # 跳过订阅确认和错误状态等非游戏状态消息
+                        if "type" in data or data.get("status") == "error":
+                            continue
+                        if ADVICE_TOPIC in data:
+                            self.update_advice(data.pop(ADVICE_TOPIC) or {})
+                        # 建议算好时的单独推送只有时间戳和advice
+                        if set(data) - {"timestamp"}:
+                            self.update(data, "websocket")
+            except Exception:
+                pass
+            self.connected = False
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 10.0)
+    
+    def _poll_loop(self):
+        """HTTP轮询循环"""
+        while not self._stop.is_set():
+            self.connected = self.fetch()
+            self._stop.wait(self.poll_interval)
+
+
+class MCPInterface(AdviceEngine):
     """MCP接口管理器"""
     
-    def __init__(self, api_base_url: str = "http://127.0.0.1:8000"):
+    def __init__(self, api_base_url: str = "http://127.0.0.1:8000", timeout: float = 1.0):
         self.api_base_url = api_base_url
+        self.timeout = timeout
         self.tools = self._define_tools()
+        
+        # 复用连接的HTTP会话
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.state_cache = GameStateCache(api_base_url, self.session, timeout)
     
     def _define_tools(self) -> List[MCPTool]:
         """定义可用的MCP工具"""
@@ -45,7 +191,9 @@ class MCPInterface:
                         "turn": {"type": "integer"},
                         "hero": {"type": "object"},
                         "shop": {"type": "object"},
-                        "board": {"type": "object"}
+                        "board": {"type": "object"},
+                        "phase": {"type": "string"},
+                        "opponent": {"type": ["object", "null"]}
                     }
                 }
             ),
@@ -76,6 +224,15 @@ class MCPInterface:
                             "type": "string",
                             "enum": ["buy", "sell", "position", "upgrade"],
                             "description": "建议类型：购买、出售、站位、升级"
+                        },
+                        "opponents": {
+                            "type": "array",
+                            "items": {"type": "array", "items": {"type": "object"}},
+                            "description": "站位建议使用的对手场面列表，每个场面为随从列表，缺省为战斗中记录的对手场面"
+                        },
+                        "upgrade_cost": {
+                            "type": "integer",
+                            "description": "升级建议使用的当前升级费用，缺省按升级后经过的回合数估算"
                         }
                     },
                     "required": ["advice_type"]
@@ -102,7 +259,184 @@ class MCPInterface:
                     "properties": {
                         "current_composition": {"type": "string"},
                         "strength": {"type": "string"},
-                        "suggestions": {"type": "array", "items": {"type": "string"}}
+                        "suggestions": {"type": "array", "items": {"type": "string"}},
+                        "analytics": {"type": "object"}
+                    }
+                }
+            ),
+            MCPTool(
+                name="simulate_combat",
+                description="蒙特卡洛模拟我方场面与对手场面的战斗，返回胜/平/负概率和伤害分布",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "opponent": {
+                            "type": "array",
+                            "items": {"type": "object"},
+                            "description": "对手随从列表，每项至少包含name，可选attack、health、golden、divine_shield、reborn"
+                        },
+                        "board": {
+                            "type": "array",
+                            "items": {"type": "object"},
+                            "description": "我方随从列表，缺省为当前识别的场面"
+                        },
+                        "trials": {"type": "integer", "description": "模拟次数，默认5000"},
+                        "seed": {"type": "integer", "description": "随机种子，相同种子结果可复现"},
+                        "deadline_ms": {"type": "number", "description": "截止时间（毫秒），默认200"},
+                        "tier": {"type": "integer", "description": "我方酒馆等级"},
+                        "opponent_tier": {"type": "integer", "description": "对手酒馆等级"}
+                    },
+                    "required": ["opponent"]
+                },
+                outputSchema={
+                    "type": "object",
+                    "properties": {
+                        "win": {"type": "number"},
+                        "tie": {"type": "number"},
+                        "loss": {"type": "number"},
+                        "damage": {"type": "object"},
+                        "confidence": {"type": "object"}
+                    }
+                }
+            ),
+            MCPTool(
+                name="query_history",
+                description="查询游戏状态历史，例如第6回合商店出现过哪些随从",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "since": {"type": "string", "description": "起始时间（ISO格式）"},
+                        "until": {"type": "string", "description": "结束时间（ISO格式）"},
+                        "turn": {"type": "integer", "description": "回合数"},
+                        "event": {
+                            "type": "string",
+                            "enum": ["shop_changed", "board_changed", "turn_changed", "tier_changed",
+                                     "gold_changed", "hero_changed", "shop_frozen"],
+                            "description": "事件类型"
+                        },
+                        "limit": {"type": "integer", "description": "最多返回的记录数，默认100"}
+                    },
+                    "required": []
+                },
+                outputSchema={
+                    "type": "object",
+                    "properties": {
+                        "records": {"type": "array", "items": {"type": "object"}},
+                        "history": {"type": "object"}
+                    }
+                }
+            ),
+            MCPTool(
+                name="query_archive",
+                description="查询历史对局存档，统计英雄胜率、终局种族表现和平均升级回合",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "enum": ["hero_stats", "tribe_stats", "tier_up_turns", "games"],
+                            "description": "查询类型：英雄胜率、终局种族、平均升级回合、对局列表"
+                        },
+                        "hero": {"type": "string", "description": "按英雄过滤"},
+                        "tribe": {"type": "string", "description": "按终局主种族过滤，如 beast、mech"},
+                        "since": {"type": "string", "description": "起始日期（ISO格式）"},
+                        "until": {"type": "string", "description": "结束日期（ISO格式）"},
+                        "limit": {"type": "integer", "description": "对局列表的最大条数"}
+                    },
+                    "required": ["query"]
+                },
+                outputSchema={
+                    "type": "object",
+                    "properties": {
+                        "result": {"type": ["array", "object"]},
+                        "archive": {"type": "object"}
+                    }
+                }
+            ),
+            MCPTool(
+                name="get_shop_odds",
+                description="按共享随从池计算若干次刷新内看到指定随从或种族的概率，并评估当前商店中的随从",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "cards": {"type": "array", "items": {"type": "string"}, "description": "目标随从名称列表"},
+                        "tribe": {"type": "string", "description": "目标种族，如 beast、mech"},
+                        "rolls": {"type": "integer", "description": "刷新次数，默认1"},
+                        "tier": {"type": "integer", "description": "酒馆等级，缺省为当前等级"},
+                        "lobby": {"type": "array", "items": {"type": "string"}, "description": "本局可用的种族"}
+                    },
+                    "required": []
+                },
+                outputSchema={
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "object"},
+                        "candidates": {"type": "array", "items": {"type": "object"}}
+                    }
+                }
+            ),
+            MCPTool(
+                name="search_cards",
+                description="按名称、描述、关键字和种族全文搜索随从和英雄卡牌，支持中文模糊匹配和等级、种族、关键字过滤",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "查询文本，如 圣盾、亡语 召唤"},
+                        "tier": {"type": "integer", "description": "按随从等级过滤"},
+                        "tribe": {"type": "string", "description": "按种族过滤，如 beast、mech、neutral"},
+                        "keyword": {"type": "string", "description": "按关键字过滤，如 divine_shield、deathrattle"},
+                        "kind": {"type": "string", "enum": ["minion", "hero"], "description": "只搜索随从或英雄"},
+                        "limit": {"type": "integer", "description": "最多返回的结果数，默认10"}
+                    },
+                    "required": []
+                },
+                outputSchema={
+                    "type": "object",
+                    "properties": {
+                        "results": {"type": "array", "items": {"type": "object"}},
+                        "terms": {"type": "array", "items": {"type": "string"}},
+                        "elapsed_ms": {"type": "number"}
+                    }
+                }
+            ),
+            MCPTool(
+                name="get_metrics",
+                description="获取识别流水线指标：截屏、ROI提取、模板匹配、识别、序列化和广播各阶段的耗时分位数，处理和丢弃的帧数，每帧匹配次数和缓存命中率",
+                inputSchema={
+                    "type": "object",
+                    "properties": {},
+                    "required": []
+                },
+                outputSchema={
+                    "type": "object",
+                    "properties": {
+                        "stages": {"type": "object"},
+                        "template_matches_per_frame": {"type": "object"},
+                        "counters": {"type": "object"}
+                    }
+                }
+            ),
+            MCPTool(
+                name="profile_recognition",
+                description="对识别循环、帧识别和后台计算线程做若干秒的定时采样分析，返回耗时最多的函数和火焰图可用的折叠调用栈文件",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "seconds": {"type": "number", "description": "采样时长（秒），默认5，最多60"},
+                        "interval_ms": {"type": "number", "description": "采样间隔（毫秒），默认5"},
+                        "threads": {"type": "array", "items": {"type": "string"}, "description": "线程名前缀，缺省为识别和后台计算线程，[\"*\"]为全部线程"},
+                        "top": {"type": "integer", "description": "返回的函数排行条数，默认20"},
+                        "stacks": {"type": "boolean", "description": "是否附带全部折叠调用栈"}
+                    },
+                    "required": []
+                },
+                outputSchema={
+                    "type": "object",
+                    "properties": {
+                        "samples": {"type": "integer"},
+                        "threads": {"type": "object"},
+                        "top": {"type": "array", "items": {"type": "object"}},
+                        "file": {"type": "string"}
                     }
                 }
             )
@@ -113,199 +447,198 @@ class MCPInterface:
         return [asdict(tool) for tool in self.tools]
     
     def execute_tool(self, tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """执行指定的MCP工具"""
+        """执行指定的MCP工具，结果中附带缓存状态的新鲜度"""
+        self.state_cache.start()
+        result = self._dispatch_tool(tool_name, parameters)
+        _, age_ms = self.state_cache.snapshot()
+        result["cache"] = {
+            "source": self.state_cache.source,
+            "connected": self.state_cache.connected,
+            "age_ms": round(age_ms, 1) if age_ms is not None else None,
+        }
+        return result
+    
+    def _dispatch_tool(self, tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """按名称分发工具调用"""
         try:
             if tool_name == "get_game_state":
                 return self._get_game_state()
             elif tool_name == "get_recognition_status":
                 return self._get_recognition_status()
             elif tool_name == "get_game_advice":
-                return self._get_game_advice(parameters.get("advice_type", "buy"))
+                return self._get_game_advice(parameters.get("advice_type", "buy"), parameters)
             elif tool_name == "analyze_board":
                 return self._analyze_board()
+            elif tool_name == "simulate_combat":
+                return self._simulate_combat(parameters)
+            elif tool_name == "query_history":
+                return self._query_history(parameters)
+            elif tool_name == "query_archive":
+                return self._query_archive(parameters)
+            elif tool_name == "get_shop_odds":
+                return self._shop_odds(parameters)
+            elif tool_name == "search_cards":
+                return self._search_cards(parameters)
+            elif tool_name == "get_metrics":
+                return self._get_metrics()
+            elif tool_name == "profile_recognition":
+                return self._profile(parameters)
+            elif tool_name == "start_recognition":
+                return self._start_recognition()
+            elif tool_name == "stop_recognition":
+                return self._stop_recognition()
             else:
                 return {"error": f"未知工具: {tool_name}"}
         except Exception as e:
             return {"error": f"工具执行失败: {str(e)}"}
     
-    def _get_game_state(self) -> Dict[str, Any]:
-        """获取当前游戏状态"""
+    @staticmethod
+    def _api_error(response) -> str:
+        """API错误说明，服务返回了 detail 时一并带上"""
         try:
-            response = requests.get(f"{self.api_base_url}/api/status")
+            detail = response.json().get("detail")
+        except (ValueError, AttributeError):
+            detail = None
+        if isinstance(detail, str) and detail:
+            return f"API请求失败: {response.status_code} {detail}"
+        return f"API请求失败: {response.status_code}"
+    
+    def _api_get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """通过复用的会话请求识别服务API"""
+        try:
+            response = self.session.get(f"{self.api_base_url}{path}", params=params, timeout=self.timeout)
             if response.status_code == 200:
-                status = response.json()
-                # 这里应该返回完整的游戏状态
-                # 暂时返回模拟数据
-                return {
-                    "timestamp": status.get("last_update", "2024-01-01T00:00:00Z"),
-                    "tavern_tier": 6,
-                    "gold": 10,
-                    "turn": 8,
-                    "hero": {
-                        "name": "Reno Jackson",
-                        "health": 25,
-                        "armor": 9
-                    },
-                    "shop": {
-                        "frozen": False,
-                        "minions": [
-                            {
-                                "position": 0,
-                                "name": "Kalecgos",
-                                "attack": 2,
-                                "health": 6,
-                                "tier": 6,
-                                "tribe": "dragon",
-                                "golden": False
-                            }
-                        ]
-                    },
-                    "board": {
-                        "minions": [
-                            {
-                                "position": 0,
-                                "name": "Bronze Warden",
-                                "attack": 8,
-                                "health": 56,
-                                "golden": True,
-                                "divine_shield": True,
-                                "reborn": True
-                            }
-                        ]
-                    }
-                }
+                return response.json()
             else:
-                return {"error": f"API请求失败: {response.status_code}"}
+                return {"error": self._api_error(response)}
         except requests.RequestException as e:
             return {"error": f"网络请求失败: {str(e)}"}
     
-    def _get_recognition_status(self) -> Dict[str, Any]:
-        """获取识别服务状态"""
+    def _api_post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """通过复用的会话向识别服务API提交JSON"""
         try:
-            response = requests.get(f"{self.api_base_url}/api/status")
+            response = self.session.post(f"{self.api_base_url}{path}", json=payload,
+                                         timeout=timeout or self.timeout)
             if response.status_code == 200:
                 return response.json()
             else:
-                return {"error": f"API请求失败: {response.status_code}"}
+                return {"error": self._api_error(response)}
         except requests.RequestException as e:
             return {"error": f"网络请求失败: {str(e)}"}
     
-    def _get_game_advice(self, advice_type: str) -> Dict[str, Any]:
-        """获取游戏建议"""
+    def _get_game_state(self) -> Dict[str, Any]:
+        """获取当前游戏状态（读取缓存，缓存为空时主动拉取一次）"""
+        state, _ = self.state_cache.snapshot()
+        if state is None and self.state_cache.fetch():
+            state, _ = self.state_cache.snapshot()
+        if state is None:
+            return {"error": "暂无游戏状态，请确认识别服务已启动"}
+        return dict(state)
+    
+    def _start_recognition(self) -> Dict[str, Any]:
+        """启动识别循环"""
+        return {"error": "HTTP模式下识别循环由 main.py 控制，请使用 mcp_server.py --embedded 启动进程内模式"}
+    
+    def _stop_recognition(self) -> Dict[str, Any]:
+        """停止识别循环"""
+        return {"error": "HTTP模式下识别循环由 main.py 控制，请使用 mcp_server.py --embedded 启动进程内模式"}
+    
+    def _get_recognition_status(self) -> Dict[str, Any]:
+        """获取识别服务状态"""
+        return self._api_get("/api/status")
+    
+    def _query_history(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """查询游戏状态历史"""
+        query = {key: parameters[key] for key in ("since", "until", "turn", "event", "limit")
+                 if parameters.get(key) is not None}
+        return self._api_get("/api/history", query)
+    
+    def _query_archive(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """查询历史对局存档"""
+        query_type = parameters.get("query", "hero_stats")
+        filters = {key: parameters[key] for key in ("hero", "tribe", "since", "until")
+                   if parameters.get(key) is not None}
+        if query_type == "games":
+            path = "/api/archive/games"
+            if parameters.get("limit") is not None:
+                filters["limit"] = parameters["limit"]
+        else:
+            groups = {"hero_stats": "hero", "tribe_stats": "tribe", "tier_up_turns": "tier_up"}
+            if query_type not in groups:
+                return {"error": f"未知查询类型: {query_type}"}
+            path = "/api/archive/stats"
+            filters["group"] = groups[query_type]
+        return self._api_get(path, filters)
+    
+    def _simulate_combat(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """由识别服务执行战斗模拟"""
+        if not parameters.get("opponent"):
+            return {"error": "缺少对手场面 opponent"}
+        # 模拟可能用满截止时间，请求超时需留出余量；不设截止时间时最多等待30秒
+        deadline_ms = parameters.get("deadline_ms", 200)
+        timeout = self.timeout + deadline_ms / 1000 if deadline_ms and deadline_ms > 0 else 30.0
+        return self._api_post("/api/simulate", parameters, timeout=timeout)
+    
+    def _get_game_advice(self, advice_type: str, parameters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """获取游戏建议：优先返回识别服务按最新状态预先算好的建议，指定了对手场面或升级费用时现场计算"""
+        parameters = parameters or {}
+        if (advice_type in ADVICE_KINDS and not parameters.get("opponents")
+                and parameters.get("upgrade_cost") is None):
+            speculative = self._speculative_advice(advice_type)
+            if speculative:
+                return speculative
         # 基于当前游戏状态提供建议
         game_state = self._get_game_state()
         if "error" in game_state:
             return game_state
-        
-        if advice_type == "buy":
-            shop_minions = game_state.get("shop", {}).get("minions", [])
-            if shop_minions:
-                best_minion = max(shop_minions, key=lambda x: x.get("tier", 0))
-                return {
-                    "advice": f"建议购买 {best_minion['name']}",
-                    "reason": f"这是商店中最高等级的随从（{best_minion['tier']}星）",
-                    "priority": "high"
-                }
-            else:
-                return {
-                    "advice": "商店中没有随从，建议刷新",
-                    "reason": "商店为空，需要刷新寻找更好的选择",
-                    "priority": "medium"
-                }
-        
-        elif advice_type == "position":
-            board_minions = game_state.get("board", {}).get("minions", [])
-            if board_minions:
-                # 简单的站位建议
-                return {
-                    "advice": "圣盾随从放前排，高攻击随从放后排",
-                    "reason": "保护圣盾随从，最大化输出",
-                    "priority": "medium"
-                }
-            else:
-                return {
-                    "advice": "暂无随从，无需考虑站位",
-                    "reason": "场面上没有随从",
-                    "priority": "low"
-                }
-        
-        elif advice_type == "upgrade":
-            current_tier = game_state.get("tavern_tier", 1)
-            if current_tier < 6:
-                return {
-                    "advice": f"建议升级到 {current_tier + 1} 本",
-                    "reason": "升级可以获得更高等级的随从",
-                    "priority": "high"
-                }
-            else:
-                return {
-                    "advice": "已达到最高等级，无需升级",
-                    "reason": "当前已经是6本，无法继续升级",
-                    "priority": "low"
-                }
-        
-        else:
-            return {
-                "advice": "建议类型无效",
-                "reason": f"不支持的建议类型: {advice_type}",
-                "priority": "low"
-            }
+        return self.game_advice(advice_type, game_state, parameters)
+    
+    def _speculative_advice(self, kind: str) -> Optional[Dict[str, Any]]:
+        """识别服务预先计算的建议，尚未算好或已过期时返回None
+
+        通过WebSocket订阅时直接读取缓存中推送来的建议，只有轮询模式才请求 /api/advice。
+        """
+        if self.state_cache.streaming:
+            return self.state_cache.lookup_advice(kind)
+        return self._api_get("/api/advice", {"kind": kind}).get("advice")
+    
+    def _shop_odds(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """由识别服务计算刷新概率"""
+        return self._api_post("/api/shop-odds", parameters)
+    
+    def _get_metrics(self) -> Dict[str, Any]:
+        """获取识别服务的流水线指标"""
+        return self._api_get("/api/metrics", {"format": "json"})
+    
+    def _profile(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """由识别服务对识别线程采样，请求超时需留出采样时长"""
+        seconds = float(parameters.get("seconds") or 5.0)
+        return self._api_post("/api/admin/profile", parameters, timeout=self.timeout + seconds + 5.0)
+    
+    def _search_cards(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """由识别服务搜索卡牌"""
+        params = {key: parameters[key] for key in ("tier", "tribe", "keyword", "kind", "limit")
+                  if parameters.get(key) is not None}
+        params["q"] = parameters.get("query", "")
+        return self._api_get("/api/cards/search", params)
+    
+    def _plan_economy(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """由识别服务规划升级曲线"""
+        return self._api_post("/api/plan-economy", parameters)
+    
+    def _optimize_position(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """由识别服务搜索最佳站位"""
+        return self._api_post("/api/optimize-position", parameters, timeout=self.timeout + 1.0)
     
     def _analyze_board(self) -> Dict[str, Any]:
         """分析当前场面"""
+        speculative = self._speculative_advice("board")
+        if speculative:
+            return speculative
         game_state = self._get_game_state()
         if "error" in game_state:
             return game_state
-        
-        board_minions = game_state.get("board", {}).get("minions", [])
-        if not board_minions:
-            return {
-                "current_composition": "空场",
-                "strength": "极弱",
-                "suggestions": ["尽快购买随从", "考虑升级酒馆"]
-            }
-        
-        # 分析种族构成
-        tribes = {}
-        golden_count = 0
-        total_attack = 0
-        total_health = 0
-        
-        for minion in board_minions:
-            tribe = minion.get("tribe", "neutral")
-            tribes[tribe] = tribes.get(tribe, 0) + 1
-            if minion.get("golden", False):
-                golden_count += 1
-            total_attack += minion.get("attack", 0)
-            total_health += minion.get("health", 0)
-        
-        # 确定主要种族
-        main_tribe = max(tribes.items(), key=lambda x: x[1])[0] if tribes else "neutral"
-        
-        # 评估强度
-        if len(board_minions) >= 7 and golden_count >= 3:
-            strength = "极强"
-        elif len(board_minions) >= 5 and golden_count >= 1:
-            strength = "强"
-        elif len(board_minions) >= 3:
-            strength = "中等"
-        else:
-            strength = "弱"
-        
-        # 生成建议
-        suggestions = []
-        if len(board_minions) < 7:
-            suggestions.append("继续购买随从填满场面")
-        if golden_count == 0:
-            suggestions.append("寻找机会制作金色随从")
-        if main_tribe != "neutral" and tribes[main_tribe] >= 3:
-            suggestions.append(f"继续强化{main_tribe}种族阵容")
-        
-        return {
-            "current_composition": f"{main_tribe}种族阵容 ({tribes.get(main_tribe, 0)}个)",
-            "strength": strength,
-            "suggestions": suggestions
-        }
+        return self.board_analysis(game_state)
 
 
 # 测试代码
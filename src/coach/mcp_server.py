@@ -1,20 +1,31 @@
 #!/usr/bin/env python3
 """
 MCP服务器 - 炉石战棋识别辅助系统
-提供6个MCP工具供Cursor调用
+提供MCP工具供Cursor调用
+
+两种运行模式：
+- 默认：通过HTTP/WebSocket连接独立运行的识别服务（main.py）
+- --embedded：在本进程内运行识别流水线，工具调用直接读取内存状态
 """
 
+import argparse
 import json
 import sys
 import traceback
 from typing import Dict, Any, List
 from mcp_interface import MCPInterface
+from mcp_transport import StdioTransport
 
 class SimpleMCPServer:
     """简化的MCP服务器实现"""
     
-    def __init__(self):
-        self.mcp_interface = MCPInterface()
+    def __init__(self, embedded: bool = False):
+        self.embedded = embedded
+        if embedded:
+            from embedded_backend import EmbeddedMCPInterface
+            self.mcp_interface = EmbeddedMCPInterface()
+        else:
+            self.mcp_interface = MCPInterface()
         self.tools = [
             {
                 "name": "get_game_state",
@@ -44,6 +55,15 @@ class SimpleMCPServer:
                             "type": "string",
                             "enum": ["buy", "position", "upgrade", "general"],
                             "description": "建议类型：购买、站位、升级、通用"
+                        },
+                        "opponents": {
+                            "type": "array",
+                            "items": {"type": "array", "items": {"type": "object"}},
+                            "description": "站位建议使用的对手场面列表，每个场面为随从列表，缺省为战斗中记录的对手场面"
+                        },
+                        "upgrade_cost": {
+                            "type": "integer",
+                            "description": "升级建议使用的当前升级费用，缺省按升级后经过的回合数估算"
                         }
                     },
                     "required": ["advice_type"]
@@ -58,6 +78,126 @@ class SimpleMCPServer:
                     "required": []
                 }
             },
+            {
+                "name": "simulate_combat",
+                "description": "蒙特卡洛模拟我方场面与对手场面的战斗，返回胜/平/负概率和伤害分布",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "opponent": {
+                            "type": "array",
+                            "items": {"type": "object"},
+                            "description": "对手随从列表，每项至少包含name，可选attack、health、golden、divine_shield、reborn"
+                        },
+                        "board": {
+                            "type": "array",
+                            "items": {"type": "object"},
+                            "description": "我方随从列表，缺省为当前识别的场面"
+                        },
+                        "trials": {"type": "integer", "description": "模拟次数，默认5000"},
+                        "seed": {"type": "integer", "description": "随机种子，相同种子结果可复现"},
+                        "deadline_ms": {"type": "number", "description": "截止时间（毫秒），默认200"},
+                        "tier": {"type": "integer", "description": "我方酒馆等级"},
+                        "opponent_tier": {"type": "integer", "description": "对手酒馆等级"}
+                    },
+                    "required": ["opponent"]
+                }
+            },
+            {
+                "name": "query_history",
+                "description": "查询游戏状态历史，可按时间范围、回合或事件类型过滤",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "since": {"type": "string", "description": "起始时间（ISO格式）"},
+                        "until": {"type": "string", "description": "结束时间（ISO格式）"},
+                        "turn": {"type": "integer", "description": "回合数"},
+                        "event": {
+                            "type": "string",
+                            "enum": ["shop_changed", "board_changed", "turn_changed", "tier_changed",
+                                     "gold_changed", "hero_changed", "shop_frozen"],
+                            "description": "事件类型"
+                        },
+                        "limit": {"type": "integer", "description": "最多返回的记录数，默认100"}
+                    },
+                    "required": []
+                }
+            },
+            {
+                "name": "query_archive",
+                "description": "查询历史对局存档，统计英雄胜率、终局种族表现和平均升级回合",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "enum": ["hero_stats", "tribe_stats", "tier_up_turns", "games"],
+                            "description": "查询类型：英雄胜率、终局种族、平均升级回合、对局列表"
+                        },
+                        "hero": {"type": "string", "description": "按英雄过滤"},
+                        "tribe": {"type": "string", "description": "按终局主种族过滤，如 beast、mech"},
+                        "since": {"type": "string", "description": "起始日期（ISO格式）"},
+                        "until": {"type": "string", "description": "结束日期（ISO格式）"},
+                        "limit": {"type": "integer", "description": "对局列表的最大条数"}
+                    },
+                    "required": ["query"]
+                }
+            },
+            {
+                "name": "get_shop_odds",
+                "description": "按共享随从池计算若干次刷新内看到指定随从或种族的概率，并评估当前商店中的随从",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "cards": {"type": "array", "items": {"type": "string"}, "description": "目标随从名称列表"},
+                        "tribe": {"type": "string", "description": "目标种族，如 beast、mech"},
+                        "rolls": {"type": "integer", "description": "刷新次数，默认1"},
+                        "tier": {"type": "integer", "description": "酒馆等级，缺省为当前等级"},
+                        "lobby": {"type": "array", "items": {"type": "string"}, "description": "本局可用的种族"}
+                    },
+                    "required": []
+                }
+            },
+            {
+                "name": "search_cards",
+                "description": "按名称、描述、关键字和种族全文搜索随从和英雄卡牌，支持中文模糊匹配和等级、种族、关键字过滤",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "查询文本，如 圣盾、亡语 召唤"},
+                        "tier": {"type": "integer", "description": "按随从等级过滤"},
+                        "tribe": {"type": "string", "description": "按种族过滤，如 beast、mech、neutral"},
+                        "keyword": {"type": "string", "description": "按关键字过滤，如 divine_shield、deathrattle"},
+                        "kind": {"type": "string", "enum": ["minion", "hero"], "description": "只搜索随从或英雄"},
+                        "limit": {"type": "integer", "description": "最多返回的结果数，默认10"}
+                    },
+                    "required": []
+                }
+            },
+            {
+                "name": "get_metrics",
+                "description": "获取识别流水线指标：截屏、ROI提取、模板匹配、识别、序列化和广播各阶段的耗时分位数，处理和丢弃的帧数，每帧匹配次数和缓存命中率",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {},
+                    "required": []
+                }
+            },
+            {
+                "name": "profile_recognition",
+                "description": "对识别循环、帧识别和后台计算线程做若干秒的定时采样分析，返回耗时最多的函数和火焰图可用的折叠调用栈文件",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "seconds": {"type": "number", "description": "采样时长（秒），默认5，最多60"},
+                        "interval_ms": {"type": "number", "description": "采样间隔（毫秒），默认5"},
+                        "threads": {"type": "array", "items": {"type": "string"}, "description": "线程名前缀，缺省为识别和后台计算线程，[\"*\"]为全部线程"},
+                        "top": {"type": "integer", "description": "返回的函数排行条数，默认20"},
+                        "stacks": {"type": "boolean", "description": "是否附带全部折叠调用栈"}
+                    },
+                    "required": []
+                }
+            },
             {
                 "name": "start_recognition",
                 "description": "启动识别服务，开始实时识别游戏画面",
@@ -144,36 +284,19 @@ class SimpleMCPServer:
         print("等待请求...", file=sys.stderr)
         
         try:
-            while True:
-                # 读取标准输入
-                line = input()
-                if not line.strip():
-                    continue
-                
-                try:
-                    request = json.loads(line)
-                    response = self.handle_request(request)
-                    
-                    # 输出响应到标准输出
-                    print(json.dumps(response, ensure_ascii=False))
-                    sys.stdout.flush()
-                    
-                except json.JSONDecodeError:
-                    print(json.dumps({
-                        "jsonrpc": "2.0",
-                        "id": None,
-                        "error": {
-                            "code": -32700,
-                            "message": "Parse error"
-                        }
-                    }))
-                    sys.stdout.flush()
-                    
-        except EOFError:
+            # 并发处理请求，慢工具不会阻塞后续调用
+            # 标准输出只用于协议消息，其他模块的打印输出转到标准错误
+            protocol_output = sys.stdout
+            sys.stdout = sys.stderr
+            StdioTransport(self.handle_request, output=protocol_output).run()
             print("MCP服务器关闭", file=sys.stderr)
         except KeyboardInterrupt:
             print("MCP服务器被中断", file=sys.stderr)
 
 if __name__ == "__main__":
-    server = SimpleMCPServer()
+    parser = argparse.ArgumentParser(description="炉石战棋识别辅助系统MCP服务器")
+    parser.add_argument("--embedded", action="store_true", help="在本进程内运行识别流水线，不经过HTTP")
+    args = parser.parse_args()
+    
+    server = SimpleMCPServer(embedded=args.embedded)
     server.run()
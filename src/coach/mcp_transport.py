@@ -0,0 +1,142 @@
+"""
+MCP标准输入输出传输层
+基于asyncio的JSON-RPC循环：并发处理请求，支持批量请求和取消，响应按完成顺序写出
+"""
+
+import asyncio
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Union
+
+
+# JSON-RPC错误码
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+REQUEST_CANCELLED = -32800
+
+# 取消请求的方法名（LSP风格与MCP风格）
+CANCEL_METHODS = ("$/cancelRequest", "notifications/cancelled")
+# MCP规范要求被 notifications/cancelled 取消的请求不再发送响应；LSP风格的取消仍以RequestCancelled错误响应
+SILENT_CANCEL_METHODS = ("notifications/cancelled",)
+
+
+def error_response(request_id: Any, code: int, message: str) -> Dict[str, Any]:
+    """构造JSON-RPC错误响应"""
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+class StdioTransport:
+    """标准输入输出上的并发JSON-RPC传输
+
+    同步的请求处理函数在线程池中执行，慢工具不会阻塞后续请求；
+    读取标准输入使用独立线程，在Windows上同样可用。
+    """
+
+    def __init__(self, handle_request: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 max_workers: int = 8, output=None):
+        self.handle_request = handle_request
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mcp-worker")
+        self.output = output or sys.stdout
+        self._pending: Dict[Any, asyncio.Future] = {}
+        # 已取消且不应再响应的请求id
+        self._silenced: Set[Any] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def run(self):
+        """运行传输循环直到标准输入关闭"""
+        try:
+            asyncio.run(self.serve(sys.stdin))
+        finally:
+            self.executor.shutdown(wait=False)
+
+    async def serve(self, stream):
+        """从文本流逐行读取请求并并发处理"""
+        self._loop = asyncio.get_running_loop()
+        lines: asyncio.Queue = asyncio.Queue()
+
+        def reader():
+            for line in stream:
+                self._loop.call_soon_threadsafe(lines.put_nowait, line)
+            self._loop.call_soon_threadsafe(lines.put_nowait, None)
+
+        threading.Thread(target=reader, daemon=True, name="mcp-stdin").start()
+
+        tasks = set()
+        while True:
+            line = await lines.get()
+            if line is None:
+                break
+            if not line.strip():
+                continue
+            task = asyncio.create_task(self._handle_line(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # 输入结束后等待进行中的请求完成再退出
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _handle_line(self, line: str):
+        """处理一行输入：单个请求或批量请求"""
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            self._write(error_response(None, PARSE_ERROR, "Parse error"))
+            return
+
+        if isinstance(message, list):
+            if not message:
+                self._write(error_response(None, INVALID_REQUEST, "Invalid Request"))
+                return
+            responses = await asyncio.gather(*(self._dispatch(item) for item in message))
+            responses = [response for response in responses if response is not None]
+            if responses:
+                self._write(responses)
+        else:
+            response = await self._dispatch(message)
+            if response is not None:
+                self._write(response)
+
+    async def _dispatch(self, request: Any) -> Optional[Dict[str, Any]]:
+        """分发单个请求，通知（无id）不返回响应"""
+        if not isinstance(request, dict):
+            return error_response(None, INVALID_REQUEST, "Invalid Request")
+
+        method = request.get("method")
+        request_id = request.get("id")
+        is_notification = "id" not in request
+
+        if method in CANCEL_METHODS:
+            params = request.get("params") or {}
+            self._cancel(params.get("id", params.get("requestId")), respond=method not in SILENT_CANCEL_METHODS)
+            return None
+
+        future = self._loop.run_in_executor(self.executor, self.handle_request, request)
+        if not is_notification:
+            self._pending[request_id] = future
+        try:
+            response = await future
+        except asyncio.CancelledError:
+            if is_notification or request_id in self._silenced:
+                self._silenced.discard(request_id)
+                return None
+            return error_response(request_id, REQUEST_CANCELLED, "Request cancelled")
+        finally:
+            if not is_notification and self._pending.get(request_id) is future:
+                del self._pending[request_id]
+        return None if is_notification else response
+
+    def _cancel(self, request_id: Any, respond: bool = True):
+        """取消进行中的请求（工作线程中的执行无法中断，但其结果会被丢弃），``respond`` 为false时不再写出任何响应"""
+        future = self._pending.get(request_id)
+        if future and not future.done():
+            if not respond:
+                self._silenced.add(request_id)
+            future.cancel()
+
+    def _write(self, response: Union[Dict[str, Any], List[Dict[str, Any]]]):
+        """写出一条响应（只在事件循环线程中调用，不会交错）"""
+        self.output.write(json.dumps(response, ensure_ascii=False) + "\n")
+        self.output.flush()
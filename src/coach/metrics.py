@@ -0,0 +1,228 @@
+"""
+识别流水线指标
+常驻的轻量计时和计数：各阶段耗时直方图、处理和丢弃的帧数、每帧模板匹配次数、缓存命中率，
+按Prometheus文本格式或JSON导出
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# 流水线阶段：截屏、ROI提取、单次模板匹配、随从识别、英雄识别、整帧识别、主题序列化、入队广播
+STAGES = ("capture", "extract_roi", "template_match", "recognize_minions", "recognize_hero",
+          "recognize_frame", "serialize", "broadcast")
+
+# 耗时直方图的桶上界（秒）
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                1.0, 2.5, 5.0, 10.0)
+# 每帧模板匹配次数直方图的桶上界
+COUNT_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# 指标族：名称 -> (类型, 说明)
+FAMILIES = {
+    "coach_stage_seconds": ("histogram", "识别流水线各阶段耗时（秒）"),
+    "coach_template_matches_per_frame": ("histogram", "每帧的模板匹配次数"),
+    "coach_frames_processed_total": ("counter", "识别完成的帧数"),
+    "coach_frames_dropped_total": ("counter", "未能识别的帧数，按原因"),
+    "coach_messages_dropped_total": ("counter", "客户端积压时丢弃的推送消息数，按积压策略"),
+    "coach_cache_requests_total": ("counter", "缓存查询次数，按缓存和结果"),
+    "coach_cache_hit_ratio": ("gauge", "缓存命中率"),
+    "coach_active_connections": ("gauge", "当前WebSocket连接数"),
+    "coach_queued_messages": ("gauge", "各连接发送队列中等待的消息总数"),
+    "coach_uptime_seconds": ("gauge", "指标开始统计以来的秒数"),
+}
+
+# 标签集合：按标签名排序的 (名称, 值) 元组
+LabelSet = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _labels(labels: Dict[str, Any]) -> LabelSet:
+    """标签字典转换为可作为字典键的标签集合"""
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    """Prometheus标签文本，值中的反斜杠、引号和换行需要转义"""
+    parts = []
+    for key, value in labels:
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    """样本值文本：整数不带小数点，正无穷为 +Inf"""
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    """固定桶的直方图
+
+    ``observe`` 只做一次二分查找和三次加法，桶按上界左闭（值等于上界时计入该桶），导出时再累加为
+    Prometheus的累计计数。
+    """
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """记录一个值"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶内线性插值估计分位数，没有数据时返回None；落在最后一个桶时返回最大上界"""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def cumulative(self) -> Tuple[List[int], float, int]:
+        """累计桶计数（最后一项为 +Inf）、总和与次数"""
+        with self._lock:
+            counts, total_sum, total = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total_sum, total
+
+
+class MetricsRegistry:
+    """指标注册表
+
+    阶段耗时由调用方用 ``time.perf_counter`` 计时后 ``observe``；计数器按标签累加；
+    已有统计的组件（置换表、模板缓存、连接）注册采集函数，在导出时才读取，不在热路径上增加开销。
+    """
+
+    def __init__(self):
+        self.stages = {stage: Histogram(TIME_BUCKETS) for stage in STAGES}
+        self.matches_per_frame = Histogram(COUNT_BUCKETS)
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+
+    def observe(self, stage: str, seconds: float):
+        """记录一次阶段耗时"""
+        self.stages[stage].observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """计数器加 ``amount``"""
+        key = _labels(labels)
+        with self._lock:
+            family = self._counters.setdefault(name, {})
+            family[key] = family.get(key, 0) + amount
+
+    def register(self, collector: Callable[[], Iterable[Sample]]):
+        """注册采集函数，导出时调用，返回 [(指标名, 标签, 值)]"""
+        self._collectors.append(collector)
+
+    def samples(self) -> Dict[str, Dict[LabelSet, float]]:
+        """计数器和采集函数的当前值，按指标名分组，并由缓存查询次数推导命中率"""
+        with self._lock:
+            samples = {name: dict(family) for name, family in self._counters.items()}
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    family = samples.setdefault(name, {})
+                    key = _labels(labels)
+                    family[key] = family.get(key, 0) + value
+            except Exception as e:
+                print(f"指标采集失败: {e}")
+        requests: Dict[str, Dict[str, float]] = {}
+        for labels, value in samples.get("coach_cache_requests_total", {}).items():
+            label_map = dict(labels)
+            requests.setdefault(label_map.get("cache", ""), {})[label_map.get("result", "")] = value
+        for cache, results in requests.items():
+            total = sum(results.values())
+            samples.setdefault("coach_cache_hit_ratio", {})[_labels({"cache": cache})] = (
+                round(results.get("hit", 0) / total, 4) if total else 0.0)
+        samples["coach_uptime_seconds"] = {(): round(time.monotonic() - self.started_at, 3)}
+        return samples
+
+    def render(self) -> str:
+        """Prometheus文本格式（0.0.4）"""
+        lines: List[str] = []
+        histograms = [("coach_stage_seconds", {"stage": stage}, histogram) for stage, histogram in self.stages.items()]
+        histograms.append(("coach_template_matches_per_frame", {}, self.matches_per_frame))
+        emitted = set()
+        for name, labels, histogram in histograms:
+            if name not in emitted:
+                kind, help_text = FAMILIES[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                emitted.add(name)
+            cumulative, total_sum, total = histogram.cumulative()
+            base = _labels(labels)
+            for bound, count in zip(histogram.buckets + (float("inf"),), cumulative):
+                lines.append(f"{name}_bucket{_format_labels(base + (('le', _format_value(bound)),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(base)} {_format_value(total_sum)}")
+            lines.append(f"{name}_count{_format_labels(base)} {total}")
+        for name, family in sorted(self.samples().items()):
+            kind, help_text = FAMILIES.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(family.items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def stage_summary(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段的次数、平均和分位数耗时（毫秒），只包含有数据的阶段"""
+        summary = {}
+        for stage, histogram in self.stages.items():
+            _, total_sum, total = histogram.cumulative()
+            if not total:
+                continue
+            summary[stage] = {
+                "count": total,
+                "mean_ms": round(total_sum / total * 1000, 3),
+                "p50_ms": round(histogram.quantile(0.5) * 1000, 3),
+                "p95_ms": round(histogram.quantile(0.95) * 1000, 3),
+                "p99_ms": round(histogram.quantile(0.99) * 1000, 3),
+            }
+        return summary
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON形式的指标：阶段耗时摘要、每帧匹配次数和各计数器"""
+        _, match_sum, frames = self.matches_per_frame.cumulative()
+        samples = self.samples()
+        return {
+            "stages": self.stage_summary(),
+            "template_matches_per_frame": {
+                "mean": round(match_sum / frames, 1) if frames else None,
+                "p95": self.matches_per_frame.quantile(0.95),
+            },
+            "counters": {name: [dict(labels, value=value) if labels else {"value": value}
+                                for labels, value in sorted(family.items())]
+                         for name, family in sorted(samples.items())},
+        }
+
+
+@lru_cache(maxsize=None)
+def get_metrics() -> MetricsRegistry:
+    """获取进程内共享的指标注册表"""
+    return MetricsRegistry()
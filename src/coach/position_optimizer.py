@@ -0,0 +1,321 @@
+"""
+站位优化器
+基于战斗模拟搜索我方场面的最佳站位：相同随从互换视为同一站位（对称剪枝），
+候选站位按逐次减半分配模拟预算，已模拟的结果通过共享置换表复用（只写入达到最终预算的站位）
+"""
+
+import itertools
+import math
+import threading
+import time
+from dataclasses import astuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from card_database import CardDatabase, get_card_database
+from combat_simulator import CombatMinion, CombatSimulator, build_board
+from transposition_cache import (TranspositionCache, board_bytes, get_transposition_cache, matchup_key,
+                                 minion_bytes, outcome_row)
+
+
+def minion_key(minion: CombatMinion) -> Tuple:
+    """随从的战斗属性键（不含名称），键相同的随从互换位置不影响战斗"""
+    return astuple(minion)[:-1]
+
+
+def unique_orderings(keys: Sequence[Any]) -> List[Tuple[int, ...]]:
+    """生成多重集合的全部不同排列，返回原场面下标的元组（同类随从保持原相对顺序，因此包含原顺序本身）"""
+    groups: Dict[Any, List[int]] = {}
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+    if len(groups) == len(keys):
+        # 没有相同的随从：与下面的逐位生成顺序相同（字典序），直接用itertools
+        return list(itertools.permutations(range(len(keys))))
+    # 每个位置只决定放哪一类随从，同类随从按原相对顺序依次取用
+    kinds = list(groups)
+    kind_of = [kinds.index(key) for key in keys]
+    remaining = [len(groups[kind]) for kind in kinds]
+    orderings: List[Tuple[int, ...]] = []
+    current: List[int] = []
+
+    def extend():
+        if len(current) == len(keys):
+            used = [0] * len(kinds)
+            ordering = []
+            for kind in current:
+                ordering.append(groups[kinds[kind]][used[kind]])
+                used[kind] += 1
+            orderings.append(tuple(ordering))
+            return
+        seen = set()
+        for slot in range(len(keys)):
+            kind = kind_of[slot]
+            if kind in seen or not remaining[kind]:
+                continue
+            seen.add(kind)
+            remaining[kind] -= 1
+            current.append(kind)
+            extend()
+            current.pop()
+            remaining[kind] += 1
+
+    extend()
+    return orderings
+
+
+class PositionOptimizer:
+    """站位优化器
+
+    第一轮从全部站位中按种子抽取至多 ``max_candidates`` 个候选（当前站位始终在内），每个候选对每个对手
+    模拟 ``base_trials`` 次，之后每轮保留得分最高的 1/eta，剩余候选的累计模拟次数乘以growth
+    （growth小于eta时每轮总模拟量递减）；只剩top个候选时以 ``final_trials`` 次模拟确定排名。
+    每轮按 ``batch_trials`` 分批模拟，批次之间检查截止时间。截止时间的 ``final_share`` 留给最终评估：
+    淘汰轮用完其余时间后直接取已评估候选中得分最高的top个进入最终评估；剩余时间不足 ``final_share``
+    且按实测的单场模拟耗时估计最终评估无法在截止时间前完成，或最终评估途中到达截止时间时，
+    返回当前站位并标记 ``inconclusive``。
+    同一轮内所有候选使用相同的随机流（公共随机数），减小比较时的方差。
+    淘汰轮的统计只保存在本次搜索内，最终评估完成后才把进入最终评估的站位的新结果写入共享置换表，
+    避免每次搜索把成百上千个只模拟过一两次的站位写入表中、挤掉其他条目。
+    """
+
+    def __init__(self, simulator: Optional[CombatSimulator] = None, card_db: Optional[CardDatabase] = None,
+                 base_trials: int = 1, eta: int = 4, growth: int = 2, final_trials: int = 512,
+                 deadline_ms: float = 1000.0, final_share: float = 0.25, max_candidates: int = 720,
+                 batch_trials: int = 512, cache: Optional[TranspositionCache] = None):
+        self.card_db = card_db or get_card_database()
+        self.simulator = simulator or CombatSimulator(self.card_db)
+        self.base_trials = base_trials
+        self.eta = eta
+        self.growth = growth
+        self.final_trials = final_trials
+        self.deadline_ms = deadline_ms
+        self.final_share = final_share
+        self.max_candidates = max_candidates
+        self.batch_trials = batch_trials
+        self.cache = get_transposition_cache() if cache is None else cache
+        self._lock = threading.Lock()
+
+    def optimize(self, board: Iterable[Any], opponents: Sequence[Iterable[Any]], seed: int = 0,
+                 deadline_ms: Optional[float] = None, tier: int = 1, top: int = 3) -> Dict[str, Any]:
+        """搜索最佳站位，返回推荐顺序及其相对当前站位的胜率变化"""
+        with self._lock:
+            return self._optimize(board, opponents, seed, deadline_ms, tier, top)
+
+    def _optimize(self, board: Iterable[Any], opponents: Sequence[Iterable[Any]], seed: int,
+                  deadline_ms: Optional[float], tier: int, top: int) -> Dict[str, Any]:
+        started = time.perf_counter()
+        deadline_ms = self.deadline_ms if deadline_ms is None else deadline_ms
+        deadline = started + deadline_ms / 1000 if deadline_ms and deadline_ms > 0 else None
+        # 留给最终评估的时间；淘汰轮在此之前结束
+        reserve = deadline_ms / 1000 * self.final_share if deadline is not None else 0.0
+        halving_deadline = deadline - reserve if deadline is not None else None
+
+        board = build_board(board, self.card_db)
+        opponent_boards = [build_board(opponent, self.card_db) for opponent in opponents]
+        opponent_boards = [opponent for opponent in opponent_boards if opponent]
+        if not board:
+            raise ValueError("我方场面为空")
+        if not opponent_boards:
+            raise ValueError("没有可用的对手场面")
+
+        keys = [minion_key(minion) for minion in board]
+        orderings = unique_orderings(keys)
+        current = tuple(range(len(board)))
+        encoded = [minion_bytes(minion) for minion in board]
+        opponent_keys = [board_bytes(opponent) for opponent in opponent_boards]
+        # (站位, 对手场面) -> 本次搜索的累计统计（含从置换表读到的结果），以及其中尚未写入置换表的新结果
+        stats: Dict[Tuple[Tuple[int, ...], bytes], np.ndarray] = {}
+        fresh: Dict[Tuple[Tuple[int, ...], bytes], np.ndarray] = {}
+        # 实测的模拟耗时：目前最大的一批的模拟次数和秒数
+        timing = {"trials": 0, "seconds": 0.0}
+        hits_before = self.cache.hits
+
+        # 当前站位排在最前，截止时间提前到达时也保证已评估
+        candidates = [current] + [ordering for ordering in orderings if ordering != current]
+        if len(candidates) > self.max_candidates:
+            rng = np.random.default_rng([seed, len(orderings)])
+            picked = rng.choice(np.arange(1, len(candidates)), self.max_candidates - 1, replace=False)
+            candidates = [current] + [candidates[i] for i in np.sort(picked)]
+        sampled = len(candidates)
+        trials = self.base_trials
+        rounds = 0
+        simulated = 0
+        timed_out = inconclusive = False
+        while True:
+            # 淘汰到只剩top个候选后，用最终预算评估它们
+            final = len(candidates) <= top
+            if final:
+                trials = max(trials, self.final_trials)
+            # 当前站位始终参与评估，用于计算胜率变化
+            evaluated = candidates if current in candidates else [current] + candidates
+            if final and deadline is not None and timing["trials"]:
+                now = time.perf_counter()
+                cost = self._pending_trials(stats, encoded, evaluated, opponent_keys, trials, tier)
+                if deadline - now < reserve and now + cost * timing["seconds"] / timing["trials"] > deadline:
+                    inconclusive = True
+                    break
+            count, complete = self._evaluate(stats, fresh, timing, board, encoded, evaluated, opponent_boards,
+                                             opponent_keys, trials, seed, rounds, tier,
+                                             deadline if final else halving_deadline)
+            simulated += count
+            rounds += 1
+            if final:
+                if complete:
+                    self._store(fresh, encoded, evaluated, opponent_keys, tier)
+                else:
+                    # 最终评估途中到达截止时间，各候选的模拟次数不一致，排名不可靠
+                    timed_out = inconclusive = True
+                break
+            scores = self._scores(stats, candidates, opponent_keys)
+            keep = max(top, math.ceil(len(candidates) / self.eta))
+            if halving_deadline is not None and time.perf_counter() >= halving_deadline:
+                # 淘汰轮超时：直接取已评估的候选进入最终评估
+                timed_out = True
+                keep = min(top, int(np.isfinite(scores).sum()))
+            order = np.argsort(-scores, kind="stable")[:keep]
+            candidates = [candidates[i] for i in order]
+            trials *= self.growth
+
+        scores = self._scores(stats, candidates, opponent_keys)
+        ranked = [candidates[i] for i in np.argsort(-scores, kind="stable")]
+        baseline = self._summary(stats, board, current, opponent_keys)
+        recommendations = []
+        # 最终评估未完成时排名不可靠，保留当前站位
+        for ordering in [current] if inconclusive else ranked[:top]:
+            summary = self._summary(stats, board, ordering, opponent_keys)
+            summary["win_delta"] = round(summary["win"] - baseline["win"], 4)
+            summary["loss_delta"] = round(summary["loss"] - baseline["loss"], 4)
+            recommendations.append(summary)
+
+        return {
+            "best": recommendations[0],
+            "current": baseline,
+            "alternatives": recommendations[1:],
+            "orderings": len(orderings),
+            "sampled": sampled,
+            "permutations": math.factorial(len(board)),
+            "rounds": rounds,
+            "simulated_trials": simulated,
+            "opponents": len(opponent_boards),
+            "timed_out": timed_out,
+            "inconclusive": inconclusive,
+            "transposition": {"entries": len(self.cache), "hits": self.cache.hits - hits_before,
+                              "hit_rate": self.cache.stats()["hit_rate"]},
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    def _pending_trials(self, stats: Dict, encoded: Sequence[bytes], orderings: Sequence[Tuple[int, ...]],
+                        opponent_keys: Sequence[bytes], trials: int, tier: int) -> int:
+        """把每个站位对每个对手的累计模拟次数补足到trials还需模拟的次数（与 ``_evaluate`` 的分配方式一致）"""
+        total = 0
+        for opponent_key in opponent_keys:
+            counts = []
+            for ordering in orderings:
+                row = stats.get((ordering, opponent_key))
+                if row is None:
+                    row = self.cache.peek(self._matchup(encoded, ordering, opponent_key, tier))
+                n = 0 if row is None else int(row[0])
+                if n < trials:
+                    counts.append(n)
+            if counts:
+                total += len(counts) * (trials - min(counts))
+        return total
+
+    @staticmethod
+    def _matchup(encoded: Sequence[bytes], ordering: Tuple[int, ...], opponent_key: bytes, tier: int) -> str:
+        """站位对某个对手场面的置换表键"""
+        return matchup_key(len(ordering).to_bytes(1, "little") + b"".join(encoded[i] for i in ordering),
+                           opponent_key, tier)
+
+    def _evaluate(self, stats: Dict, fresh: Dict, timing: Dict, board: List[CombatMinion], encoded: Sequence[bytes],
+                  orderings: Sequence[Tuple[int, ...]],
+                  opponents: Sequence[List[CombatMinion]], opponent_keys: Sequence[bytes],
+                  trials: int, seed: int, round_index: int, tier: int,
+                  until: Optional[float] = None) -> Tuple[int, bool]:
+        """把每个站位对每个对手的累计模拟次数补足到trials，返回本轮新模拟的次数和是否全部补足
+
+        站位按 ``batch_trials`` 分批模拟，批次之间到达 ``until`` 时跳过该对手其余的批次，这些站位保持原有的
+        模拟次数；每个对手的第一批总会模拟，排在最前的站位（第一轮的当前站位）因此对每个对手都有结果。
+        新结果只累加到本次搜索的统计中，由 ``_store`` 在最终评估后写入置换表。
+        """
+        simulated = 0
+        complete = True
+        for opponent, opponent_key in zip(opponents, opponent_keys):
+            pending = []
+            for ordering in orderings:
+                row = stats.get((ordering, opponent_key))
+                if row is None:
+                    row = self.cache.lookup(self._matchup(encoded, ordering, opponent_key, tier), trials)
+                    if row is not None:
+                        stats[(ordering, opponent_key)] = row
+                if row is None or row[0] < trials:
+                    pending.append((ordering, 0 if row is None else int(row[0])))
+            if not pending:
+                continue
+            # 同一轮补足的次数相同，各批次共用随机流
+            need = trials - min(n for _, n in pending)
+            size = max(1, self.batch_trials // need)
+            for start in range(0, len(pending), size):
+                if until is not None and start and time.perf_counter() >= until:
+                    complete = False
+                    break
+                batch = pending[start:start + size]
+                rng = np.random.default_rng([seed, round_index, need])
+                pairs = [([board[i] for i in ordering], opponent) for ordering, _ in batch]
+                began = time.perf_counter()
+                outcome = self.simulator.run_pairs(pairs, need, rng, tier=tier)
+                if len(batch) * need >= timing["trials"]:
+                    timing["trials"], timing["seconds"] = len(batch) * need, time.perf_counter() - began
+                winner = outcome.winner.reshape(len(batch), need)
+                damage = outcome.damage.reshape(len(batch), need)
+                for index, (ordering, _) in enumerate(batch):
+                    row = outcome_row(winner[index], damage[index])
+                    for table in (stats, fresh):
+                        previous = table.get((ordering, opponent_key))
+                        table[(ordering, opponent_key)] = row if previous is None else previous + row
+                simulated += len(batch) * need
+        return simulated, complete
+
+    def _store(self, fresh: Dict, encoded: Sequence[bytes], orderings: Sequence[Tuple[int, ...]],
+               opponent_keys: Sequence[bytes], tier: int):
+        """把进入最终评估的站位在本次搜索中的新结果累加到置换表"""
+        for opponent_key in opponent_keys:
+            for ordering in orderings:
+                row = fresh.pop((ordering, opponent_key), None)
+                if row is not None:
+                    self.cache.add(self._matchup(encoded, ordering, opponent_key, tier), row)
+
+    @staticmethod
+    def _scores(stats: Dict, orderings: Sequence[Tuple[int, ...]], opponent_keys: Sequence[bytes]) -> np.ndarray:
+        """站位得分：各对手的（胜率 - 负率）平均值，相同时按期望伤害区分；尚未模拟过的站位为负无穷"""
+        scores = np.zeros(len(orderings))
+        for index, ordering in enumerate(orderings):
+            for opponent_key in opponent_keys:
+                row = stats.get((ordering, opponent_key))
+                if row is None or not row[0]:
+                    scores[index] = -np.inf
+                    break
+                n, wins, _, losses, damage = row[:5]
+                scores[index] += (wins - losses) / n + damage / n * 1e-3
+        return scores / len(opponent_keys)
+
+    @staticmethod
+    def _summary(stats: Dict, board: List[CombatMinion], ordering: Tuple[int, ...],
+                 opponent_keys: Sequence[bytes]) -> Dict[str, Any]:
+        """站位的平均胜/平/负概率"""
+        totals = np.zeros(5, dtype=np.float64)
+        for opponent_key in opponent_keys:
+            row = stats[(ordering, opponent_key)][:5]
+            if row[0]:
+                totals += row / row[0]
+        totals /= len(opponent_keys)
+        return {
+            "order": [board[i].name or f"#{i}" for i in ordering],
+            "positions": list(ordering),
+            "win": round(float(totals[1]), 4),
+            "tie": round(float(totals[2]), 4),
+            "loss": round(float(totals[3]), 4),
+            "expected_damage": round(float(totals[4]), 3),
+            "trials": int(min(stats[(ordering, key)][0] for key in opponent_keys)),
+        }
@@ -0,0 +1,182 @@
+"""
+采样分析器
+按需在若干秒内由独立线程定时读取指定线程的调用栈（sys._current_frames），统计折叠调用栈和耗时最多的函数。
+不使用sys.setprofile等钩子，空闲时没有任何开销；折叠调用栈可直接交给flamegraph.pl或speedscope生成火焰图
+"""
+
+import concurrent.futures.thread
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+# 默认采样的线程（按名称前缀）：识别循环、帧识别线程池、建议和对手场面的后台预计算
+DEFAULT_THREADS = ("recognition-worker", "frame-worker", "advice-worker", "ghost-precompute")
+MAX_SECONDS = 60.0
+MIN_INTERVAL_MS = 1.0
+
+# 栈顶位于这些模块时线程在等待锁、事件或任务队列，默认不计入样本
+_IDLE_FILES = {os.path.abspath(module.__file__) for module in (threading, queue, concurrent.futures.thread)}
+
+# 同一时间只允许一次采样
+_capture_lock = threading.Lock()
+
+
+def frame_label(code) -> str:
+    """调用栈中一层的名称：函数名（文件名:定义行号）"""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """定时采样指定线程的调用栈
+
+    ``threads`` 为线程名前缀，包含 ``"*"`` 时采样除自身外的全部线程。
+    """
+
+    def __init__(self, interval: float = 0.005, threads: Iterable[str] = DEFAULT_THREADS,
+                 max_depth: int = 128, include_idle: bool = False):
+        self.interval = interval
+        self.threads = tuple(threads)
+        self.max_depth = max_depth
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.thread_samples: Counter = Counter()
+        self.ticks = 0
+        self.idle = 0
+        self.elapsed = 0.0
+
+    def _targets(self) -> Dict[int, str]:
+        """当前需要采样的线程：标识 -> 名称"""
+        current = threading.get_ident()
+        everything = "*" in self.threads
+        return {thread.ident: thread.name for thread in threading.enumerate()
+                if thread.ident != current and (everything or thread.name.startswith(self.threads))}
+
+    def _stack(self, frame) -> Tuple[Tuple[str, ...], bool]:
+        """从栈底到栈顶的调用栈，以及栈顶是否处于等待"""
+        idle = not self.include_idle and os.path.abspath(frame.f_code.co_filename) in _IDLE_FILES
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(frame_label(frame.f_code))
+            frame = frame.f_back
+        return tuple(reversed(labels)), idle
+
+    def sample(self):
+        """采样一次所有目标线程"""
+        frames = sys._current_frames()
+        for ident, name in self._targets().items():
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack, idle = self._stack(frame)
+            if idle:
+                self.idle += 1
+                continue
+            self.stacks[(name,) + stack] += 1
+            self.thread_samples[name] += 1
+        self.ticks += 1
+
+    def run(self, seconds: float):
+        """采样 ``seconds`` 秒（阻塞调用线程），按间隔补偿采样本身的耗时"""
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_tick = started
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now >= next_tick:
+                self.sample()
+                next_tick += self.interval
+                if next_tick < now:
+                    # 采样落后时不追赶，避免连续采样
+                    next_tick = now + self.interval
+            else:
+                time.sleep(min(next_tick, deadline) - now)
+        self.elapsed = time.perf_counter() - started
+
+    def collapsed(self) -> List[str]:
+        """折叠调用栈（"线程;栈底;...;栈顶 样本数"），按样本数从多到少排列"""
+        return [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()]
+
+    def top_functions(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """按自身样本数（位于栈顶）排列的函数，附带包含子调用的样本数"""
+        total_samples = sum(self.stacks.values())
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for label in set(frames):
+                inclusive[label] += count
+        ranked = sorted(inclusive, key=lambda label: (own[label], inclusive[label]), reverse=True)[:limit]
+        return [{
+            "function": label,
+            "self": own[label],
+            "total": inclusive[label],
+            "self_pct": round(own[label] / total_samples * 100, 2) if total_samples else 0.0,
+            "total_pct": round(inclusive[label] / total_samples * 100, 2) if total_samples else 0.0,
+        } for label in ranked]
+
+    def save(self, path: Path):
+        """写入折叠调用栈文件"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.collapsed()) + "\n")
+
+
+def default_dir() -> Path:
+    """折叠调用栈文件的默认目录"""
+    return Path(__file__).parent / "output" / "profiles"
+
+
+def capture_profile(seconds: float = 5.0, interval_ms: float = 5.0, threads: Optional[Iterable[str]] = None,
+                    top: int = 20, include_idle: bool = False, stacks: bool = False,
+                    output_dir: Optional[Path] = None) -> Dict[str, Any]:
+    """采样 ``seconds`` 秒并保存折叠调用栈，参数无效或已有采样在进行时抛出ValueError
+
+    ``stacks`` 为true时在结果中附带全部折叠调用栈，否则只返回文件路径和函数排行。
+    """
+    seconds = float(seconds)
+    interval_ms = float(interval_ms)
+    if not 0 < seconds <= MAX_SECONDS:
+        raise ValueError(f"采样时长应在0到{MAX_SECONDS:g}秒之间")
+    if interval_ms < MIN_INTERVAL_MS:
+        raise ValueError(f"采样间隔不能小于{MIN_INTERVAL_MS:g}毫秒")
+    if isinstance(threads, str):
+        threads = [threads]
+    if not _capture_lock.acquire(blocking=False):
+        raise ValueError("已有采样正在进行")
+    try:
+        profiler = SamplingProfiler(interval_ms / 1000, threads or DEFAULT_THREADS, include_idle=include_idle)
+        profiler.run(seconds)
+    finally:
+        _capture_lock.release()
+
+    path = (output_dir or default_dir()) / f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]}.folded"
+    try:
+        profiler.save(path)
+    except OSError as e:
+        print(f"保存采样结果失败: {e}")
+        path = None
+    result = {
+        "seconds": round(profiler.elapsed, 3),
+        "interval_ms": interval_ms,
+        "ticks": profiler.ticks,
+        "samples": sum(profiler.stacks.values()),
+        "idle_samples": profiler.idle,
+        "threads": dict(profiler.thread_samples.most_common()),
+        "top": profiler.top_functions(top),
+        "file": str(path) if path else None,
+    }
+    if stacks:
+        result["collapsed"] = profiler.collapsed()
+    return result
@@ -6,11 +6,57 @@
 import cv2
 import numpy as np
 import os
-import json
+import threading
+import time
 from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 from pathlib import Path
 
+from card_database import get_card_database
+from metrics import get_metrics
+
+
+# ROI布局对应的画面尺寸（宽, 高）
+FRAME_SIZE = (1920, 1080)
+
+# 游戏界面ROI：名称 -> (x, y, 宽, 高)，基于1920x1080分辨率
+ROIS = {
+    "shop": (400, 200, 800, 400),      # 商店区域
+    "board": (400, 600, 800, 300),     # 我方场面
+    "hero": (100, 800, 200, 200),      # 英雄区域
+    "gold": (1600, 800, 100, 50),      # 金币区域
+    "tavern_tier": (1600, 700, 100, 50), # 酒馆等级
+    "turn": (1600, 600, 100, 50),      # 回合数
+    # 战斗阶段：对手场面位于商店区域，对手英雄位于画面顶部
+    "opponent_board": (400, 250, 800, 300),
+    "opponent_hero": (860, 20, 200, 200),
+}
+
+
+def check_frame(frame) -> None:
+    """检查帧是否为ROI布局对应尺寸的BGR图像，否则抛出ValueError"""
+    if not isinstance(frame, np.ndarray) or frame.ndim != 3 or frame.shape[2] != 3:
+        shape = getattr(frame, "shape", None)
+        raise ValueError(f"帧应为 高x宽x3 的BGR图像，实际形状: {shape}")
+    height, width = frame.shape[:2]
+    if (width, height) != FRAME_SIZE:
+        raise ValueError(f"帧尺寸 {width}x{height} 与ROI布局的 {FRAME_SIZE[0]}x{FRAME_SIZE[1]} 不符")
+
+
+def fit_frame(frame: np.ndarray) -> np.ndarray:
+    """把其他分辨率的BGR帧缩放到ROI布局的尺寸，灰度和BGRA图像先转换为BGR"""
+    if not isinstance(frame, np.ndarray) or frame.ndim not in (2, 3) or frame.size == 0:
+        raise ValueError(f"无效的帧: {getattr(frame, 'shape', None)}")
+    if frame.ndim == 2:
+        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    elif frame.shape[2] == 4:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+    height, width = frame.shape[:2]
+    if (width, height) != FRAME_SIZE:
+        shrink = width * height > FRAME_SIZE[0] * FRAME_SIZE[1]
+        frame = cv2.resize(frame, FRAME_SIZE, interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+    return frame
+
 
 @dataclass
 class MatchResult:
@@ -53,6 +99,12 @@ class GameState:
     hero: HeroInfo
     shop: Dict
     board: Dict
+    phase: str = "recruit"               # recruit: 招募阶段，combat: 战斗阶段
+    opponent: Optional[Dict] = None      # 战斗阶段的对手英雄和场面
+    
+    def to_dict(self) -> Dict:
+        """转换为可JSON序列化的字典"""
+        return asdict(self)
 
 
 class TemplateManager:
@@ -61,6 +113,10 @@ class TemplateManager:
     def __init__(self, template_dir: str = "static/media"):
         self.template_dir = Path(template_dir)
         self.templates = {}
+        self._scaled: Dict[Tuple[str, float, int], np.ndarray] = {}
+        # 缩放模板缓存的命中统计，由指标采集函数读取
+        self.scaled_hits = 0
+        self.scaled_misses = 0
         self.load_templates()
     
     def load_templates(self):
@@ -86,67 +142,145 @@ class TemplateManager:
     def get_template(self, template_id: str) -> Optional[np.ndarray]:
         """获取指定模板"""
         return self.templates.get(template_id)
+    
+    def get_scaled(self, template_id: str, scale: float, reduction: int = 1) -> Optional[np.ndarray]:
+        """获取缩放后的模板（结果缓存），reduction > 1 时再缩小为金字塔层级的分辨率"""
+        key = (template_id, scale, reduction)
+        scaled = self._scaled.get(key)
+        if scaled is not None:
+            self.scaled_hits += 1
+        else:
+            self.scaled_misses += 1
+            template = self.templates.get(template_id)
+            if template is None:
+                return None
+            width = int(template.shape[1] * scale)
+            height = int(template.shape[0] * scale)
+            if width <= 0 or height <= 0:
+                return None
+            if reduction == 1:
+                scaled = cv2.resize(template, (width, height))
+            else:
+                full = self.get_scaled(template_id, scale)
+                scaled = cv2.resize(full, (max(1, width // reduction), max(1, height // reduction)),
+                                    interpolation=cv2.INTER_AREA)
+            self._scaled[key] = scaled
+        return scaled
+
+
+def _swapped(image: np.ndarray, template: np.ndarray) -> Optional[bool]:
+    """matchTemplate是否会交换两者（模板比图像大时），大小关系不一致无法匹配时返回None"""
+    if image.shape[0] >= template.shape[0] and image.shape[1] >= template.shape[1]:
+        return False
+    if image.shape[0] <= template.shape[0] and image.shape[1] <= template.shape[1]:
+        return True
+    return None
+
+
+def _peaks(result: np.ndarray, count: int) -> List[Tuple[float, Tuple[int, int]]]:
+    """匹配结果中得分最高的若干个峰值，每取一个峰值后抑制其邻域"""
+    result = result.copy()
+    peaks = []
+    for _ in range(count):
+        _, max_val, _, (x, y) = cv2.minMaxLoc(result)
+        if not np.isfinite(max_val) or (peaks and max_val <= -1):
+            break
+        peaks.append((max_val, (x, y)))
+        result[max(0, y - 2):y + 3, max(0, x - 2):x + 3] = -2
+    return peaks
+
+
+def _refine(roi: np.ndarray, template: np.ndarray, x: int, y: int, pad: int) -> Tuple[float, Tuple[int, int]]:
+    """在粗匹配坐标附近的窗口内做全分辨率匹配，返回得分和ROI坐标系下的位置"""
+    # 与matchTemplate一致：模板比ROI大时在模板中滑动ROI
+    large, small = (template, roi) if _swapped(roi, template) else (roi, template)
+    height, width = large.shape[:2]
+    x0 = max(0, min(x - pad, width - small.shape[1]))
+    y0 = max(0, min(y - pad, height - small.shape[0]))
+    window = large[y0:min(height, y0 + small.shape[0] + 2 * pad), x0:min(width, x0 + small.shape[1] + 2 * pad)]
+    result = cv2.matchTemplate(window, small, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, (dx, dy) = cv2.minMaxLoc(result)
+    return max_val, (x0 + dx, y0 + dy)
 
 
 class RecognitionEngine:
-    """识别引擎主类"""
+    """识别引擎主类
     
-    def __init__(self):
-        self.template_manager = TemplateManager()
-        self.minions_data = self.load_minions_data()
-        self.heroes_data = self.load_heroes_data()
-        
-        # 游戏界面ROI定义（基于1920x1080分辨率）
-        self.rois = {
-            "shop": (400, 200, 800, 400),      # 商店区域
-            "board": (400, 600, 800, 300),     # 我方场面
-            "hero": (100, 800, 200, 200),      # 英雄区域
-            "gold": (1600, 800, 100, 50),      # 金币区域
-            "tavern_tier": (1600, 700, 100, 50), # 酒馆等级
-            "turn": (1600, 600, 100, 50),      # 回合数
-        }
+    match_strategy 为 "exhaustive"（默认）时每个尺度都在整个ROI上做全分辨率匹配；为 "pyramid" 时先在低分辨率下
+    定位候选位置和尺度，再在候选附近精确匹配，识别随从和英雄时匹配得分达到 certain_threshold 即停止尝试其余模板。
+    pyramid 需在录制的帧集上用 ``batch_recognize.py --verify`` 确认与 exhaustive 结果一致后再作为默认策略。
+    灰度标准差低于 min_roi_std 的区域（黑屏、纯色或空位置）不做匹配；画面顶部连续 combat_frames 帧
+    识别为同一对手英雄时才判定为战斗阶段。
+    """
     
-    def load_minions_data(self) -> Dict:
-        """加载随从数据"""
-        try:
-            with open("data/bgs/minions.json", "r", encoding="utf-8") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
+    MATCH_STRATEGIES = ("exhaustive", "pyramid")
+    PYRAMID_FACTOR = 4
     
-    def load_heroes_data(self) -> Dict:
-        """加载英雄数据"""
-        try:
-            with open("data/bgs/heroes.json", "r", encoding="utf-8") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
+    def __init__(self, match_strategy: str = "exhaustive", top_k: int = 3,
+                 certain_threshold: float = 0.95, coarse_margin: float = 0.15,
+                 min_roi_std: float = 10.0, combat_frames: int = 3, static_diff: float = 2.0,
+                 template_manager: Optional[TemplateManager] = None):
+        if match_strategy not in self.MATCH_STRATEGIES:
+            raise ValueError(f"未知的匹配策略: {match_strategy}")
+        self.match_strategy = match_strategy
+        self.top_k = top_k
+        self.certain_threshold = certain_threshold
+        self.coarse_margin = coarse_margin
+        self.min_roi_std = min_roi_std
+        self.combat_frames = max(1, combat_frames)
+        self.static_diff = static_diff
+        self.scales = [0.8, 0.9, 1.0, 1.1, 1.2]   # 多尺度模板匹配
+        # 多个引擎可以共用已加载的模板（只读，缩放缓存的并发写入是幂等的）
+        self.template_manager = template_manager or TemplateManager()
+        self.metrics = get_metrics()
+        # 当前帧的模板匹配次数（帧识别线程池中的多个线程共用同一个引擎，按线程分别计数）
+        self._frame = threading.local()
+        # 战斗阶段判定：上次扫描的对手英雄区域缩略图及结果，以及连续识别为同一英雄的帧数
+        self._combat_lock = threading.Lock()
+        self._opponent_thumb: Optional[np.ndarray] = None
+        self._opponent_seen: Optional[HeroInfo] = None
+        self._combat_hero: Optional[str] = None
+        self._combat_streak = 0
+        self.card_db = get_card_database()
+        
+        # 游戏界面ROI定义（基于1920x1080分辨率）
+        self.rois = dict(ROIS)
     
     def extract_roi(self, frame: np.ndarray, roi_name: str) -> np.ndarray:
         """提取指定ROI区域"""
+        started = time.perf_counter()
         x, y, w, h = self.rois[roi_name]
-        return frame[y:y+h, x:x+w]
+        roi = frame[y:y+h, x:x+w]
+        self.metrics.observe("extract_roi", time.perf_counter() - started)
+        return roi
     
     def template_match(self, roi: np.ndarray, template_id: str, 
                       threshold: float = 0.7) -> Optional[MatchResult]:
-        """模板匹配"""
+        """模板匹配，按 ``match_strategy`` 选择逐尺度全分辨率匹配或由粗到精的金字塔匹配"""
         template = self.template_manager.get_template(template_id)
         if template is None:
             return None
-        
-        # 多尺度模板匹配
-        scales = [0.8, 0.9, 1.0, 1.1, 1.2]
+        started = time.perf_counter()
+        if self.match_strategy == "pyramid":
+            match = self._pyramid_match(roi, template_id, threshold)
+        else:
+            match = self._exhaustive_match(roi, template_id, threshold)
+        self._frame.matches = getattr(self._frame, "matches", 0) + 1
+        self.metrics.observe("template_match", time.perf_counter() - started)
+        return match
+    
+    def _exhaustive_match(self, roi: np.ndarray, template_id: str,
+                          threshold: float) -> Optional[MatchResult]:
+        """在整个ROI上对每个尺度做全分辨率匹配"""
         best_match = None
         best_confidence = 0
         
-        for scale in scales:
+        for scale in self.scales:
             # 缩放模板
-            width = int(template.shape[1] * scale)
-            height = int(template.shape[0] * scale)
-            if width <= 0 or height <= 0:
+            resized_template = self.template_manager.get_scaled(template_id, scale)
+            if resized_template is None:
                 continue
-            
-            resized_template = cv2.resize(template, (width, height))
+            height, width = resized_template.shape[:2]
             
             # 模板匹配
             result = cv2.matchTemplate(roi, resized_template, cv2.TM_CCOEFF_NORMED)
@@ -163,8 +297,73 @@ class RecognitionEngine:
         
         return best_match
     
+    def _pyramid_match(self, roi: np.ndarray, template_id: str,
+                       threshold: float) -> Optional[MatchResult]:
+        """由粗到精的匹配
+        
+        先在 1/PYRAMID_FACTOR 分辨率下对所有尺度匹配整个ROI，取得分最高的 ``top_k`` 个峰值，
+        再只在峰值附近的小窗口内做全分辨率匹配；粗匹配得分低于阈值减 ``coarse_margin`` 时直接放弃，
+        精匹配得分达到 ``certain_threshold`` 时不再检查其余峰值。
+        """
+        factor = self.PYRAMID_FACTOR
+        small_roi = cv2.resize(roi, (max(1, roi.shape[1] // factor), max(1, roi.shape[0] // factor)),
+                               interpolation=cv2.INTER_AREA)
+        
+        candidates = []  # (粗匹配得分, 尺度, 全分辨率坐标)
+        for scale in self.scales:
+            resized_template = self.template_manager.get_scaled(template_id, scale)
+            if resized_template is None:
+                continue
+            small_template = self.template_manager.get_scaled(template_id, scale, factor)
+            swapped = _swapped(roi, resized_template)
+            if swapped is None or _swapped(small_roi, small_template) != swapped:
+                # 两者大小关系无法在低分辨率下保持（或无法匹配），该尺度直接做全分辨率匹配
+                result = cv2.matchTemplate(roi, resized_template, cv2.TM_CCOEFF_NORMED)
+                _, max_val, _, max_loc = cv2.minMaxLoc(result)
+                candidates.append((max_val, scale, max_loc, True))
+                continue
+            result = cv2.matchTemplate(small_roi, small_template, cv2.TM_CCOEFF_NORMED)
+            for confidence, (x, y) in _peaks(result, self.top_k):
+                candidates.append((confidence, scale, (x * factor, y * factor), False))
+        
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        if not candidates or candidates[0][0] <= threshold - self.coarse_margin:
+            return None
+        
+        best_match = None
+        best_confidence = 0
+        for coarse, scale, (x, y), exact in candidates[:self.top_k]:
+            if coarse <= threshold - self.coarse_margin:
+                break
+            resized_template = self.template_manager.get_scaled(template_id, scale)
+            if exact:
+                confidence, position = coarse, (x, y)
+            else:
+                confidence, position = _refine(roi, resized_template, x, y, 2 * factor)
+            if confidence > best_confidence and confidence > threshold:
+                best_confidence = confidence
+                best_match = MatchResult(
+                    template_id=template_id,
+                    confidence=confidence,
+                    position=position,
+                    size=(resized_template.shape[1], resized_template.shape[0])
+                )
+                if confidence >= self.certain_threshold:
+                    break
+        
+        return best_match
+    
+    def _certain(self, match: MatchResult) -> bool:
+        """金字塔策略下匹配得分足够高时不再尝试其余模板"""
+        return self.match_strategy == "pyramid" and match.confidence >= self.certain_threshold
+    
+    def _flat(self, roi: np.ndarray) -> bool:
+        """区域接近纯色：归一化相关匹配在纯色区域上的得分没有意义（可能对任何模板都接近1）"""
+        return roi.size == 0 or float(cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY).std()) < self.min_roi_std
+    
     def recognize_minions(self, shop_roi: np.ndarray) -> List[MinionInfo]:
         """识别商店随从"""
+        started = time.perf_counter()
         minions = []
         
         # 简单的网格分割（假设7个随从位置）
@@ -174,6 +373,8 @@ class RecognitionEngine:
         for i in range(7):
             x = i * card_width
             card_roi = shop_roi[:, x:x+card_width]
+            if self._flat(card_roi):
+                continue
             
             # 尝试匹配所有随从模板
             best_match = None
@@ -185,6 +386,8 @@ class RecognitionEngine:
                     if match and match.confidence > best_confidence:
                         best_confidence = match.confidence
                         best_match = match
+                        if self._certain(match):
+                            break
             
             if best_match:
                 minion_name = best_match.template_id.replace("minion_", "")
@@ -196,63 +399,104 @@ class RecognitionEngine:
                         name=minion_name,
                         attack=minion_info.get("attack", 0),
                         health=minion_info.get("health", 0),
-                        tier=minion_info.get("tier", 0),
-                        tribe=minion_info.get("tribe", ""),
+                        tier=(minion_info.get("battlegrounds") or {}).get("tier", 0),
+                        tribe=",".join(self.card_db.tribes_of(minion_name)),
                         golden=False  # 暂时不识别金卡
                     ))
         
+        self.metrics.observe("recognize_minions", time.perf_counter() - started)
         return minions
     
     def get_minion_info(self, minion_name: str) -> Optional[Dict]:
-        """获取随从详细信息"""
-        for minion in self.minions_data:
-            if minion.get("name", "").lower() == minion_name.lower():
-                return minion
-        return None
+        """获取随从详细信息（名称、卡牌ID或模板文件名）"""
+        return self.card_db.get_minion(minion_name)
     
     def recognize_hero(self, hero_roi: np.ndarray) -> Optional[HeroInfo]:
         """识别英雄"""
+        started = time.perf_counter()
+        hero = None
         best_match = None
         best_confidence = 0
         
-        for template_id in self.template_manager.templates:
+        # 纯色区域（黑屏、加载画面）不做匹配
+        templates = [] if self._flat(hero_roi) else self.template_manager.templates
+        for template_id in templates:
             if template_id.startswith("hero_"):
                 match = self.template_match(hero_roi, template_id, threshold=0.6)
                 if match and match.confidence > best_confidence:
                     best_confidence = match.confidence
                     best_match = match
+                    if self._certain(match):
+                        break
         
         if best_match:
             hero_name = best_match.template_id.replace("hero_", "")
             # 从数据中查找英雄信息
             hero_info = self.get_hero_info(hero_name)
             if hero_info:
-                return HeroInfo(
+                hero = HeroInfo(
                     name=hero_name,
                     health=30,  # 暂时使用默认值
                     armor=0
                 )
         
-        return None
+        self.metrics.observe("recognize_hero", time.perf_counter() - started)
+        return hero
     
     def get_hero_info(self, hero_name: str) -> Optional[Dict]:
-        """获取英雄详细信息"""
-        for hero in self.heroes_data:
-            if hero.get("name", "").lower() == hero_name.lower():
-                return hero
-        return None
+        """获取英雄详细信息（名称、卡牌ID或模板文件名）"""
+        return self.card_db.get_hero(hero_name)
+    
+    def detect_opponent(self, opponent_roi: np.ndarray) -> Optional[HeroInfo]:
+        """识别画面顶部的对手英雄，连续 combat_frames 帧识别为同一英雄时才返回（即判定为战斗阶段）
+        
+        区域与上次扫描时几乎相同（缩略图平均差小于 static_diff）时复用上次的结果，
+        招募阶段画面顶部不变时不再每帧重复扫描全部英雄模板。
+        """
+        gray = cv2.cvtColor(opponent_roi, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.int16)
+        with self._combat_lock:
+            previous = self._opponent_thumb
+            static = previous is not None and float(np.abs(thumb - previous).mean()) < self.static_diff
+            hero = self._opponent_seen
+        if not static:
+            hero = self.recognize_hero(opponent_roi)
+        with self._combat_lock:
+            if not static:
+                self._opponent_thumb, self._opponent_seen = thumb, hero
+            name = hero.name if hero else None
+            if name is None:
+                self._combat_streak = 0
+            elif name == self._combat_hero:
+                self._combat_streak += 1
+            else:
+                self._combat_streak = 1
+            self._combat_hero = name
+            return hero if hero and self._combat_streak >= self.combat_frames else None
     
     def recognize_frame(self, frame: np.ndarray) -> GameState:
-        """识别单帧图像，返回游戏状态"""
+        """识别单帧图像，返回游戏状态；帧不是1920x1080的BGR图像时抛出ValueError（其他分辨率先用 fit_frame 缩放）"""
         import datetime
         
+        check_frame(frame)
+        started = time.perf_counter()
+        self._frame.matches = 0
+        
         # 提取各个ROI
         shop_roi = self.extract_roi(frame, "shop")
         board_roi = self.extract_roi(frame, "board")
         hero_roi = self.extract_roi(frame, "hero")
         
+        # 画面顶部连续出现同一对手英雄时处于战斗阶段，此时商店不可见，改为识别对手场面
+        opponent_hero = self.detect_opponent(self.extract_roi(frame, "opponent_hero"))
+        phase = "combat" if opponent_hero else "recruit"
+        opponent = None
+        if opponent_hero:
+            opponent_minions = self.recognize_minions(self.extract_roi(frame, "opponent_board"))
+            opponent = {"hero": opponent_hero.name, "minions": [vars(m) for m in opponent_minions]}
+        
         # 识别各个部分
-        shop_minions = self.recognize_minions(shop_roi)
+        shop_minions = self.recognize_minions(shop_roi) if phase == "recruit" else []
         board_minions = self.recognize_minions(board_roi)  # 暂时复用商店识别逻辑
         hero = self.recognize_hero(hero_roi)
         
@@ -269,9 +513,14 @@ class RecognitionEngine:
             },
             board={
                 "minions": [vars(m) for m in board_minions]
-            }
+            },
+            phase=phase,
+            opponent=opponent
         )
         
+        self.metrics.observe("recognize_frame", time.perf_counter() - started)
+        self.metrics.matches_per_frame.observe(self._frame.matches)
+        self.metrics.inc("coach_frames_processed_total")
         return game_state
 
 
@@ -279,5 +528,5 @@ class RecognitionEngine:
 if __name__ == "__main__":
     engine = RecognitionEngine()
     print(f"加载了 {len(engine.template_manager.templates)} 个模板")
-    print(f"加载了 {len(engine.minions_data)} 个随从数据")
-    print(f"加载了 {len(engine.heroes_data)} 个英雄数据")
+    print(f"加载了 {len(engine.card_db.minions)} 个随从数据")
+    print(f"加载了 {len(engine.card_db.heroes)} 个英雄数据")
@@ -0,0 +1,157 @@
+"""
+商店概率引擎
+按战棋共享随从池模型计算若干次刷新内看到指定随从或种族的精确概率：
+每个等级的随从有固定份数，所有玩家场面上的随从从池中取出，酒馆等级决定可刷出的随从等级和商店格数
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from card_database import CardDatabase, TRIBE_BITS, get_card_database
+
+
+# 随从池中每张随从的份数（按随从等级）
+COPIES = {1: 16, 2: 15, 3: 13, 4: 11, 5: 9, 6: 7, 7: 5}
+
+# 各酒馆等级商店中的随从格数
+SHOP_SLOTS = {1: 3, 2: 4, 3: 4, 4: 5, 5: 5, 6: 6, 7: 7}
+
+MAX_TIER = max(COPIES)
+
+
+@lru_cache(maxsize=4096)
+def miss_table(total: int, slots: int) -> np.ndarray:
+    """超几何分布表：池中共 ``total`` 份随从时一次刷新 ``slots`` 格都不是目标的概率，按目标剩余份数索引
+
+    P(k) = C(total - k, slots) / C(total, slots)，k = 0..total。
+    """
+    remaining = np.arange(total + 1)
+    table = np.ones(total + 1)
+    for i in range(min(slots, total)):
+        table *= np.maximum(total - remaining - i, 0) / (total - i)
+    table.flags.writeable = False
+    return table
+
+
+class ShopOdds:
+    """共享随从池模型
+
+    每次刷新时商店里未购买的随从回到池中，所以各次刷新相互独立：
+    一次刷新看到目标的概率为 1 - P(k)，n 次刷新内至少看到一次的概率为 1 - P(k)^n。
+    """
+
+    def __init__(self, card_db: Optional[CardDatabase] = None, duos: bool = False):
+        self.card_db = card_db or get_card_database()
+        self.duos = duos
+        # 按随从编号索引的满池份数，不在当前模式随从池中的随从为0
+        self.copies = np.zeros(len(self.card_db.tier), dtype=np.int32)
+        for index, card in enumerate(self.card_db.minions, start=1):
+            battlegrounds = card.get("battlegrounds") or {}
+            tier = int(self.card_db.tier[index])
+            if tier not in COPIES or battlegrounds.get("solosOnly" if duos else "duosOnly"):
+                continue
+            self.copies[index] = COPIES[tier]
+        # 预先计算各酒馆等级满池时的概率表
+        for tier in COPIES:
+            miss_table(int(self.copies[self.card_db.tier <= tier].sum()), SHOP_SLOTS[tier])
+
+    def remaining(self, visible: Iterable[Union[Dict[str, Any], str]] = ()) -> np.ndarray:
+        """扣除可见随从（场面、商店中已取出池的随从，金色随从占3份）后的剩余份数"""
+        remaining = self.copies.copy()
+        for minion in visible:
+            name = minion if isinstance(minion, str) else minion.get("name", "")
+            index = self.card_db.minion_index(name)
+            if index:
+                golden = not isinstance(minion, str) and minion.get("golden")
+                remaining[index] = max(0, remaining[index] - (3 if golden else 1))
+        return remaining
+
+    def _available(self, remaining: np.ndarray, tier: int, lobby: Optional[Iterable[str]]) -> np.ndarray:
+        """该酒馆等级可刷出的随从剩余份数；提供本局种族时排除其余种族的随从（中立随从总是可用）"""
+        available = np.where(self.card_db.tier <= tier, remaining, 0)
+        if lobby is not None:
+            mask = sum(1 << TRIBE_BITS[tribe] for tribe in lobby if tribe in TRIBE_BITS)
+            tribes = self.card_db.tribes
+            available = np.where((tribes == 0) | ((tribes & mask) != 0), available, 0)
+        return available
+
+    def _targets(self, cards: Iterable[str] = (), tribe: Optional[str] = None) -> np.ndarray:
+        """目标随从的编号掩码：指定的随从，或属于指定种族的随从（含全部类型）"""
+        targets = np.zeros(len(self.copies), dtype=bool)
+        for name in cards:
+            index = self.card_db.minion_index(name)
+            if not index:
+                raise ValueError(f"未知随从: {name}")
+            targets[index] = True
+        if tribe:
+            if tribe not in TRIBE_BITS:
+                raise ValueError(f"未知种族: {tribe}")
+            targets |= (self.card_db.tribes & (1 << TRIBE_BITS[tribe])) != 0
+        return targets
+
+    def query(self, tier: int, cards: Iterable[str] = (), tribe: Optional[str] = None, rolls: int = 1,
+              visible: Iterable[Union[Dict[str, Any], str]] = (), lobby: Optional[Iterable[str]] = None,
+              remaining: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """``rolls`` 次刷新内看到指定随从（任意一张）或指定种族随从的概率
+
+        ``remaining`` 可传入预先计算的剩余份数，评估同一帧的多个候选时避免重复扣除可见随从。
+        """
+        tier = min(max(int(tier), 1), MAX_TIER)
+        if rolls < 0:
+            raise ValueError("刷新次数不能为负数")
+        if remaining is None:
+            remaining = self.remaining(visible)
+        available = self._available(remaining, tier, lobby)
+        total = int(available.sum())
+        slots = SHOP_SLOTS[tier]
+        copies = int(available[self._targets(cards, tribe)].sum())
+        miss = float(miss_table(total, slots)[copies]) if total else 1.0
+        return {
+            "probability": round(1.0 - miss ** rolls, 6),
+            "per_roll": round(1.0 - miss, 6),
+            "expected_per_roll": round(min(slots, total) * copies / total, 4) if total else 0.0,
+            "copies_left": copies,
+            "pool_size": total,
+            "slots": slots,
+            "rolls": rolls,
+            "tier": tier,
+        }
+
+    def shop_candidates(self, shop: List[Dict[str, Any]], board: List[Dict[str, Any]], tier: int,
+                        rolls: int = 3, visible: Iterable[Union[Dict[str, Any], str]] = (),
+                        lobby: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """评估商店中的每个随从：我方场面已有的份数，以及不买时 ``rolls`` 次刷新内再看到它的概率
+
+        商店中的随从在刷新时回到池中，因此只扣除我方场面和其他可见场面上的随从。
+        """
+        remaining = self.remaining(list(board) + list(visible))
+        owned: Dict[int, int] = {}
+        for minion in board:
+            index = self.card_db.minion_index(minion.get("name", ""))
+            if index and not minion.get("golden"):
+                owned[index] = owned.get(index, 0) + 1
+        candidates = []
+        for minion in shop:
+            name = minion.get("name", "")
+            index = self.card_db.minion_index(name)
+            if not index:
+                continue
+            odds = self.query(tier, [name], rolls=rolls, lobby=lobby, remaining=remaining)
+            candidates.append({
+                "name": name,
+                "position": minion.get("position"),
+                "tier": int(self.card_db.tier[index]),
+                "owned": owned.get(index, 0),
+                "triple": owned.get(index, 0) >= 2,
+                "seen_again": odds["probability"],
+                "copies_left": odds["copies_left"],
+            })
+        return candidates
+
+
+@lru_cache(maxsize=None)
+def get_shop_odds(duos: bool = False) -> ShopOdds:
+    """获取共享的商店概率引擎"""
+    return ShopOdds(duos=duos)
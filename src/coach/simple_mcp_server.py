@@ -8,6 +8,7 @@ import json
 import sys
 import time
 from typing import Dict, Any
+from mcp_transport import StdioTransport
 
 class SimpleMCPServer:
     """简化的MCP服务器实现"""
@@ -229,32 +230,8 @@ class SimpleMCPServer:
         print("等待请求...", file=sys.stderr)
         
         try:
-            while True:
-                # 读取标准输入
-                line = input()
-                if not line.strip():
-                    continue
-                
-                try:
-                    request = json.loads(line)
-                    response = self.handle_request(request)
-                    
-                    # 输出响应到标准输出
-                    print(json.dumps(response, ensure_ascii=False))
-                    sys.stdout.flush()
-                    
-                except json.JSONDecodeError:
-                    print(json.dumps({
-                        "jsonrpc": "2.0",
-                        "id": None,
-                        "error": {
-                            "code": -32700,
-                            "message": "Parse error"
-                        }
-                    }))
-                    sys.stdout.flush()
-                    
-        except EOFError:
+            # 并发处理请求，慢工具不会阻塞后续调用
+            StdioTransport(self.handle_request).run()
             print("MCP服务器关闭", file=sys.stderr)
         except KeyboardInterrupt:
             print("MCP服务器被中断", file=sys.stderr)
@@ -0,0 +1,246 @@
+"""
+战斗模拟服务
+将蒙特卡洛战斗模拟分片交给多进程执行：每个分片使用由种子派生的独立随机流，结果可复现；
+胜率置信区间收敛后提前结束，到达截止时间时返回已完成部分的结果；
+未指定种子的请求与置换表中同一对战的历史结果合并
+"""
+
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from card_database import CardDatabase, get_card_database
+from combat_simulator import CombatMinion, CombatOutcome, CombatSimulator, build_board, summarize
+from transposition_cache import TranspositionCache, get_transposition_cache, matchup_key, row_summary
+
+
+# 95%置信区间
+Z_SCORE = 1.96
+
+# 每个工作进程持有一个模拟器
+_simulator: Optional[CombatSimulator] = None
+
+
+def _init_worker(data_dir: str):
+    """工作进程初始化：加载卡牌数据和模拟器"""
+    global _simulator
+    _simulator = CombatSimulator(get_card_database(data_dir))
+
+
+def _run_chunk(boards: Tuple[List[CombatMinion], List[CombatMinion]], trials: int,
+               seed: np.random.SeedSequence, tier: int, opponent_tier: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    """模拟一个分片（在工作进程中运行）"""
+    simulator = _simulator or CombatSimulator()
+    outcome = simulator.run(boards[0], boards[1], trials, np.random.default_rng(seed), tier, opponent_tier)
+    return outcome.winner, outcome.damage, outcome.steps
+
+
+def confidence_interval(successes: int, trials: int) -> Tuple[float, float]:
+    """比例的95%置信区间（正态近似）"""
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    half = Z_SCORE * math.sqrt(p * (1 - p) / trials)
+    return max(0.0, p - half), min(1.0, p + half)
+
+
+class SimulationService:
+    """多进程蒙特卡洛战斗模拟服务
+
+    N次模拟按 ``chunk_trials`` 切分为分片，第i个分片的随机流由 ``SeedSequence(seed).spawn`` 的第i个子序列决定。
+    结果只合并从第0个分片开始连续完成的分片，因此相同的种子和分片数总能得到相同的结果，
+    与工作进程数量及完成顺序无关。
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_trials: int = 250,
+                 deadline_ms: float = 200.0, tolerance: float = 0.02, min_trials: int = 1000,
+                 card_db: Optional[CardDatabase] = None, cache: Optional[TranspositionCache] = None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.chunk_trials = chunk_trials
+        self.deadline_ms = deadline_ms
+        self.tolerance = tolerance
+        self.min_trials = min_trials
+        self.card_db = card_db or get_card_database()
+        self.cache = get_transposition_cache() if cache is None else cache
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Optional[ProcessPoolExecutor]:
+        """按需创建进程池（workers为0时在当前线程中执行）"""
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                     initargs=(str(self.card_db.data_dir),))
+            return self._executor
+
+    def warmup(self):
+        """预先启动所有工作进程，避免首次请求承担进程启动开销（服务启动时在后台调用）"""
+        if self.executor is not None:
+            boards = ([CombatMinion(1, 1)], [CombatMinion(1, 1)])
+            seeds = np.random.SeedSequence(0).spawn(self.workers)
+            futures = [self.executor.submit(_run_chunk, boards, 1, seed, 1, 1) for seed in seeds]
+            wait(futures)
+
+    def close(self):
+        """关闭进程池（服务关闭时调用）"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def simulate(self, board: Iterable[Any], opponent: Iterable[Any], trials: int = 5000,
+                 seed: Optional[int] = None, deadline_ms: Optional[float] = None,
+                 tolerance: Optional[float] = None, tier: int = 1, opponent_tier: int = 1) -> Dict[str, Any]:
+        """模拟战斗并汇总结果
+
+        ``deadline_ms`` 为0或负数表示不设截止时间，``tolerance`` 为胜率和负率置信区间半宽的目标值。
+        未指定 ``seed`` 时先查询置换表：已有足够（或已收敛）的结果时直接返回，否则只补足差额，
+        新结果累加到置换表后按累计结果返回；指定种子时结果只由种子决定，不读写置换表。
+        """
+        started = time.perf_counter()
+        deadline_ms = self.deadline_ms if deadline_ms is None else deadline_ms
+        tolerance = self.tolerance if tolerance is None else tolerance
+        requested = trials
+        deadline = started + deadline_ms / 1000 if deadline_ms and deadline_ms > 0 else None
+
+        boards = (build_board(board, self.card_db), build_board(opponent, self.card_db))
+        key = matchup_key(boards[0], boards[1], tier, opponent_tier)
+        shared = seed is None
+        reused = 0
+        if shared:
+            cached = self.cache.peek(key)
+            if cached is not None:
+                n, wins, losses = int(cached[0]), int(cached[1]), int(cached[3])
+                if n >= trials or (n >= self.min_trials and self._converged(wins, losses, n, tolerance)):
+                    self.cache.record(True)
+                    return self._cached_summary(cached, key, requested, started, tolerance, reused=n)
+                # 只补足差额
+                reused = n
+                trials = max(1, trials - n)
+            self.cache.record(False, cached is not None)
+            seed = int(np.random.SeedSequence().entropy % (1 << 63))
+        chunk_count = max(1, math.ceil(trials / self.chunk_trials))
+        sizes = [min(self.chunk_trials, trials - i * self.chunk_trials) for i in range(chunk_count)]
+        seeds = np.random.SeedSequence(seed).spawn(chunk_count)
+        args = [(boards, max(size, 1), seeds[i], tier, opponent_tier) for i, size in enumerate(sizes)]
+
+        results: Dict[int, Tuple[np.ndarray, np.ndarray, int]] = {}
+        merged = 0
+        wins = losses = completed_trials = 0
+        converged = deadline_hit = False
+
+        def absorb():
+            """合并连续完成的分片并检查收敛"""
+            nonlocal merged, wins, losses, completed_trials, converged
+            while merged in results and not converged:
+                winner = results[merged][0]
+                wins += int(np.count_nonzero(winner > 0))
+                losses += int(np.count_nonzero(winner < 0))
+                completed_trials += len(winner)
+                merged += 1
+                converged = completed_trials >= self.min_trials and self._converged(
+                    wins, losses, completed_trials, tolerance)
+
+        executor = self.executor
+        if executor is None:
+            for index, chunk_args in enumerate(args):
+                results[index] = _run_chunk(*chunk_args)
+                absorb()
+                if converged:
+                    break
+                if deadline is not None and time.perf_counter() >= deadline:
+                    deadline_hit = merged < chunk_count
+                    break
+        else:
+            in_flight: Dict[Future, int] = {}
+            next_chunk = 0
+            while merged < chunk_count and not converged:
+                while next_chunk < chunk_count and len(in_flight) < self.workers * 2:
+                    in_flight[executor.submit(_run_chunk, *args[next_chunk])] = next_chunk
+                    next_chunk += 1
+                timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[in_flight.pop(future)] = future.result()
+                absorb()
+                if merged == 0 and deadline is not None and time.perf_counter() >= deadline:
+                    # 到达截止时间仍没有可合并的分片（如工作进程还在启动）：在当前线程模拟第0个分片，
+                    # 随机流相同，结果与在工作进程中完成时一致
+                    results[0] = _run_chunk(*args[0])
+                    absorb()
+                if not done or (deadline is not None and time.perf_counter() >= deadline and merged > 0):
+                    deadline_hit = merged < chunk_count and not converged
+                    break
+            for future in in_flight:
+                future.cancel()
+
+        outcome = CombatOutcome(
+            winner=np.concatenate([results[i][0] for i in range(merged)]),
+            damage=np.concatenate([results[i][1] for i in range(merged)]),
+            steps=max(results[i][2] for i in range(merged)),
+            boards=boards,
+        )
+        if shared:
+            row = self.cache.add_outcome(key, outcome.winner, outcome.damage)
+            summary = self._cached_summary(row, key, requested, started, tolerance, reused=reused)
+            summary.update({"steps": outcome.steps, "seed": seed, "chunks": merged, "deadline_hit": deadline_hit})
+            return summary
+        summary = summarize(outcome)
+        summary.update({
+            "requested_trials": requested,
+            "seed": seed,
+            "chunks": merged,
+            "workers": self.workers,
+            "converged": converged,
+            "deadline_hit": deadline_hit,
+            "confidence": {
+                "win": [round(v, 4) for v in confidence_interval(wins, completed_trials)],
+                "loss": [round(v, 4) for v in confidence_interval(losses, completed_trials)],
+            },
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        })
+        return summary
+
+    def _cached_summary(self, row: np.ndarray, key: str, requested: int, started: float,
+                        tolerance: float, reused: int) -> Dict[str, Any]:
+        """由置换表中的累计结果生成与 ``simulate`` 相同格式的汇总，reused为复用的历史模拟次数"""
+        n, wins, losses = int(row[0]), int(row[1]), int(row[3])
+        summary = row_summary(row)
+        summary.update({
+            "steps": 0,
+            "requested_trials": requested,
+            "seed": None,
+            "chunks": 0,
+            "workers": self.workers,
+            "converged": n >= self.min_trials and self._converged(wins, losses, n, tolerance),
+            "deadline_hit": False,
+            "confidence": {
+                "win": [round(v, 4) for v in confidence_interval(wins, n)],
+                "loss": [round(v, 4) for v in confidence_interval(losses, n)],
+            },
+            "transposition": {"key": key, "hit": reused == n, "reused_trials": reused},
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        })
+        return summary
+
+    @staticmethod
+    def _converged(wins: int, losses: int, trials: int, tolerance: float) -> bool:
+        """胜率和负率的置信区间半宽均不超过目标值"""
+        for successes in (wins, losses):
+            p = successes / trials
+            if Z_SCORE * math.sqrt(p * (1 - p) / trials) > tolerance:
+                return False
+        return True
+
+
+@lru_cache(maxsize=None)
+def get_simulation_service() -> SimulationService:
+    """获取共享的模拟服务实例"""
+    return SimulationService()
@@ -0,0 +1,217 @@
+"""
+游戏状态历史模块
+固定容量的环形缓冲区，记录每个状态版本，支持按时间、回合和事件类型查询
+"""
+
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from recognition_engine import GameState
+
+
+# 每个区域最多7个随从位置
+MAX_SLOTS = 7
+
+# 事件类型（位掩码）：记录相对上一版本发生了哪些变化
+EVENT_TYPES = {
+    "shop_changed": 1 << 0,
+    "board_changed": 1 << 1,
+    "turn_changed": 1 << 2,
+    "tier_changed": 1 << 3,
+    "gold_changed": 1 << 4,
+    "hero_changed": 1 << 5,
+    "shop_frozen": 1 << 6,
+}
+
+
+def _parse_time(value: Union[str, float, int, None]) -> Optional[float]:
+    """将ISO时间字符串或时间戳转换为时间戳"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class StateHistory:
+    """游戏状态历史环形缓冲区
+
+    随从和英雄名称被映射为小整数编号，每个版本只占用几十字节，
+    容量固定，长时间运行内存也不会增长。
+    """
+
+    def __init__(self, capacity: int = 8192):
+        self.capacity = capacity
+        self.count = 0
+        self.head = 0               # 下一条记录写入的位置
+        self.version = 0            # 已记录的状态版本总数
+        self._lock = threading.Lock()
+
+        # 名称字典：编号0表示空位
+        self.names: List[str] = [""]
+        self._name_ids: Dict[str, int] = {"": 0}
+
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.versions = np.zeros(capacity, dtype=np.int64)
+        self.turns = np.zeros(capacity, dtype=np.int16)
+        self.tiers = np.zeros(capacity, dtype=np.int8)
+        self.gold = np.zeros(capacity, dtype=np.int8)
+        self.heroes = np.zeros(capacity, dtype=np.int16)
+        self.hero_health = np.zeros(capacity, dtype=np.int16)
+        self.events = np.zeros(capacity, dtype=np.uint8)
+        self.shop = np.zeros((capacity, MAX_SLOTS), dtype=np.int16)
+        self.board = np.zeros((capacity, MAX_SLOTS), dtype=np.int16)
+        self.board_attack = np.zeros((capacity, MAX_SLOTS), dtype=np.int16)
+        self.board_health = np.zeros((capacity, MAX_SLOTS), dtype=np.int16)
+        self.board_golden = np.zeros((capacity, MAX_SLOTS), dtype=np.bool_)
+
+    def _intern(self, name: str) -> int:
+        """获取名称编号，新名称自动加入字典"""
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self._name_ids[name] = name_id
+        return name_id
+
+    def _encode_slots(self, minions: List[Dict[str, Any]]):
+        """将随从列表编码为定长数组"""
+        ids = np.zeros(MAX_SLOTS, dtype=np.int16)
+        attack = np.zeros(MAX_SLOTS, dtype=np.int16)
+        health = np.zeros(MAX_SLOTS, dtype=np.int16)
+        golden = np.zeros(MAX_SLOTS, dtype=np.bool_)
+        for minion in minions:
+            slot = minion.get("position", 0)
+            if 0 <= slot < MAX_SLOTS:
+                ids[slot] = self._intern(minion.get("name", ""))
+                attack[slot] = minion.get("attack", 0)
+                health[slot] = minion.get("health", 0)
+                golden[slot] = minion.get("golden", False)
+        return ids, attack, health, golden
+
+    def record(self, game_state: GameState) -> bool:
+        """记录一个游戏状态，与上一版本相同时跳过，返回是否写入"""
+        with self._lock:
+            shop_ids, _, _, _ = self._encode_slots(game_state.shop.get("minions", []))
+            board_ids, board_attack, board_health, board_golden = self._encode_slots(
+                game_state.board.get("minions", []))
+            hero_id = self._intern(game_state.hero.name)
+
+            frozen = EVENT_TYPES["shop_frozen"] if game_state.shop.get("frozen", False) else 0
+            events = 0
+            if self.count:
+                last = (self.head - 1) % self.capacity
+                if not np.array_equal(self.shop[last], shop_ids):
+                    events |= EVENT_TYPES["shop_changed"]
+                if not (np.array_equal(self.board[last], board_ids)
+                        and np.array_equal(self.board_attack[last], board_attack)
+                        and np.array_equal(self.board_health[last], board_health)
+                        and np.array_equal(self.board_golden[last], board_golden)):
+                    events |= EVENT_TYPES["board_changed"]
+                if self.turns[last] != game_state.turn:
+                    events |= EVENT_TYPES["turn_changed"]
+                if self.tiers[last] != game_state.tavern_tier:
+                    events |= EVENT_TYPES["tier_changed"]
+                if self.gold[last] != game_state.gold:
+                    events |= EVENT_TYPES["gold_changed"]
+                if self.heroes[last] != hero_id or self.hero_health[last] != game_state.hero.health:
+                    events |= EVENT_TYPES["hero_changed"]
+                if not events and frozen == self.events[last] & EVENT_TYPES["shop_frozen"]:
+                    return False
+            else:
+                events = (EVENT_TYPES["shop_changed"] | EVENT_TYPES["board_changed"]
+                          | EVENT_TYPES["turn_changed"] | EVENT_TYPES["hero_changed"])
+            events |= frozen
+
+            i = self.head
+            self.version += 1
+            self.timestamps[i] = _parse_time(game_state.timestamp)
+            self.versions[i] = self.version
+            self.turns[i] = game_state.turn
+            self.tiers[i] = game_state.tavern_tier
+            self.gold[i] = game_state.gold
+            self.heroes[i] = hero_id
+            self.hero_health[i] = game_state.hero.health
+            self.events[i] = events
+            self.shop[i] = shop_ids
+            self.board[i] = board_ids
+            self.board_attack[i] = board_attack
+            self.board_health[i] = board_health
+            self.board_golden[i] = board_golden
+
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            return True
+
+    def _ordered_indices(self) -> np.ndarray:
+        """按时间顺序排列的有效记录下标"""
+        start = (self.head - self.count) % self.capacity
+        return (start + np.arange(self.count)) % self.capacity
+
+    def query(self, since: Union[str, float, None] = None, until: Union[str, float, None] = None,
+              turn: Optional[int] = None, event: Optional[str] = None,
+              limit: int = 100) -> List[Dict[str, Any]]:
+        """按时间范围、回合或事件类型查询历史状态（返回最近的limit条，按时间顺序）"""
+        if event is not None and event not in EVENT_TYPES:
+            raise ValueError(f"未知事件类型: {event}，可选: {', '.join(EVENT_TYPES)}")
+
+        with self._lock:
+            indices = self._ordered_indices()
+            mask = np.ones(len(indices), dtype=np.bool_)
+            since_ts, until_ts = _parse_time(since), _parse_time(until)
+            if since_ts is not None:
+                mask &= self.timestamps[indices] >= since_ts
+            if until_ts is not None:
+                mask &= self.timestamps[indices] <= until_ts
+            if turn is not None:
+                mask &= self.turns[indices] == turn
+            if event is not None:
+                mask &= (self.events[indices] & EVENT_TYPES[event]) != 0
+            selected = indices[mask][-limit:] if limit > 0 else indices[mask]
+            return [self._decode(i) for i in selected]
+
+    def _decode(self, i: int) -> Dict[str, Any]:
+        """将一条记录还原为字典"""
+        return {
+            "version": int(self.versions[i]),
+            "timestamp": datetime.fromtimestamp(self.timestamps[i]).isoformat(),
+            "turn": int(self.turns[i]),
+            "tavern_tier": int(self.tiers[i]),
+            "gold": int(self.gold[i]),
+            "hero": {"name": self.names[self.heroes[i]], "health": int(self.hero_health[i])},
+            "events": [name for name, bit in EVENT_TYPES.items() if self.events[i] & bit],
+            "shop": [
+                {"position": slot, "name": self.names[name_id]}
+                for slot, name_id in enumerate(self.shop[i]) if name_id
+            ],
+            "board": [
+                {
+                    "position": slot,
+                    "name": self.names[name_id],
+                    "attack": int(self.board_attack[i, slot]),
+                    "health": int(self.board_health[i, slot]),
+                    "golden": bool(self.board_golden[i, slot]),
+                }
+                for slot, name_id in enumerate(self.board[i]) if name_id
+            ],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """缓冲区使用情况"""
+        nbytes = sum(array.nbytes for array in (
+            self.timestamps, self.versions, self.turns, self.tiers, self.gold, self.heroes,
+            self.hero_health, self.events, self.shop, self.board, self.board_attack,
+            self.board_health, self.board_golden))
+        return {
+            "count": self.count,
+            "capacity": self.capacity,
+            "total_versions": self.version,
+            "distinct_names": len(self.names) - 1,
+            "buffer_bytes": nbytes,
+        }
@@ -0,0 +1,14 @@
+"""
+测试公共配置
+模块按平铺方式导入，卡牌数据和模板按仓库根目录的相对路径加载
+"""
+
+import os
+import sys
+from pathlib import Path
+
+COACH_DIR = Path(__file__).resolve().parent.parent
+REPO_DIR = COACH_DIR.parent.parent
+
+sys.path.insert(0, str(COACH_DIR))
+os.chdir(REPO_DIR)
@@ -0,0 +1,78 @@
+"""建议引擎的参数传递和后台预计算"""
+
+import threading
+
+import pytest
+
+from advice_engine import AdviceEngine, AdviceWorker
+
+
+STATE = {
+    "turn": 4, "gold": 6, "tavern_tier": 2,
+    "shop": {"minions": [{"name": "a", "tier": 1}, {"name": "b", "tier": 2}]},
+    "board": {"minions": [{"name": "c", "attack": 1, "health": 1, "tier": 1}]},
+}
+
+
+class RecordingEngine(AdviceEngine):
+    """记录收到的参数，不做实际计算"""
+
+    def __init__(self):
+        self.requests = []
+
+    def _shop_odds(self, parameters):
+        self.requests.append(("shop_odds", parameters))
+        return {}
+
+    def _plan_economy(self, parameters):
+        self.requests.append(("plan_economy", parameters))
+        return {}
+
+    def _optimize_position(self, parameters):
+        self.requests.append(("optimize_position", parameters))
+        return {"error": "没有可用的对手场面"}
+
+
+def test_engine_is_abstract():
+    with pytest.raises(TypeError):
+        AdviceEngine()
+
+
+def test_requests_carry_the_given_state():
+    engine = RecordingEngine()
+    engine.game_advice("buy", STATE)
+    engine.game_advice("upgrade", STATE)
+    shop, plan = dict(engine.requests)["shop_odds"], dict(engine.requests)["plan_economy"]
+    assert shop["tier"] == 2
+    assert shop["shop"] == STATE["shop"]["minions"] and shop["board"] == STATE["board"]["minions"]
+    assert (plan["turn"], plan["gold"], plan["tier"]) == (4, 6, 2)
+
+
+def test_worker_reports_each_finished_kind():
+    updates = []
+    done = threading.Event()
+
+    def on_update(snapshot):
+        updates.append(sorted(snapshot))
+        if len(snapshot) == 4:
+            done.set()
+
+    worker = AdviceWorker(RecordingEngine(), on_update=on_update)
+    assert worker.submit(STATE)
+    assert done.wait(5)
+    assert updates[0] == ["buy"] and updates[-1] == ["board", "buy", "position", "upgrade"]
+    assert worker.lookup("buy", STATE)["speculative"]
+    # 状态未变化时不产生新任务
+    assert not worker.submit(STATE)
+
+
+def test_board_stats_follow_the_given_state():
+    from embedded_backend import EmbeddedMCPInterface
+
+    # 进程内MCP接口同样按任务的状态计算场面统计，不读取识别线程维护的最新统计
+    assert EmbeddedMCPInterface._board_stats is AdviceEngine._board_stats
+    engine = RecordingEngine()
+    assert engine._board_stats(STATE)["count"] == 1
+    bigger = {"board": {"minions": STATE["board"]["minions"] * 3}}
+    assert engine._board_stats(bigger)["count"] == 3
+    assert engine._board_stats(STATE)["count"] == 1
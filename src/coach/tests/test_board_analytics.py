@@ -0,0 +1,37 @@
+"""场面增量统计"""
+
+from board_analytics import BoardAnalytics
+from card_database import get_card_database
+
+
+def minion(position, attack=None, health=None, **extra):
+    card = get_card_database().minions[0]
+    return {"position": position, "name": card["name"], "attack": attack, "health": health, **extra}
+
+
+def test_missing_stats_fall_back_to_card_data():
+    card = get_card_database().minions[0]
+    analytics = BoardAnalytics()
+    analytics.update([minion(0)])
+    stats = analytics.stats()
+    assert (stats["attack"], stats["health"]) == (card["attack"], card["health"])
+
+
+def test_recognised_zero_attack_is_kept():
+    card = get_card_database().minions[0]
+    analytics = BoardAnalytics()
+    analytics.update([minion(0, attack=0, health=5)])
+    stats = analytics.stats()
+    assert (stats["attack"], stats["health"]) == (0, 5)
+    assert card["attack"] != 0
+
+
+def test_reordering_does_not_change_aggregates():
+    analytics = BoardAnalytics()
+    analytics.update([minion(0, 1, 2), minion(1, 3, 4, golden=True)])
+    before = analytics.stats()
+    delta = analytics.update([minion(0, 3, 4, golden=True), minion(1, 1, 2)])
+    assert delta["changed"] == 2
+    after = analytics.stats()
+    assert {k: v for k, v in after.items() if k != "version"} == {k: v for k, v in before.items() if k != "version"}
+    assert after["version"] == before["version"] + 1
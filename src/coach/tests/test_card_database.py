@@ -0,0 +1,16 @@
+"""卡牌数据库的数据目录解析"""
+
+from card_database import REPO_DIR, CardDatabase
+
+
+def test_relative_data_dir_ignores_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    card_db = CardDatabase()
+    assert card_db.data_dir == REPO_DIR / "data" / "bgs"
+    assert card_db.minions and card_db.heroes
+
+
+def test_missing_data_warns(tmp_path, capsys):
+    card_db = CardDatabase(str(tmp_path / "missing"))
+    assert card_db.minions == [] and card_db.minion_index("anything") == 0
+    assert "没有找到卡牌数据" in capsys.readouterr().out
@@ -0,0 +1,82 @@
+"""卡牌搜索索引"""
+
+import json
+
+import pytest
+
+from card_database import CardDatabase
+from card_search import CardSearch, CardSearchIndex, build_index, load_index, query_terms, tokenize
+
+
+MINIONS = [
+    {"id": 1, "name": "鱼人领军", "attack": 3, "health": 3, "minionTypeId": 14, "battlegrounds": {"tier": 2},
+     "text": "你的其他鱼人拥有+2攻击力。"},
+    {"id": 2, "name": "圣盾守卫", "attack": 2, "health": 2, "minionTypeId": 17, "keywordIds": [3],
+     "battlegrounds": {"tier": 1}, "text": "<b>圣盾</b>"},
+    {"id": 3, "name": "丛林猎豹", "attack": 4, "health": 2, "minionTypeId": 20, "battlegrounds": {"tier": 3},
+     "text": "战吼：使一个鱼人获得+1生命值。", "flavorText": "鱼人是它最爱的点心。"},
+    {"id": 4, "name": "变形者", "attack": 1, "health": 1, "minionTypeId": 26, "battlegrounds": {"tier": 1}},
+]
+HEROES = [{"id": 10, "name": "鱼人之王", "health": 30, "armor": 5, "text": "英雄技能"}]
+
+
+@pytest.fixture()
+def card_db(tmp_path):
+    (tmp_path / "minions.json").write_text(json.dumps(MINIONS, ensure_ascii=False), encoding="utf-8")
+    (tmp_path / "heroes.json").write_text(json.dumps(HEROES, ensure_ascii=False), encoding="utf-8")
+    return CardDatabase(str(tmp_path))
+
+
+def names(result):
+    return [card["name"] for card in result["results"]]
+
+
+def test_tokenize_splits_chinese_into_unigrams_and_bigrams():
+    assert tokenize("鱼人王 Murloc") == ["鱼", "人", "王", "鱼人", "人王", "murloc"]
+    assert query_terms("鱼人王") == ["鱼人", "人王"]
+    assert query_terms("鱼") == ["鱼"]
+
+
+def test_name_matches_rank_above_text_and_flavor(card_db):
+    result = CardSearch(card_db, build_index(card_db)).search("鱼人")
+    ranked = names(result)
+    assert set(ranked[:2]) == {"鱼人领军", "鱼人之王"}
+    assert ranked[2] == "丛林猎豹"
+    scores = [card["score"] for card in result["results"]]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_filters_narrow_results(card_db):
+    search = CardSearch(card_db, build_index(card_db))
+    assert names(search.search("鱼人", kind="minion")) == ["鱼人领军", "丛林猎豹"]
+    assert names(search.search("鱼人", tier=3)) == ["丛林猎豹"]
+    assert names(search.search(keyword="divine_shield")) == ["圣盾守卫"]
+    # 全部类型的随从属于每个种族
+    assert names(search.search(tribe="murloc")) == ["变形者", "鱼人领军"]
+    assert names(search.search(tribe="all")) == ["变形者"]
+
+
+def test_invalid_filters_raise(card_db):
+    search = CardSearch(card_db, build_index(card_db))
+    with pytest.raises(ValueError):
+        search.search("鱼人", tribe="鱼人")
+    with pytest.raises(ValueError):
+        search.search(keyword="圣盾")
+    with pytest.raises(ValueError):
+        search.search(kind="spell")
+    with pytest.raises(ValueError):
+        search.search("")
+    with pytest.raises(ValueError):
+        search.search("鱼人", limit=0)
+
+
+def test_saved_index_is_reused_until_data_changes(card_db, tmp_path):
+    path = tmp_path / "output" / "index.npz"
+    index = load_index(card_db, path)
+    assert path.exists()
+    loaded = CardSearchIndex.load(path)
+    assert loaded.source == index.source and len(loaded) == len(MINIONS) + len(HEROES)
+
+    (tmp_path / "heroes.json").write_text("[]", encoding="utf-8")
+    rebuilt = load_index(CardDatabase(str(tmp_path)), path)
+    assert rebuilt.source != index.source and len(rebuilt) == len(MINIONS)
@@ -0,0 +1,102 @@
+"""战斗模拟器的结算规则"""
+
+import numpy as np
+import pytest
+
+from card_database import get_card_database
+from combat_simulator import CombatMinion, CombatSimulator, combat_minion
+
+
+TRIALS = 200
+
+
+def simulate(board, opponent, tier=1, opponent_tier=1):
+    return CombatSimulator().simulate(board, opponent, trials=TRIALS, seed=1, tier=tier, opponent_tier=opponent_tier)
+
+
+def test_bigger_minion_wins_with_tier_damage():
+    summary = simulate([CombatMinion(3, 3, tier=2)], [CombatMinion(1, 1)], tier=4)
+    assert summary["win"] == 1.0
+    # 伤害 = 酒馆等级 + 存活随从的等级之和
+    assert summary["damage"]["distribution"] == {6: 1.0}
+
+
+def test_loss_damage_is_negative():
+    summary = simulate([CombatMinion(1, 1)], [CombatMinion(3, 3, tier=3)], opponent_tier=2)
+    assert summary["loss"] == 1.0
+    assert summary["damage"]["distribution"] == {-5: 1.0}
+
+
+def test_zero_attack_boards_tie():
+    summary = simulate([CombatMinion(0, 1)], [CombatMinion(0, 1)])
+    assert summary["tie"] == 1.0
+    assert summary["damage"]["expected"] == 0.0
+
+
+def test_divine_shield_absorbs_one_hit():
+    assert simulate([CombatMinion(1, 1)], [CombatMinion(1, 1)])["tie"] == 1.0
+    assert simulate([CombatMinion(1, 1, divine_shield=True)], [CombatMinion(1, 1)])["win"] == 1.0
+
+
+def test_poisonous_kills_regardless_of_health():
+    assert simulate([CombatMinion(1, 1)], [CombatMinion(10, 10)])["loss"] == 1.0
+    assert simulate([CombatMinion(1, 1, poisonous=True)], [CombatMinion(10, 10)])["tie"] == 1.0
+
+
+def test_reborn_returns_with_one_health():
+    summary = simulate([CombatMinion(1, 1, tier=2, reborn=True)], [CombatMinion(1, 1)])
+    assert summary["win"] == 1.0
+    assert summary["damage"]["distribution"] == {3: 1.0}
+
+
+def test_deathrattle_summons_token():
+    minion = CombatMinion(1, 1, summon_count=1, summon_attack=1, summon_health=1)
+    summary = simulate([minion], [CombatMinion(1, 1)])
+    assert summary["win"] == 1.0
+    # 召唤物按1级随从计算伤害
+    assert summary["damage"]["distribution"] == {2: 1.0}
+
+
+def test_taunt_must_be_attacked_first():
+    # 有嘲讽时必须先击杀0/2，之后与1/x同归于尽；没有嘲讽时可能先攻击1/5并最终落败
+    taunted = simulate([CombatMinion(2, 3)], [CombatMinion(0, 2, taunt=True), CombatMinion(1, 5)])
+    assert taunted["tie"] == 1.0
+    plain = simulate([CombatMinion(2, 3)], [CombatMinion(0, 2), CombatMinion(1, 5)])
+    assert plain["loss"] > 0
+
+
+def test_seeded_runs_are_reproducible():
+    simulator = CombatSimulator()
+    board = [CombatMinion(2, 3), CombatMinion(3, 2)]
+    opponent = [CombatMinion(3, 3), CombatMinion(1, 4, taunt=True)]
+    first = simulator.run(board, opponent, TRIALS, np.random.default_rng(7))
+    second = simulator.run(board, opponent, TRIALS, np.random.default_rng(7))
+    assert np.array_equal(first.winner, second.winner)
+    assert np.array_equal(first.damage, second.damage)
+
+
+def test_combat_minion_uses_card_data():
+    card_db = get_card_database()
+    name = card_db.minions[0]["name"]
+    minion = combat_minion({"name": name}, card_db)
+    assert minion.card_id == card_db.minions[0]["id"]
+    assert (minion.attack, minion.health) == (card_db.minions[0]["attack"], card_db.minions[0]["health"])
+    golden = combat_minion({"name": name, "golden": True}, card_db)
+    assert golden.health == minion.health * 2
+
+
+def test_combat_minion_rejects_unknown_name():
+    with pytest.raises(ValueError):
+        combat_minion({"name": "不存在的随从"})
+    with pytest.raises(ValueError):
+        combat_minion({"name": "不存在的随从", "attack": 3})
+    minion = combat_minion({"name": "不存在的随从", "attack": 3, "health": 4})
+    assert (minion.attack, minion.health) == (3, 4)
+
+
+def test_combat_minion_keeps_explicit_zero_attack():
+    card_db = get_card_database()
+    name = card_db.minions[0]["name"]
+    assert card_db.minions[0]["attack"] != 0
+    minion = combat_minion({"name": name, "attack": 0}, card_db)
+    assert minion.attack == 0 and minion.health == card_db.minions[0]["health"]
@@ -0,0 +1,52 @@
+"""经济规划器"""
+
+import json
+
+import pytest
+
+from card_database import CardDatabase
+from economy_planner import EconomyPlanner, income, upgrade_cost
+from shop_odds import ShopOdds
+
+
+def planner(directory, low, high):
+    """一本只有属性为 ``low`` 的随从、二本只有属性为 ``high`` 的随从的固定随从池"""
+    directory.mkdir(parents=True, exist_ok=True)
+    cards = [{"id": 1, "name": "low", "attack": low, "health": low, "minionTypeId": 20, "battlegrounds": {"tier": 1}},
+             {"id": 2, "name": "high", "attack": high, "health": high, "minionTypeId": 20,
+              "battlegrounds": {"tier": 2}}]
+    (directory / "minions.json").write_text(json.dumps(cards), encoding="utf-8")
+    (directory / "heroes.json").write_text("[]", encoding="utf-8")
+    return EconomyPlanner(ShopOdds(CardDatabase(str(directory))))
+
+
+def test_income_and_upgrade_cost():
+    assert [income(turn) for turn in (1, 8, 12)] == [3, 10, 10]
+    assert (upgrade_cost(1, 0), upgrade_cost(1, 2), upgrade_cost(1, 9)) == (5, 3, 0)
+    assert upgrade_cost(6, 0) == 0
+
+
+def test_levels_when_the_next_tier_is_stronger(tmp_path):
+    result = planner(tmp_path, low=1, high=10).plan(turn=3, gold=5, tier=1, cost=4)
+    assert result["level_now"] and result["plan"][0]["level"] == 1
+    assert result["curve"][0] == 2
+    assert result["alternative"] < result["score"]
+
+
+def test_stays_when_the_next_tier_is_no_better(tmp_path):
+    result = planner(tmp_path, low=5, high=5).plan(turn=3, gold=5, tier=1, cost=4)
+    assert not result["level_now"]
+    assert result["curve"] == [1] * len(result["curve"])
+    assert result["alternative"] < result["score"]
+
+
+def test_cannot_level_without_enough_gold(tmp_path):
+    result = planner(tmp_path, low=1, high=10).plan(turn=3, gold=4, tier=1, cost=5)
+    assert not result["level_now"] and result["alternative"] is None
+
+
+def test_invalid_input_raises(tmp_path):
+    economy = planner(tmp_path, low=1, high=10)
+    for turn, gold, tier in ((0, 3, 1), (3, -1, 1), (3, 3, 7)):
+        with pytest.raises(ValueError):
+            economy.plan(turn, gold, tier)
@@ -0,0 +1,16 @@
+"""合成帧的金色标注"""
+
+from frame_generator import FrameGenerator, GeneratorConfig
+
+
+def test_golden_label_follows_the_template():
+    generator = FrameGenerator(GeneratorConfig(seed=1, golden_rate=0.5, empty_rate=0, combat_rate=0))
+    minions = []
+    for index in range(20):
+        _, labels, _ = generator.compose(index)
+        minions += labels["shop"] + labels["board"]
+    assert any(m["golden"] for m in minions) and any(m["tinted"] for m in minions)
+    for minion in minions:
+        assert minion["golden"] == minion["name"].endswith("_gold")
+        # 色调只加在非金色模板上
+        assert not (minion["golden"] and minion["tinted"])
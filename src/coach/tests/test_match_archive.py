@@ -0,0 +1,48 @@
+"""对局存档的种族索引和名次统计"""
+
+from card_database import TRIBE_BITS, get_card_database
+from match_archive import MatchArchive
+
+
+def card_with_tribe(tribe):
+    card_db = get_card_database()
+    for index, card in enumerate(card_db.minions, start=1):
+        if int(card_db.tribes[index]) == 1 << TRIBE_BITS[tribe]:
+            return card["name"]
+    raise AssertionError(f"没有单一种族为 {tribe} 的随从")
+
+
+def record(turn, board):
+    hero = get_card_database().heroes[0]["name"]
+    return {
+        "timestamp": f"2026-01-0{turn}T12:00:00", "turn": turn, "tavern_tier": 1, "gold": 3,
+        "hero": {"name": hero}, "shop": [],
+        "board": [{"position": i, "name": name, "attack": 1, "health": 1, "golden": False}
+                  for i, name in enumerate(board)],
+    }
+
+
+def test_tribe_filter_matches_every_tribe_on_the_final_board(tmp_path):
+    archive = MatchArchive(tmp_path)
+    beast, murloc = card_with_tribe("beast"), card_with_tribe("murloc")
+    game_id = archive.archive_session([record(1, [beast]), record(2, [beast, beast, murloc])])
+    assert game_id == 0
+    assert list(archive.select(tribe="beast")) == [0]
+    assert list(archive.select(tribe="murloc")) == [0]
+    assert list(archive.select(tribe="pirate")) == []
+    # 分组统计仍按主种族
+    assert [row["tribe"] for row in archive.tribe_stats()] == ["beast"]
+
+    # 重新加载后索引相同
+    assert list(MatchArchive(tmp_path).select(tribe="murloc")) == [0]
+
+
+def test_unknown_placement_is_not_rated(tmp_path):
+    archive = MatchArchive(tmp_path)
+    beast = card_with_tribe("beast")
+    archive.archive_session([record(1, [beast])])
+    stats = archive.hero_stats()[0]
+    assert stats["games"] == 1 and stats["rated_games"] == 0 and stats["win_rate"] is None
+    archive.archive_session([record(1, [beast])], placement=1)
+    stats = archive.hero_stats()[0]
+    assert stats["games"] == 2 and stats["rated_games"] == 1 and stats["win_rate"] == 1.0
@@ -0,0 +1,78 @@
+"""MCP标准输入输出传输层：通过管道发送请求"""
+
+import asyncio
+import io
+import json
+import os
+import threading
+
+from mcp_transport import PARSE_ERROR, REQUEST_CANCELLED, StdioTransport
+
+
+def exchange(requests, handler):
+    """把请求逐行写入管道后关闭，运行传输循环直到输入结束，返回按写出顺序排列的响应"""
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(write_fd, "w", encoding="utf-8") as pipe:
+        for request in requests:
+            pipe.write((request if isinstance(request, str) else json.dumps(request)) + "\n")
+    output = io.StringIO()
+    transport = StdioTransport(handler, max_workers=4, output=output)
+    with os.fdopen(read_fd, "r", encoding="utf-8") as stream:
+        try:
+            asyncio.run(asyncio.wait_for(transport.serve(stream), timeout=10))
+        finally:
+            transport.executor.shutdown(wait=False)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def request(request_id, method, **params):
+    return {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+
+
+def test_responses_are_written_in_completion_order():
+    released = threading.Event()
+
+    def handler(message):
+        if message["method"] == "slow":
+            assert released.wait(5)
+        else:
+            released.set()
+        return {"jsonrpc": "2.0", "id": message["id"], "result": message["method"]}
+
+    responses = exchange([request(1, "slow"), request(2, "fast")], handler)
+    assert [response["id"] for response in responses] == [2, 1]
+
+
+def test_cancelled_requests():
+    released = threading.Event()
+
+    def handler(message):
+        released.wait(5)
+        return {"jsonrpc": "2.0", "id": message["id"], "result": "late"}
+
+    try:
+        responses = exchange([
+            request(1, "slow"),
+            request(2, "slow"),
+            {"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": 1}},
+            {"jsonrpc": "2.0", "method": "$/cancelRequest", "params": {"id": 2}},
+        ], handler)
+    finally:
+        released.set()
+    # MCP风格的取消不再响应，LSP风格的取消以RequestCancelled错误响应
+    assert responses == [{"jsonrpc": "2.0", "id": 2, "error": {"code": REQUEST_CANCELLED,
+                                                               "message": "Request cancelled"}}]
+
+
+def test_batches_notifications_and_parse_errors():
+    def handler(message):
+        return {"jsonrpc": "2.0", "id": message.get("id"), "result": message["method"]}
+
+    responses = exchange([
+        "{not json",
+        [request(1, "a"), {"jsonrpc": "2.0", "method": "notify"}, request(2, "b")],
+        {"jsonrpc": "2.0", "method": "notify"},
+    ], handler)
+    assert responses[0]["error"]["code"] == PARSE_ERROR
+    assert [(response["id"], response["result"]) for response in responses[1]] == [(1, "a"), (2, "b")]
+    assert len(responses) == 2
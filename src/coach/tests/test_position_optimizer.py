@@ -0,0 +1,105 @@
+"""站位优化器的截止时间处理"""
+
+import time
+
+from combat_simulator import CombatMinion, CombatSimulator
+from position_optimizer import PositionOptimizer, unique_orderings
+from transposition_cache import TranspositionCache
+
+
+# 5个不同的随从，共120种站位
+BOARD = [CombatMinion(attack, 6 - attack, name=f"m{attack}") for attack in range(1, 6)]
+OPPONENT = [CombatMinion(3, 3), CombatMinion(2, 4, taunt=True)]
+
+
+class SlowSimulator(CombatSimulator):
+    """每场战斗固定耗时的模拟器，使截止时间的行为可以预测"""
+
+    def __init__(self, seconds_per_trial: float):
+        super().__init__()
+        self.seconds_per_trial = seconds_per_trial
+
+    def run_pairs(self, pairs, trials, rng=None, tier=1, opponent_tier=1):
+        time.sleep(len(pairs) * trials * self.seconds_per_trial)
+        return super().run_pairs(pairs, trials, rng, tier, opponent_tier)
+
+
+def make_optimizer(tmp_path, seconds_per_trial=0.0, **kwargs):
+    return PositionOptimizer(simulator=SlowSimulator(seconds_per_trial),
+                             cache=TranspositionCache(path=tmp_path / "cache.npz"), **kwargs)
+
+
+def test_unique_orderings_skip_identical_minions():
+    assert len(unique_orderings(["a", "b", "c"])) == 6
+    orderings = unique_orderings(["a", "a", "b"])
+    assert len(orderings) == 3
+    assert (0, 1, 2) in orderings
+
+
+def test_without_deadline_finalists_get_final_trials(tmp_path):
+    result = make_optimizer(tmp_path, final_trials=64).optimize(BOARD, [OPPONENT], deadline_ms=0)
+    assert not result["timed_out"] and not result["inconclusive"]
+    assert result["orderings"] == 120
+    assert all(summary["trials"] >= 64 for summary in [result["best"], *result["alternatives"]])
+
+
+def test_halving_timeout_still_runs_final_evaluation(tmp_path):
+    # 第一轮121场约60ms，之后每轮十几毫秒，超过淘汰轮的80ms后直接进入最终评估
+    optimizer = make_optimizer(tmp_path, 0.0005, final_trials=8, final_share=0.6)
+    result = optimizer.optimize(BOARD, [OPPONENT], deadline_ms=200)
+    assert result["timed_out"] and not result["inconclusive"]
+    assert result["best"]["trials"] == 8
+    assert len(result["alternatives"]) == 2
+
+
+def test_unfinishable_final_evaluation_keeps_current_order(tmp_path):
+    # 最终评估约需 4 * 510 * 0.5ms，远超截止时间
+    optimizer = make_optimizer(tmp_path, 0.0005, final_trials=512)
+    result = optimizer.optimize(BOARD, [OPPONENT], deadline_ms=100)
+    assert result["timed_out"] and result["inconclusive"]
+    assert result["best"]["positions"] == [0, 1, 2, 3, 4]
+    assert result["best"]["win_delta"] == 0
+    assert result["alternatives"] == []
+
+
+def test_tiny_deadline_returns_current_order(tmp_path):
+    # 每个对手只模拟第一批就到达截止时间，不做最终评估
+    optimizer = make_optimizer(tmp_path, 0.0001, batch_trials=16)
+    result = optimizer.optimize(BOARD, [OPPONENT, OPPONENT[:1]], deadline_ms=1)
+    assert result["timed_out"] and result["inconclusive"]
+    assert result["rounds"] == 1
+    assert result["simulated_trials"] == 32
+    assert result["best"]["positions"] == [0, 1, 2, 3, 4]
+    assert len(optimizer.cache) == 0
+
+
+def test_large_boards_sample_first_round_candidates(tmp_path):
+    board = [CombatMinion(attack, 8 - attack, name=f"m{attack}") for attack in range(1, 8)]
+    optimizer = make_optimizer(tmp_path, final_trials=16, max_candidates=100)
+    result = optimizer.optimize(board, [OPPONENT], deadline_ms=0)
+    assert result["orderings"] == 5040 and result["sampled"] == 100
+    assert not result["timed_out"] and not result["inconclusive"]
+    assert result["best"]["trials"] >= 16
+    # 抽样由种子决定
+    again = make_optimizer(tmp_path, final_trials=16, max_candidates=100).optimize(board, [OPPONENT], deadline_ms=0)
+    assert again["best"]["positions"] == result["best"]["positions"]
+
+
+def test_only_finalists_are_written_to_cache(tmp_path):
+    optimizer = make_optimizer(tmp_path, final_trials=64)
+    result = optimizer.optimize(BOARD, [OPPONENT, OPPONENT[:1]], deadline_ms=0)
+    # 前3名和当前站位，各对两个对手
+    finalists = {tuple(summary["positions"]) for summary in [result["best"], *result["alternatives"]]}
+    assert len(optimizer.cache) == len(finalists | {(0, 1, 2, 3, 4)}) * 2
+    assert result["simulated_trials"] > len(optimizer.cache) * 64
+
+    # 再次搜索时复用写入的最终结果，不会重复累加
+    again = optimizer.optimize(BOARD, [OPPONENT, OPPONENT[:1]], deadline_ms=0)
+    assert again["transposition"]["hits"] > 0
+    assert again["best"]["trials"] == result["best"]["trials"]
+
+
+def test_inconclusive_search_writes_nothing(tmp_path):
+    optimizer = make_optimizer(tmp_path, 0.0005, final_trials=512)
+    assert optimizer.optimize(BOARD, [OPPONENT], deadline_ms=100)["inconclusive"]
+    assert len(optimizer.cache) == 0
@@ -0,0 +1,65 @@
+"""识别引擎的纯色区域过滤和战斗阶段判定"""
+
+import numpy as np
+import pytest
+
+from recognition_engine import ROIS, HeroInfo, RecognitionEngine
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return RecognitionEngine()
+
+
+def test_flat_regions_are_not_matched(engine):
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    x, y, w, h = ROIS["opponent_hero"]
+    assert engine.recognize_hero(frame[y:y + h, x:x + w]) is None
+    x, y, w, h = ROIS["shop"]
+    assert engine.recognize_minions(np.full((h, w, 3), 128, dtype=np.uint8)) == []
+
+    state = engine.recognize_frame(frame)
+    assert state.phase == "recruit" and state.opponent is None
+    assert state.hero.name == "Unknown"
+
+
+def test_combat_needs_consecutive_frames(monkeypatch):
+    engine = RecognitionEngine(combat_frames=3)
+    scans = []
+
+    def fake_hero(roi):
+        scans.append(roi)
+        return HeroInfo(name="rafaam" if roi.mean() > 100 else "sylvanas", health=30, armor=0)
+
+    monkeypatch.setattr(engine, "recognize_hero", fake_hero)
+    rng = np.random.default_rng(0)
+    first = rng.integers(120, 200, (200, 200, 3), dtype=np.uint8)
+    other = rng.integers(0, 80, (200, 200, 3), dtype=np.uint8)
+
+    assert engine.detect_opponent(first) is None
+    assert engine.detect_opponent(first) is None
+    assert engine.detect_opponent(first).name == "rafaam"
+    # 画面不变时复用第一次的识别结果
+    assert len(scans) == 1
+    # 换成另一个英雄时重新计数
+    assert engine.detect_opponent(other) is None
+    assert len(scans) == 2
+
+
+def test_lost_opponent_resets_streak(monkeypatch):
+    engine = RecognitionEngine(combat_frames=2)
+    heroes = iter([HeroInfo("rafaam", 30, 0), None, HeroInfo("rafaam", 30, 0), HeroInfo("rafaam", 30, 0)])
+    monkeypatch.setattr(engine, "recognize_hero", lambda roi: next(heroes))
+    rng = np.random.default_rng(1)
+    results = [engine.detect_opponent(rng.integers(0, 255, (200, 200, 3), dtype=np.uint8)) for _ in range(4)]
+    assert [hero and hero.name for hero in results] == [None, None, None, "rafaam"]
+
+
+def test_single_frame_engine_shares_templates(engine, monkeypatch):
+    # 上传帧使用的引擎：共用实时引擎的模板，单帧即判定战斗阶段，不影响实时引擎的连续帧计数
+    single = RecognitionEngine(combat_frames=1, template_manager=engine.template_manager)
+    assert single.template_manager is engine.template_manager
+    monkeypatch.setattr(single, "recognize_hero", lambda roi: HeroInfo("rafaam", 30, 0))
+    roi = np.random.default_rng(2).integers(0, 255, (200, 200, 3), dtype=np.uint8)
+    assert single.detect_opponent(roi).name == "rafaam"
+    assert engine._combat_streak == 0
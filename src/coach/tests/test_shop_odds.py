@@ -0,0 +1,53 @@
+"""商店概率引擎"""
+
+import json
+import math
+
+import pytest
+
+from card_database import CardDatabase
+from shop_odds import COPIES, SHOP_SLOTS, ShopOdds, miss_table
+
+
+def write_pool(directory, minions):
+    """写入只含指定随从的卡牌数据：[(名称, 等级, 种族编号)]"""
+    directory.mkdir(parents=True, exist_ok=True)
+    cards = [{"id": i, "name": name, "slug": f"{i}-{name}", "attack": 1, "health": 1,
+              "minionTypeId": tribe, "battlegrounds": {"tier": tier}}
+             for i, (name, tier, tribe) in enumerate(minions, start=1)]
+    (directory / "minions.json").write_text(json.dumps(cards), encoding="utf-8")
+    (directory / "heroes.json").write_text("[]", encoding="utf-8")
+    return CardDatabase(str(directory))
+
+
+@pytest.mark.parametrize("total, slots", [(3, 3), (16, 3), (48, 4), (150, 6)])
+def test_miss_table_matches_binomial_ratio(total, slots):
+    table = miss_table(total, slots)
+    expected = [math.comb(total - k, slots) / math.comb(total, slots) for k in range(total + 1)]
+    assert table.tolist() == pytest.approx(expected, rel=1e-12, abs=1e-15)
+
+
+def test_query_counts_copies_in_the_shared_pool(tmp_path):
+    odds = ShopOdds(write_pool(tmp_path, [("alpha", 1, 20), ("bravo", 1, 14), ("charlie", 2, 20)]))
+    total, slots = 2 * COPIES[1], SHOP_SLOTS[1]
+
+    result = odds.query(1, ["alpha"], rolls=2, visible=["alpha", {"name": "alpha", "golden": True}])
+    left = COPIES[1] - 4
+    miss = math.comb(total - 4 - left, slots) / math.comb(total - 4, slots)
+    assert (result["copies_left"], result["pool_size"]) == (left, total - 4)
+    assert result["per_roll"] == pytest.approx(1 - miss, abs=1e-6)
+    assert result["probability"] == pytest.approx(1 - miss ** 2, abs=1e-6)
+
+    # 二本随从在一本商店中刷不出来，本局没有的种族被排除
+    assert odds.query(1, tribe="beast")["copies_left"] == COPIES[1]
+    assert odds.query(2, tribe="beast", lobby=["murloc"])["copies_left"] == 0
+
+
+def test_unknown_targets_raise(tmp_path):
+    odds = ShopOdds(write_pool(tmp_path, [("alpha", 1, 20)]))
+    with pytest.raises(ValueError):
+        odds.query(1, ["missing"])
+    with pytest.raises(ValueError):
+        odds.query(1, tribe="野兽")
+    with pytest.raises(ValueError):
+        odds.query(1, ["alpha"], rolls=-1)
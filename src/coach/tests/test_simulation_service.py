@@ -0,0 +1,75 @@
+"""模拟服务的分片随机流"""
+
+import numpy as np
+import pytest
+
+from combat_simulator import CombatMinion
+from simulation_service import SimulationService, _run_chunk
+from transposition_cache import TranspositionCache
+
+
+BOARD = [CombatMinion(2, 3), CombatMinion(3, 2)]
+OPPONENT = [CombatMinion(3, 3), CombatMinion(1, 4, taunt=True)]
+
+
+def make_service(tmp_path, workers):
+    return SimulationService(workers=workers, chunk_trials=100, deadline_ms=0, tolerance=0.0,
+                             cache=TranspositionCache(path=tmp_path / "cache.npz"))
+
+
+def run(service, seed):
+    summary = service.simulate(BOARD, OPPONENT, trials=1000, seed=seed)
+    for key in ("elapsed_ms", "workers"):
+        summary.pop(key)
+    return summary
+
+
+@pytest.fixture
+def pooled(tmp_path):
+    service = make_service(tmp_path, workers=2)
+    yield service
+    service.close()
+
+
+def test_same_seed_is_independent_of_worker_count(tmp_path, pooled):
+    inline = run(make_service(tmp_path, workers=0), seed=42)
+    assert inline["trials"] == 1000 and inline["chunks"] == 10
+    assert 0 < inline["win"] < 1
+    assert run(pooled, seed=42) == inline
+    assert run(make_service(tmp_path, workers=0), seed=42) == inline
+
+
+def test_chunks_follow_spawned_seed_sequence(tmp_path):
+    summary = make_service(tmp_path, workers=0).simulate(BOARD, OPPONENT, trials=300, seed=7)
+    seeds = np.random.SeedSequence(7).spawn(3)
+    winner = np.concatenate([_run_chunk((BOARD, OPPONENT), 100, seed, 1, 1)[0] for seed in seeds])
+    assert summary["win"] == round(float(np.mean(winner > 0)), 4)
+    assert summary["loss"] == round(float(np.mean(winner < 0)), 4)
+
+
+def test_seeded_runs_bypass_transposition_cache(tmp_path):
+    service = make_service(tmp_path, workers=0)
+    run(service, seed=1)
+    assert len(service.cache) == 0
+    assert run(service, seed=2) != run(service, seed=1)
+
+
+def test_cold_pool_falls_back_to_first_chunk_in_process(tmp_path):
+    # 进程池刚创建、工作进程尚未启动，1毫秒的截止时间内不会有分片完成
+    service = SimulationService(workers=1, chunk_trials=100, deadline_ms=1, tolerance=0.0,
+                                cache=TranspositionCache(path=tmp_path / "cache.npz"))
+    try:
+        summary = service.simulate(BOARD, OPPONENT, trials=1000, seed=42)
+    finally:
+        service.close()
+    assert summary["deadline_hit"] and summary["chunks"] == 1
+    winner = _run_chunk((BOARD, OPPONENT), 100, np.random.SeedSequence(42).spawn(10)[0], 1, 1)[0]
+    assert summary["win"] == round(float(np.mean(winner > 0)), 4)
+
+
+def test_warmup_and_close(tmp_path):
+    service = make_service(tmp_path, workers=1)
+    service.warmup()
+    assert service._executor is not None
+    service.close()
+    assert service._executor is None
@@ -0,0 +1,77 @@
+"""置换表的LRU淘汰和持久化"""
+
+import numpy as np
+
+from combat_simulator import CombatMinion
+from transposition_cache import ROW_WIDTH, TranspositionCache, matchup_key, outcome_row, simulation_version
+
+
+def row(trials, wins=0):
+    winner = np.array([1] * wins + [-1] * (trials - wins), dtype=np.int8)
+    return outcome_row(winner, np.full(trials, 2, dtype=np.int16))
+
+
+def test_matchup_key_depends_on_order_and_tier():
+    a, b = CombatMinion(1, 2), CombatMinion(3, 4)
+    assert matchup_key([a, b], [a], 1) == matchup_key([a, b], [a], 1)
+    assert matchup_key([a, b], [a], 1) != matchup_key([b, a], [a], 1)
+    assert matchup_key([a, b], [a], 1) != matchup_key([a, b], [a], 2)
+
+
+def test_add_accumulates_rows(tmp_path):
+    cache = TranspositionCache(path=tmp_path / "cache.npz")
+    cache.add("k", row(4, wins=1))
+    total = cache.add("k", row(6, wins=3))
+    assert total[0] == 10 and total[1] == 4 and total[3] == 6
+    assert cache.lookup("k", trials=10)[0] == 10
+    assert cache.lookup("k", trials=20) is not None
+    assert cache.lookup("missing") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["partial_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = TranspositionCache(capacity=2, path=tmp_path / "cache.npz")
+    cache.add("a", row(1))
+    cache.add("b", row(1))
+    cache.peek("a")
+    cache.add("c", row(1))
+    assert cache.peek("b") is None
+    assert cache.peek("a") is not None and cache.peek("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_save_and_load_keep_lru_order(tmp_path):
+    path = tmp_path / "cache.npz"
+    cache = TranspositionCache(path=path)
+    for key in ("a", "b", "c"):
+        cache.add(key, row(2, wins=1))
+    cache.peek("a")
+    cache.save()
+
+    restored = TranspositionCache(capacity=2, path=path)
+    assert restored.load() == 3
+    # 容量不足时保留最近使用的条目
+    assert restored.peek("b") is None
+    assert np.array_equal(restored.peek("a"), cache.peek("a"))
+    assert restored.peek("c") is not None
+
+
+def test_load_ignores_missing_or_malformed_file(tmp_path):
+    path = tmp_path / "cache.npz"
+    assert TranspositionCache(path=path).load() == 0
+    np.savez(path, keys=np.array(["a"]), rows=np.zeros((1, ROW_WIDTH + 1)))
+    assert TranspositionCache(path=path).load() == 0
+
+
+def test_load_drops_file_written_by_another_version(tmp_path):
+    path = tmp_path / "cache.npz"
+    old = TranspositionCache(path=path, version="old")
+    old.add("a", row(2, wins=1))
+    old.save()
+    assert TranspositionCache(path=path, version="old").load() == 1
+
+    current = TranspositionCache(path=path)
+    assert current.version == simulation_version() != "old"
+    assert current.load() == 0 and len(current) == 0
+    assert not path.exists()
@@ -0,0 +1,231 @@
+"""
+战斗模拟置换表
+为一组对战（双方场面的卡牌ID、属性、关键字及站位顺序）计算规范哈希，
+按哈希缓存累计的模拟结果，在各MCP工具间共享并在会话之间持久化（文件记录模拟规则的版本，版本不符时丢弃）
+"""
+
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import astuple
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Union
+
+import numpy as np
+
+import card_effects
+import combat_simulator
+from card_database import CardDatabase, get_card_database
+from card_effects import source_digest
+from combat_simulator import CombatMinion
+
+
+# 统计行：[模拟次数, 胜, 平, 负, 带符号伤害和, 伤害直方图...]，伤害直方图覆盖 -MAX_DAMAGE..MAX_DAMAGE
+MAX_DAMAGE = 64
+HISTOGRAM_OFFSET = 5
+ROW_WIDTH = HISTOGRAM_OFFSET + 2 * MAX_DAMAGE + 1
+
+# 置换表格式版本，统计行的含义变化时递增
+CACHE_VERSION = 1
+
+
+def simulation_version(card_db: Optional[CardDatabase] = None) -> str:
+    """模拟结果的版本：表格式版本、战斗模拟器和效果编译器的源码以及随从数据的摘要，任一变化后旧结果失效"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(CACHE_VERSION.to_bytes(4, "little"))
+    for module in (combat_simulator, card_effects):
+        digest.update(Path(module.__file__).read_bytes())
+    digest.update(source_digest(card_db or get_card_database()).encode())
+    return digest.hexdigest()
+
+
+def minion_bytes(minion: CombatMinion) -> bytes:
+    """随从的规范字节表示（卡牌ID、属性、关键字和亡语，不含名称）"""
+    return np.array(astuple(minion)[:-1], dtype=np.int32).tobytes()
+
+
+def board_bytes(board: Sequence[CombatMinion]) -> bytes:
+    """场面的规范字节表示（保留站位顺序）"""
+    return len(board).to_bytes(1, "little") + b"".join(minion_bytes(minion) for minion in board)
+
+
+def matchup_key(board: Union[Sequence[CombatMinion], bytes], opponent: Union[Sequence[CombatMinion], bytes],
+                tier: int = 1, opponent_tier: int = 1) -> str:
+    """对战的规范哈希；场面可以传入预先计算的 ``board_bytes`` 以免重复序列化"""
+    if not isinstance(board, bytes):
+        board = board_bytes(board)
+    if not isinstance(opponent, bytes):
+        opponent = board_bytes(opponent)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(bytes([tier & 0xFF, opponent_tier & 0xFF]))
+    digest.update(board)
+    digest.update(opponent)
+    return digest.hexdigest()
+
+
+def outcome_row(winner: np.ndarray, damage: np.ndarray) -> np.ndarray:
+    """把一批战斗结果汇总为一条统计行"""
+    signed = winner.astype(np.int64) * damage
+    row = np.zeros(ROW_WIDTH, dtype=np.int64)
+    row[0] = len(winner)
+    row[1] = np.count_nonzero(winner > 0)
+    row[2] = np.count_nonzero(winner == 0)
+    row[3] = np.count_nonzero(winner < 0)
+    row[4] = signed.sum()
+    row[HISTOGRAM_OFFSET:] = np.bincount(np.clip(signed, -MAX_DAMAGE, MAX_DAMAGE) + MAX_DAMAGE,
+                                         minlength=2 * MAX_DAMAGE + 1)
+    return row
+
+
+def row_summary(row: np.ndarray) -> Dict[str, Any]:
+    """把统计行转换为与 ``combat_simulator.summarize`` 相同格式的结果"""
+    trials = int(row[0])
+    if not trials:
+        return {"trials": 0, "win": 0.0, "tie": 0.0, "loss": 0.0,
+                "damage": {"expected": 0.0, "dealt": 0.0, "taken": 0.0, "distribution": {}}}
+    histogram = row[HISTOGRAM_OFFSET:]
+    values = np.arange(-MAX_DAMAGE, MAX_DAMAGE + 1)
+    nonzero = np.flatnonzero(histogram)
+    return {
+        "trials": trials,
+        "win": round(row[1] / trials, 4),
+        "tie": round(row[2] / trials, 4),
+        "loss": round(row[3] / trials, 4),
+        "damage": {
+            "expected": round(row[4] / trials, 3),
+            "dealt": round(float((histogram * np.maximum(values, 0)).sum()) / trials, 3),
+            "taken": round(float((histogram * np.maximum(-values, 0)).sum()) / trials, 3),
+            "distribution": {int(values[i]): round(float(histogram[i]) / trials, 4) for i in nonzero},
+        },
+    }
+
+
+class TranspositionCache:
+    """按对战哈希缓存累计模拟结果的LRU表
+
+    同一对战的新模拟结果累加到已有条目上；超过容量时淘汰最久未使用的条目。
+    文件中记录写入时的 ``version``（缺省为 ``simulation_version()``），加载时版本不符则删除文件。
+    """
+
+    def __init__(self, capacity: int = 20000, path: Optional[Union[str, Path]] = None,
+                 version: Optional[str] = None):
+        self.capacity = capacity
+        self.path = Path(path) if path else Path(__file__).parent / "output" / "transposition_cache.npz"
+        self.version = version or simulation_version()
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loaded = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: str, trials: int = 0) -> Optional[np.ndarray]:
+        """查找条目（返回副本）并记录命中情况：模拟次数不少于trials为命中，不足为部分命中"""
+        row = self.peek(key)
+        self.record(row is not None and row[0] >= trials, row is not None)
+        return row
+
+    def peek(self, key: str) -> Optional[np.ndarray]:
+        """查找条目（返回副本），不计入命中统计"""
+        with self._lock:
+            row = self._entries.get(key)
+            if row is None:
+                return None
+            self._entries.move_to_end(key)
+            return row.copy()
+
+    def record(self, hit: bool, found: bool = True):
+        """记录一次查找结果：命中、部分命中（条目存在但结果不足）或未命中"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            elif found:
+                self.partial_hits += 1
+            else:
+                self.misses += 1
+
+    def add(self, key: str, row: np.ndarray) -> np.ndarray:
+        """把新的统计行累加到条目上，返回累加后的副本"""
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is None:
+                existing = self._entries[key] = np.zeros(ROW_WIDTH, dtype=np.int64)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._entries.move_to_end(key)
+            existing += row
+            return existing.copy()
+
+    def add_outcome(self, key: str, winner: np.ndarray, damage: np.ndarray) -> np.ndarray:
+        """把一批战斗结果累加到条目上"""
+        return self.add(key, outcome_row(winner, damage))
+
+    def clear(self):
+        """清空缓存和统计"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.partial_hits = self.misses = self.evictions = 0
+
+    def save(self):
+        """按LRU顺序写入磁盘"""
+        with self._lock:
+            keys = np.array(list(self._entries), dtype="U32")
+            rows = np.array(list(self._entries.values()), dtype=np.int64).reshape(-1, ROW_WIDTH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(self.path.stem + ".tmp.npz")
+        np.savez_compressed(temporary, keys=keys, rows=rows, version=np.array(self.version))
+        temporary.replace(self.path)
+
+    def load(self) -> int:
+        """从磁盘加载条目（格式不符时忽略，模拟规则的版本不符时删除文件），返回加载的条目数"""
+        try:
+            with np.load(self.path) as data:
+                keys, rows = data["keys"], data["rows"]
+                version = str(data["version"]) if "version" in data.files else None
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return 0
+        if version != self.version:
+            print(f"置换表版本不符（模拟器或卡牌效果已更新），丢弃 {len(keys)} 条旧结果: {self.path}")
+            self.path.unlink(missing_ok=True)
+            return 0
+        if rows.ndim != 2 or rows.shape[1] != ROW_WIDTH:
+            return 0
+        with self._lock:
+            for key, row in zip(keys[-self.capacity:], rows[-self.capacity:]):
+                self._entries[str(key)] = row.astype(np.int64)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            self.loaded = len(keys)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等指标"""
+        lookups = self.hits + self.partial_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "capacity": self.capacity,
+            "bytes": len(self._entries) * ROW_WIDTH * 8,
+            "hits": self.hits,
+            "partial_hits": self.partial_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "loaded": self.loaded,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_transposition_cache() -> TranspositionCache:
+    """获取共享的置换表，首次使用时从磁盘加载，进程退出时写回"""
+    cache = TranspositionCache()
+    cache.load()
+    atexit.register(cache.save)
+    return cache
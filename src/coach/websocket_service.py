@@ -5,73 +5,440 @@ WebSocket服务模块
 
 import asyncio
 import json
-from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, Deque, Tuple, Set, Iterable, Callable, FrozenSet
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.middleware.cors import CORSMiddleware
-from recognition_engine import RecognitionEngine, GameState
+from fastapi.responses import PlainTextResponse
+from recognition_engine import RecognitionEngine, GameState, check_frame
+from state_history import StateHistory
+from match_archive import MatchArchive
+from simulation_service import get_simulation_service
+from position_optimizer import PositionOptimizer
+from ghost_cache import GhostCache, GhostPrecomputer
+from shop_odds import get_shop_odds
+from economy_planner import EconomyPlanner, upgrade_cost
+from advice_engine import ADVICE_KINDS, AdviceEngine, AdviceWorker
+from board_analytics import BoardAnalytics
+from card_search import get_card_search
+from transposition_cache import get_transposition_cache
+from metrics import get_metrics
+from profiler import capture_profile
 import cv2
 import numpy as np
 from datetime import datetime
+from dataclasses import asdict
+
+
+# 可订阅的数据主题
+TOPICS = ("economy", "hero", "shop", "board", "phase", "advice", "metrics")
+# 组成完整游戏状态（与 /api/state 一致）的主题，未显式订阅的客户端默认订阅这些主题
+STATE_TOPICS = ("economy", "hero", "shop", "board", "phase")
+DEFAULT_TOPICS = frozenset(STATE_TOPICS)
+# 字段平铺在消息顶层的主题
+FLAT_TOPICS = ("economy", "phase")
+# 后台建议算好时单独推送的主题
+ADVICE_TOPICS = frozenset({"advice"})
+# 发送队列积压策略：drop_oldest 丢弃最旧消息，coalesce 只保留最新消息
+POLICIES = ("drop_oldest", "coalesce")
+
+
+def check_queue_options(max_queue: int, policy: str, max_lag: float):
+    """校验发送队列参数，无效时抛出ValueError"""
+    if policy not in POLICIES:
+        raise ValueError(f"未知的积压策略: {policy}，可选: {', '.join(POLICIES)}")
+    if max_queue < 1:
+        raise ValueError("max_queue 至少为1")
+    if not max_lag > 0:
+        raise ValueError("max_lag 应为正数")
+
+
+class ClientConnection:
+    """单个WebSocket客户端的发送队列与写协程
+
+    每个连接拥有独立的有界发送队列和写协程，慢客户端只会积压自己的队列，
+    不会阻塞其他客户端的广播。
+    """
+    
+    def __init__(self, websocket: WebSocket, max_queue: int = 8,
+                 policy: str = "drop_oldest", max_lag: float = 2.0,
+                 topics: Iterable[str] = DEFAULT_TOPICS):
+        check_queue_options(max_queue, policy, max_lag)
+        self.websocket = websocket
+        self.topics: Set[str] = set(topics)
+        self.max_queue = max_queue
+        self.policy = policy            # drop_oldest: 丢弃最旧消息；coalesce: 只保留最新消息
+        self.max_lag = max_lag          # 超过该延迟（秒）的客户端将被断开
+        self.queue: Deque[Tuple[float, str]] = deque()
+        self.closed = False
+        self.connected_at = time.time()
+        self.sent_count = 0
+        self.dropped_count = 0
+        self.last_send_lag = 0.0
+        self.max_send_lag = 0.0
+        self._sending_since: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """启动写协程（需在事件循环中调用）"""
+        self._writer_task = asyncio.create_task(self._writer())
+    
+    def enqueue(self, message: str):
+        """将消息放入发送队列，按策略处理积压"""
+        if self.closed:
+            return
+        if self.policy == "coalesce":
+            # 合并：未发送的旧状态全部被最新状态取代
+            if self.queue:
+                get_metrics().inc("coach_messages_dropped_total", len(self.queue), policy=self.policy)
+            self.dropped_count += len(self.queue)
+            self.queue.clear()
+        elif len(self.queue) >= self.max_queue:
+            self.queue.popleft()
+            self.dropped_count += 1
+            get_metrics().inc("coach_messages_dropped_total", policy=self.policy)
+        self.queue.append((time.monotonic(), message))
+        self._wakeup.set()
+    
+    @property
+    def lag(self) -> float:
+        """当前延迟：正在发送的消息已耗时与队首消息等待时间中的较大者"""
+        now = time.monotonic()
+        lag = 0.0
+        if self._sending_since is not None:
+            lag = now - self._sending_since
+        if self.queue:
+            lag = max(lag, now - self.queue[0][0])
+        return lag
+    
+    async def _writer(self):
+        """写协程：按顺序发送队列中的消息"""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                enqueued_at, message = self.queue.popleft()
+                self._sending_since = time.monotonic()
+                await self.websocket.send_text(message)
+                self._sending_since = None
+                self.sent_count += 1
+                self.last_send_lag = time.monotonic() - enqueued_at
+                self.max_send_lag = max(self.max_send_lag, self.last_send_lag)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"发送消息失败: {e}")
+            self.closed = True
+    
+    async def close(self):
+        """停止写协程并关闭底层连接"""
+        self.closed = True
+        self.queue.clear()
+        if self._writer_task and self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+    
+    def stats(self) -> Dict[str, Any]:
+        """连接的发送统计"""
+        return {
+            "client": f"{self.websocket.client.host}:{self.websocket.client.port}" if self.websocket.client else None,
+            "connected_at": datetime.fromtimestamp(self.connected_at).isoformat(),
+            "policy": self.policy,
+            "topics": sorted(self.topics),
+            "queued": len(self.queue),
+            "sent": self.sent_count,
+            "dropped": self.dropped_count,
+            "lag_ms": round(self.lag * 1000, 1),
+            "last_send_lag_ms": round(self.last_send_lag * 1000, 1),
+            "max_send_lag_ms": round(self.max_send_lag * 1000, 1),
+        }
 
 
 class WebSocketManager:
-    """WebSocket连接管理器"""
+    """WebSocket连接管理器
+
+    ``max_queue``、``policy``、``max_lag`` 为连接的默认发送参数，客户端可在连接时单独指定积压策略和延迟阈值。
+    除了入队时检查延迟，还由定时任务每 ``lag_check_interval`` 秒检查一次，没有新消息的慢客户端同样会被断开。
+    """
     
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, max_queue: int = 8, policy: str = "drop_oldest", max_lag: float = 2.0,
+                 lag_check_interval: float = 0.5):
+        check_queue_options(max_queue, policy, max_lag)
+        self.connections: Dict[WebSocket, ClientConnection] = {}
         self.recognition_engine = RecognitionEngine()
+        # 上传帧（/api/process-frame）使用独立的引擎：各帧相互独立、按单帧判定战斗阶段，
+        # 不读写实时识别循环的连续帧计数（与 batch_recognize.py 相同）
+        self.upload_engine = RecognitionEngine(combat_frames=1,
+                                               template_manager=self.recognition_engine.template_manager)
         self.last_game_state: Optional[GameState] = None
+        self.last_published_at: Optional[float] = None
+        self.history = StateHistory()
+        self.archive = MatchArchive()
+        self._session_started_at: Optional[str] = None
+        self.max_queue = max_queue
+        self.policy = policy
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.lagging_disconnects = 0
+        self._lag_monitor: Optional[asyncio.Task] = None
+        # 按状态差异增量维护的我方场面统计
+        self.board_analytics = BoardAnalytics()
+        # 商店或场面变化时后台预先计算建议，算好后推送给订阅advice主题的客户端
+        self.advice_worker: Optional[AdviceWorker] = None
+        # 战斗阶段记录的对手场面，以及招募阶段的后台预计算
+        self.ghosts = GhostCache()
+        self.ghost_precomputer: Optional[GhostPrecomputer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # 主题数据提供者：只有被订阅的主题才会被计算和序列化
+        self.topic_providers: Dict[str, Callable[[GameState], Any]] = {
+            "economy": lambda state: {"tavern_tier": state.tavern_tier, "gold": state.gold, "turn": state.turn},
+            "hero": lambda state: asdict(state.hero),
+            "shop": lambda state: state.shop,
+            "board": lambda state: state.board,
+            "phase": lambda state: {"phase": state.phase, "opponent": state.opponent},
+            "advice": self.current_advice,
+            "metrics": lambda state: {
+                "active_connections": len(self.connections),
+                "lagging_disconnects": self.lagging_disconnects,
+                "pipeline": get_metrics().stage_summary(),
+            },
+        }
+    
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        """当前活跃的WebSocket连接"""
+        return list(self.connections)
     
-    async def connect(self, websocket: WebSocket):
-        """处理新的WebSocket连接"""
+    async def connect(self, websocket: WebSocket, topics: Iterable[str] = DEFAULT_TOPICS,
+                      policy: Optional[str] = None, max_lag: Optional[float] = None):
+        """处理新的WebSocket连接，``policy``/``max_lag`` 缺省时使用管理器的默认值"""
         await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"新的WebSocket连接，当前连接数: {len(self.active_connections)}")
+        self._loop = asyncio.get_running_loop()
+        connection = ClientConnection(websocket, self.max_queue, policy or self.policy,
+                                      max_lag if max_lag is not None else self.max_lag, topics)
+        connection.start()
+        self.connections[websocket] = connection
+        if self._lag_monitor is None or self._lag_monitor.done():
+            self._lag_monitor = asyncio.create_task(self._monitor_lag())
+        print(f"新的WebSocket连接，当前连接数: {len(self.connections)}")
         
         # 发送当前游戏状态（如果有）
-        if self.last_game_state:
-            await websocket.send_text(json.dumps(vars(self.last_game_state), ensure_ascii=False))
+        self.send_snapshot(connection)
+    
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> Set[str]:
+        """为连接增加订阅主题，返回新增的主题"""
+        connection = self.connections[websocket]
+        new_topics = set(topics) - connection.topics
+        connection.topics.update(new_topics)
+        return new_topics
+    
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]):
+        """为连接取消订阅主题"""
+        self.connections[websocket].topics.difference_update(topics)
+    
+    def send_snapshot(self, connection: ClientConnection, topics: Optional[Iterable[str]] = None):
+        """向单个连接发送最近一次游戏状态中其订阅的主题"""
+        if self.last_game_state is None:
+            return
+        topics = frozenset(topics if topics is not None else connection.topics)
+        if topics:
+            fragments = self._serialize_topics(self.last_game_state, topics)
+            connection.enqueue(self._compose(self.last_game_state, topics, fragments))
     
     def disconnect(self, websocket: WebSocket):
         """处理WebSocket连接断开"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        print(f"WebSocket连接断开，当前连接数: {len(self.active_connections)}")
+        connection = self.connections.pop(websocket, None)
+        if connection:
+            connection.closed = True
+            if connection._writer_task:
+                connection._writer_task.cancel()
+        print(f"WebSocket连接断开，当前连接数: {len(self.connections)}")
     
     async def broadcast(self, message: str):
-        """广播消息给所有连接的客户端"""
-        if self.active_connections:
-            # 创建任务列表，并行发送给所有客户端
-            tasks = []
-            for connection in self.active_connections:
-                try:
-                    tasks.append(connection.send_text(message))
-                except Exception as e:
-                    print(f"发送消息失败: {e}")
-                    # 标记连接为无效
-                    connection.close()
-            
-            # 并行执行所有发送任务
-            if tasks:
-                await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # 清理无效连接
-            self.active_connections = [conn for conn in self.active_connections if not conn.closed]
+        """广播消息给所有连接的客户端
+
+        只把消息放入各连接的发送队列，不等待实际发送。
+        识别线程使用独立事件循环调用时，会转交到服务所在的事件循环执行。
+        """
+        if not self.connections or self._loop is None:
+            return
+        if asyncio.get_running_loop() is self._loop:
+            self._enqueue_all(message)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue_all, message)
+    
+    def _enqueue_all(self, message: str):
+        """入队并断开延迟超过阈值或已失效的客户端"""
+        for websocket, connection in list(self.connections.items()):
+            self._enqueue(websocket, connection, message)
+    
+    def _enqueue(self, websocket: WebSocket, connection: ClientConnection, message: str):
+        """入队单条消息，断开已失效或延迟超过阈值的客户端"""
+        if connection.closed:
+            self.connections.pop(websocket, None)
+            return
+        connection.enqueue(message)
+        self._check_lag(websocket, connection)
+    
+    def _check_lag(self, websocket: WebSocket, connection: ClientConnection) -> bool:
+        """延迟超过阈值时断开连接，返回是否已断开"""
+        if connection.lag <= connection.max_lag:
+            return False
+        print(f"客户端延迟 {connection.lag:.2f}s 超过阈值，断开连接")
+        self.lagging_disconnects += 1
+        self.connections.pop(websocket, None)
+        asyncio.create_task(connection.close())
+        return True
+    
+    async def _monitor_lag(self):
+        """定时检查所有连接的延迟：卡在发送中的客户端即使没有新消息入队也会被断开，没有连接时退出"""
+        try:
+            while self.connections:
+                await asyncio.sleep(self.lag_check_interval)
+                for websocket, connection in list(self.connections.items()):
+                    if connection.closed:
+                        self.connections.pop(websocket, None)
+                    else:
+                        self._check_lag(websocket, connection)
+        except asyncio.CancelledError:
+            pass
+    
+    def publish_state(self, game_state: GameState):
+        """按订阅主题推送游戏状态（可在任意线程/事件循环中调用）"""
+        if self._is_new_game(game_state):
+            self.finish_session()
+            self.ghosts.clear()
+            self.board_analytics.clear()
+        if self._session_started_at is None:
+            self._session_started_at = game_state.timestamp
+        self.last_game_state = game_state
+        self.last_published_at = time.monotonic()
+        self.ghosts.observe(game_state)
+        # 战斗中的场面变化不计入历史和存档
+        if game_state.phase != "combat":
+            self.history.record(game_state)
+            self.board_analytics.update(game_state.board.get("minions", []))
+            if self.ghost_precomputer is not None:
+                self.ghost_precomputer.submit(game_state)
+            if self.advice_worker is not None:
+                self.advice_worker.submit(game_state.to_dict(), self.ghosts.version)
+        if not self.connections or self._loop is None:
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._publish(game_state)
+        else:
+            self._loop.call_soon_threadsafe(self._publish, game_state)
+    
+    def current_advice(self, game_state: GameState) -> Dict[str, Any]:
+        """与该状态一致的各类预计算建议，尚未算好或已过期的类型不包含在内"""
+        if self.advice_worker is None:
+            return {}
+        state = game_state.to_dict()
+        advice = {kind: self.advice_worker.lookup(kind, state, self.ghosts.version) for kind in ADVICE_KINDS}
+        return {kind: value for kind, value in advice.items() if value is not None}
+    
+    def publish_advice(self):
+        """后台建议算好后立即推送advice主题，不等下一帧（可在任意线程中调用）"""
+        game_state = self.last_game_state
+        if game_state is None or not self.connections or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._publish, game_state, ADVICE_TOPICS)
+    
+    def _is_new_game(self, game_state: GameState) -> bool:
+        """判断是否开始了新的一局：回合数倒退或识别到不同的英雄"""
+        last = self.last_game_state
+        if last is None or self._session_started_at is None:
+            return False
+        if game_state.turn < last.turn:
+            return True
+        known = ("", "Unknown")
+        return (last.hero.name not in known and game_state.hero.name not in known
+                and game_state.hero.name != last.hero.name)
+    
+    def finish_session(self, placement: int = 0) -> Optional[int]:
+        """结束当前对局并写入存档，返回对局ID（无可存档数据时返回None）"""
+        if self._session_started_at is None:
+            return None
+        records = self.history.query(since=self._session_started_at, limit=0)
+        self._session_started_at = None
+        try:
+            return self.archive.archive_session(records, placement)
+        except Exception as e:
+            print(f"对局存档失败: {e}")
+            return None
+    
+    def _publish(self, game_state: GameState, only: Optional[FrozenSet[str]] = None):
+        """计算被订阅主题的并集，每个主题只序列化一次；指定 ``only`` 时只推送其中被订阅的主题"""
+        metrics = get_metrics()
+        started = time.perf_counter()
+        subscribed = set()
+        for connection in self.connections.values():
+            subscribed.update(connection.topics if only is None else connection.topics & only)
+        fragments = self._serialize_topics(game_state, subscribed)
+        serialized = time.perf_counter()
+        metrics.observe("serialize", serialized - started)
+        
+        # 订阅集合相同的客户端共享同一条消息
+        messages: Dict[FrozenSet[str], str] = {}
+        for websocket, connection in list(self.connections.items()):
+            key = frozenset(connection.topics if only is None else connection.topics & only)
+            if not key:
+                continue
+            if key not in messages:
+                messages[key] = self._compose(game_state, key, fragments)
+            self._enqueue(websocket, connection, messages[key])
+        metrics.observe("broadcast", time.perf_counter() - serialized)
+    
+    def _serialize_topics(self, game_state: GameState, topics: Iterable[str]) -> Dict[str, str]:
+        """只计算并序列化指定的主题，返回JSON片段"""
+        fragments = {}
+        for topic in topics:
+            value = self.topic_providers[topic](game_state)
+            if topic in FLAT_TOPICS:
+                # 经济和阶段字段平铺在顶层，与完整游戏状态的格式一致
+                fragments[topic] = json.dumps(value, ensure_ascii=False)[1:-1]
+            else:
+                fragments[topic] = f'"{topic}": ' + json.dumps(value, ensure_ascii=False)
+        return fragments
+    
+    @staticmethod
+    def _compose(game_state: GameState, topics: Iterable[str], fragments: Dict[str, str]) -> str:
+        """拼接JSON片段为完整消息"""
+        parts = [f'"timestamp": {json.dumps(game_state.timestamp)}']
+        parts.extend(fragments[topic] for topic in TOPICS if topic in topics)
+        return "{" + ", ".join(parts) + "}"
+    
+    def connection_stats(self) -> List[Dict[str, Any]]:
+        """所有连接的发送统计"""
+        return [connection.stats() for connection in self.connections.values()]
     
     async def process_frame(self, frame: np.ndarray):
         """处理新的游戏帧"""
         try:
             # 使用识别引擎识别游戏状态
             game_state = self.recognition_engine.recognize_frame(frame)
-            self.last_game_state = game_state
             
-            # 转换为JSON并广播
-            game_state_dict = vars(game_state)
-            message = json.dumps(game_state_dict, ensure_ascii=False)
-            await self.broadcast(message)
+            # 按订阅主题推送
+            self.publish_state(game_state)
             
         except Exception as e:
             print(f"处理游戏帧失败: {e}")
+            get_metrics().inc("coach_frames_dropped_total", reason="error")
             # 发送错误状态
             error_state = {
                 "timestamp": datetime.now().isoformat(),
@@ -81,8 +448,17 @@ class WebSocketManager:
             await self.broadcast(json.dumps(error_state))
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时在后台预热模拟服务的进程池（不阻塞服务启动），关闭时停止进程池"""
+    service = get_simulation_service()
+    asyncio.get_running_loop().run_in_executor(None, service.warmup)
+    yield
+    service.close()
+
+
 # 创建FastAPI应用
-app = FastAPI(title="炉石战棋识别服务", version="1.0.0")
+app = FastAPI(title="炉石战棋识别服务", version="1.0.0", lifespan=lifespan)
 
 # 添加CORS中间件
 app.add_middleware(
@@ -93,8 +469,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 创建WebSocket管理器实例
-websocket_manager = WebSocketManager()
+# 创建WebSocket管理器实例，发送队列的默认参数可由环境变量调整
+try:
+    websocket_manager = WebSocketManager(
+        max_queue=int(os.environ.get("COACH_WS_MAX_QUEUE", 8)),
+        policy=os.environ.get("COACH_WS_POLICY", "drop_oldest"),
+        max_lag=float(os.environ.get("COACH_WS_MAX_LAG", 2.0)),
+    )
+except ValueError as e:
+    print(f"发送队列配置无效，使用默认值: {e}")
+    websocket_manager = WebSocketManager()
+
+
+def _collect_metrics():
+    """导出指标时读取各组件已有的统计：模板缓存和置换表的命中次数、连接和发送队列"""
+    templates = websocket_manager.recognition_engine.template_manager
+    yield "coach_cache_requests_total", {"cache": "scaled_template", "result": "hit"}, templates.scaled_hits
+    yield "coach_cache_requests_total", {"cache": "scaled_template", "result": "miss"}, templates.scaled_misses
+    transposition = get_transposition_cache().stats()
+    for result, key in (("hit", "hits"), ("partial_hit", "partial_hits"), ("miss", "misses")):
+        yield "coach_cache_requests_total", {"cache": "transposition", "result": result}, transposition[key]
+    connections = list(websocket_manager.connections.values())
+    yield "coach_active_connections", {}, len(connections)
+    yield "coach_queued_messages", {}, sum(len(connection.queue) for connection in connections)
+
+
+get_metrics().register(_collect_metrics)
 
 
 @app.get("/")
@@ -103,27 +503,549 @@ async def root():
     return {"message": "炉石战棋识别服务", "status": "running"}
 
 
+def service_status() -> Dict[str, Any]:
+    """服务状态"""
+    return {
+        "status": "running",
+        "active_connections": len(websocket_manager.connections),
+        "lagging_disconnects": websocket_manager.lagging_disconnects,
+        "clients": websocket_manager.connection_stats(),
+        "transposition": get_transposition_cache().stats(),
+        "ghosts": websocket_manager.ghosts.stats(),
+        "ghost_precompute": websocket_manager.ghost_precomputer.stats(),
+        "advice_worker": websocket_manager.advice_worker.stats(),
+        "pipeline": get_metrics().stage_summary(),
+        "last_update": websocket_manager.last_game_state.timestamp if websocket_manager.last_game_state else None
+    }
+
+
 @app.get("/api/status")
 async def get_status():
     """获取服务状态"""
+    return service_status()
+
+
+def metrics_snapshot() -> Dict[str, Any]:
+    """JSON形式的流水线指标"""
+    return get_metrics().snapshot()
+
+
+@app.get("/api/metrics")
+async def get_metrics_endpoint(format: str = "prometheus"):
+    """流水线指标：默认为Prometheus文本格式，``format=json`` 时返回各阶段耗时摘要和计数器"""
+    if format == "json":
+        return metrics_snapshot()
+    if format != "prometheus":
+        raise HTTPException(status_code=400, detail=f"未知格式: {format}，可选: prometheus、json")
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def run_profile(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """按参数对识别流水线线程采样（阻塞 ``seconds`` 秒），参数无效或已有采样在进行时抛出ValueError"""
+    try:
+        return capture_profile(
+            seconds=parameters.get("seconds") or 5.0,
+            interval_ms=parameters.get("interval_ms") or 5.0,
+            threads=parameters.get("threads"),
+            top=int(parameters.get("top") or 20),
+            include_idle=bool(parameters.get("include_idle")),
+            stacks=bool(parameters.get("stacks")),
+        )
+    except TypeError as e:
+        raise ValueError(f"参数格式无效: {e}")
+
+
+@app.post("/api/admin/profile")
+async def profile_endpoint(request: Request, format: str = "json"):
+    """对识别线程做定时采样分析
+
+    请求体为JSON：``seconds``（默认5，最多60）、``interval_ms``（默认5）、``threads``（线程名前缀列表，
+    缺省为识别循环、帧识别和后台预计算线程，``["*"]`` 为全部线程）、``top``、``include_idle``、``stacks``。
+    ``format=folded`` 时直接返回折叠调用栈文本，可交给flamegraph.pl或speedscope。
+    """
+    try:
+        parameters = await request.json()
+    except ValueError:
+        parameters = {}
+    if not isinstance(parameters, dict):
+        raise HTTPException(status_code=400, detail="请求体应为JSON对象")
+    if format not in ("json", "folded"):
+        raise HTTPException(status_code=400, detail=f"未知格式: {format}，可选: json、folded")
+    if format == "folded":
+        parameters["stacks"] = True
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(None, run_profile, parameters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "folded":
+        return PlainTextResponse("\n".join(result["collapsed"]) + "\n")
+    return result
+
+
+@app.get("/api/state")
+async def get_state():
+    """获取最新的完整游戏状态"""
+    game_state = websocket_manager.last_game_state
     return {
-        "status": "running",
-        "active_connections": len(websocket_manager.active_connections),
-        "last_update": websocket_manager.last_game_state.timestamp if websocket_manager.last_game_state else None
+        "state": game_state.to_dict() if game_state else None,
+        "version": websocket_manager.history.version,
+    }
+
+
+@app.get("/api/history")
+async def get_history(since: Optional[str] = None, until: Optional[str] = None,
+                      turn: Optional[int] = None, event: Optional[str] = None, limit: int = 100):
+    """查询游戏状态历史
+
+    可按时间范围（ISO时间或时间戳）、回合和事件类型（如 shop_changed）过滤，
+    返回满足条件的最近 ``limit`` 条记录。
+    """
+    try:
+        records = websocket_manager.history.query(since=since, until=until, turn=turn,
+                                                  event=event, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"records": records, "history": websocket_manager.history.stats()}
+
+
+@app.post("/api/archive/finish")
+async def finish_archive_session(placement: int = 0):
+    """结束当前对局并写入存档（placement为最终名次，0表示未知）
+
+    识别不到名次，自动存档（新一局开始时）的对局名次为0，不计入胜率统计；需要名次时在下一局开始前调用本接口。
+    """
+    game_id = websocket_manager.finish_session(placement)
+    return {"status": "success" if game_id is not None else "skipped", "game_id": game_id}
+
+
+def archive_stats(group: str, **filters) -> Dict[str, Any]:
+    """按分组执行存档聚合查询，参数无效时抛出ValueError"""
+    archive = websocket_manager.archive
+    started = time.perf_counter()
+    if group == "hero":
+        result = archive.hero_stats(**filters)
+    elif group == "tribe":
+        result = archive.tribe_stats(**filters)
+    elif group == "tier_up":
+        result = archive.tier_up_turns(**filters)
+    else:
+        raise ValueError(f"未知分组: {group}")
+    return {
+        "group": group,
+        "result": result,
+        "archive": archive.stats(),
+        "query_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+@app.get("/api/archive/stats")
+async def get_archive_stats(group: str = "hero", hero: Optional[str] = None, tribe: Optional[str] = None,
+                            since: Optional[str] = None, until: Optional[str] = None):
+    """对局存档聚合查询
+
+    ``group`` 可选 ``hero``（英雄胜率）、``tribe``（终局种族）、``tier_up``（平均升级回合），
+    可按英雄、终局场面包含的种族和日期范围过滤。胜率等名次统计只计入名次已知的对局（见 ``/api/archive/finish``）。
+    """
+    try:
+        return archive_stats(group, hero=hero, tribe=tribe, since=since, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/archive/games")
+async def get_archive_games(hero: Optional[str] = None, tribe: Optional[str] = None,
+                            since: Optional[str] = None, until: Optional[str] = None,
+                            limit: int = 50, game_id: Optional[int] = None):
+    """列出存档中的对局，指定game_id时返回该局每回合的商店与场面"""
+    archive = websocket_manager.archive
+    try:
+        if game_id is not None:
+            return {"game_id": game_id, "turns": archive.game_turns(game_id)}
+        return {"games": archive.list_games(limit=limit, hero=hero, tribe=tribe, since=since, until=until)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def run_simulation(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """按参数执行战斗模拟，未提供我方场面时使用最新识别的场面和酒馆等级，参数无效时抛出ValueError"""
+    opponent = parameters.get("opponent")
+    if not opponent:
+        raise ValueError("缺少对手场面 opponent")
+    board = parameters.get("board")
+    tier = parameters.get("tier")
+    if board is None:
+        game_state = websocket_manager.last_game_state
+        if game_state is None:
+            raise ValueError("暂无游戏状态，请提供我方场面 board")
+        board = game_state.board.get("minions", [])
+        tier = tier or game_state.tavern_tier
+    try:
+        return get_simulation_service().simulate(
+            board, opponent,
+            trials=int(parameters.get("trials") or 5000),
+            seed=parameters.get("seed"),
+            deadline_ms=parameters.get("deadline_ms"),
+            tier=int(tier or 1),
+            opponent_tier=int(parameters.get("opponent_tier") or 1),
+        )
+    except (TypeError, AttributeError) as e:
+        raise ValueError(f"场面格式无效: {e}")
+
+
+@app.post("/api/simulate")
+async def simulate_endpoint(request: Request):
+    """蒙特卡洛战斗模拟
+
+    请求体为JSON：``opponent``（必填，对手随从列表）、``board``（缺省为当前场面）、
+    ``trials``、``seed``、``deadline_ms``、``tier``、``opponent_tier``。
+    """
+    try:
+        parameters = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="请求体不是有效的JSON")
+    if not isinstance(parameters, dict):
+        raise HTTPException(status_code=400, detail="请求体应为JSON对象")
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, run_simulation, parameters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# 站位优化器的模拟结果缓存在多次请求间复用
+position_optimizer = PositionOptimizer()
+websocket_manager.ghost_precomputer = GhostPrecomputer(websocket_manager.ghosts, position_optimizer)
+
+
+def optimize_position(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """按参数搜索最佳站位，参数无效时抛出ValueError
+
+    未提供我方场面时使用最新识别的场面；未提供对手场面时使用战斗阶段记录的对手场面，
+    后台已为当前场面算好结果时直接返回（``precomputed`` 为true）。
+    """
+    board = parameters.get("board")
+    tier = parameters.get("tier")
+    if board is None:
+        game_state = websocket_manager.last_game_state
+        if game_state is None:
+            raise ValueError("暂无游戏状态，请提供我方场面 board")
+        board = game_state.board.get("minions", [])
+        tier = tier or game_state.tavern_tier
+    opponents = parameters.get("opponents")
+    ghosts = None
+    if not opponents:
+        precomputed = websocket_manager.ghost_precomputer.lookup(board, int(tier or 1))
+        if precomputed and precomputed["position"]:
+            return dict(precomputed["position"], precomputed=True, age_ms=precomputed["age_ms"])
+        ghosts = websocket_manager.ghosts.ghosts()
+        opponents = [ghost.minions for ghost in ghosts]
+    try:
+        result = position_optimizer.optimize(
+            board, opponents,
+            seed=int(parameters.get("seed") or 0),
+            deadline_ms=parameters.get("deadline_ms"),
+            tier=int(tier or 1),
+        )
+    except (TypeError, AttributeError) as e:
+        raise ValueError(f"场面格式无效: {e}")
+    if ghosts is not None:
+        result["ghosts"] = [ghost.hero for ghost in ghosts]
+    result["precomputed"] = False
+    return result
+
+
+def ghost_boards() -> Dict[str, Any]:
+    """记录的对手场面及后台预计算的胜率"""
+    game_state = websocket_manager.last_game_state
+    precomputed = None
+    if game_state is not None:
+        precomputed = websocket_manager.ghost_precomputer.lookup(
+            game_state.board.get("minions", []), game_state.tavern_tier)
+    return {
+        "ghosts": [ghost.to_dict() for ghost in websocket_manager.ghosts.ghosts()],
+        "odds": precomputed["odds"] if precomputed else None,
+        "age_ms": precomputed["age_ms"] if precomputed else None,
+        "cache": websocket_manager.ghosts.stats(),
+        "precompute": websocket_manager.ghost_precomputer.stats(),
+    }
+
+
+@app.get("/api/ghosts")
+async def get_ghosts():
+    """获取记录的对手场面和我方当前场面对它们的胜率"""
+    return ghost_boards()
+
+
+def shop_odds(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """按共享随从池计算刷新概率，参数无效时抛出ValueError
+
+    ``cards``/``tribe`` 指定目标时返回 ``rolls`` 次刷新内看到目标的概率；同时评估当前商店中的每个随从。
+    我方场面和记录的对手场面上的随从视为已从池中取出。
+    """
+    game_state = websocket_manager.last_game_state
+    tier = parameters.get("tier") or (game_state.tavern_tier if game_state else None)
+    if not tier:
+        raise ValueError("暂无游戏状态，请提供酒馆等级 tier")
+    board = parameters.get("board")
+    if board is None:
+        board = game_state.board.get("minions", []) if game_state else []
+    shop = parameters.get("shop")
+    if shop is None:
+        shop = game_state.shop.get("minions", []) if game_state else []
+    visible = [minion for ghost in websocket_manager.ghosts.ghosts() for minion in ghost.minions]
+    rolls = int(parameters.get("rolls") or 1)
+    lobby = parameters.get("lobby")
+    odds = get_shop_odds(bool(parameters.get("duos")))
+    result = {
+        "tier": int(tier),
+        "candidates": odds.shop_candidates(shop, board, int(tier), rolls=rolls, visible=visible, lobby=lobby),
+        "visible": len(board) + len(visible),
     }
+    cards = parameters.get("cards") or []
+    if isinstance(cards, str):
+        cards = [cards]
+    if cards or parameters.get("tribe"):
+        result["query"] = odds.query(int(tier), cards, parameters.get("tribe"), rolls=rolls,
+                                     visible=list(board) + visible, lobby=lobby)
+    return result
+
+
+@app.post("/api/shop-odds")
+async def shop_odds_endpoint(request: Request):
+    """刷新概率
+
+    请求体为JSON：``cards``（随从名称列表）、``tribe``（种族，如 beast）、``rolls``（刷新次数，默认1）、
+    ``tier``（缺省为当前酒馆等级）、``board``和``shop``（缺省为当前场面和商店）、``lobby``（本局种族列表）、``duos``。
+    """
+    try:
+        parameters = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="请求体不是有效的JSON")
+    if not isinstance(parameters, dict):
+        raise HTTPException(status_code=400, detail="请求体应为JSON对象")
+    try:
+        return shop_odds(parameters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def search_cards(query: str = "", limit: int = 10, **filters) -> Dict[str, Any]:
+    """搜索卡牌名称、描述、关键字和种族，过滤条件无效时抛出ValueError"""
+    filters = {key: value for key, value in filters.items() if value is not None}
+    return get_card_search().search(query or "", limit=limit, **filters)
+
+
+@app.get("/api/cards/search")
+async def search_cards_endpoint(q: str = "", tier: Optional[int] = None, tribe: Optional[str] = None,
+                                keyword: Optional[str] = None, kind: Optional[str] = None, limit: int = 10):
+    """卡牌全文搜索
+
+    ``q`` 为查询文本（中文按两字词匹配），可按随从等级、种族（含 ``neutral``）、关键字（如 ``divine_shield``）
+    和卡牌类型（``minion``/``hero``）过滤；没有查询文本时按等级列出满足过滤条件的卡牌。
+    """
+    try:
+        return search_cards(q, limit=limit, tier=tier, tribe=tribe, keyword=keyword, kind=kind)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# 经济规划器在首次使用时创建（需要加载卡牌数据和随从池概率表）
+_economy_planner: Optional[EconomyPlanner] = None
+
+
+def estimate_upgrade_cost(tier: int, turn: int) -> int:
+    """按历史记录中升到该酒馆等级的回合估算第turn回合的升级费用"""
+    changes = [record for record in websocket_manager.history.query(event="tier_changed", limit=16)
+               if record["turn"] <= turn and record["tavern_tier"] == tier]
+    reached = changes[-1]["turn"] if changes else 1
+    return upgrade_cost(tier, turn - reached)
+
+
+def plan_economy(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """规划未来若干回合的升级曲线，缺省参数取最新识别的状态，参数无效时抛出ValueError"""
+    global _economy_planner
+    game_state = websocket_manager.last_game_state
+    # 0金币是有效输入，gold只检查是否缺省
+    if game_state is None and (not all(parameters.get(key) for key in ("turn", "tier"))
+                               or parameters.get("gold") is None):
+        raise ValueError("暂无游戏状态，请提供回合 turn、金币 gold 和酒馆等级 tier")
+    if _economy_planner is None:
+        _economy_planner = EconomyPlanner()
+    try:
+        turn = int(parameters.get("turn") or game_state.turn)
+        tier = int(parameters.get("tier") or game_state.tavern_tier)
+        gold = parameters.get("gold")
+        gold = int(gold if gold is not None else game_state.gold)
+        cost = parameters.get("upgrade_cost")
+        if cost is None and game_state is not None and game_state.tavern_tier == tier:
+            cost = estimate_upgrade_cost(tier, turn)
+        board = parameters.get("board")
+        if board is None:
+            board = game_state.board.get("minions", []) if game_state else []
+        return _economy_planner.plan(turn, gold, tier, cost, board)
+    except (TypeError, AttributeError) as e:
+        raise ValueError(f"参数格式无效: {e}")
+
+
+@app.post("/api/plan-economy")
+async def plan_economy_endpoint(request: Request):
+    """升级曲线规划
+
+    请求体为JSON：``turn``、``gold``、``tier``（缺省为当前状态）、``upgrade_cost``（缺省按历史记录估算）、
+    ``board``（缺省为当前场面）。
+    """
+    try:
+        parameters = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="请求体不是有效的JSON")
+    if not isinstance(parameters, dict):
+        raise HTTPException(status_code=400, detail="请求体应为JSON对象")
+    try:
+        return plan_economy(parameters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+class ServiceAdviceEngine(AdviceEngine):
+    """在识别服务进程内直接调用刷新概率、升级规划和站位搜索的建议引擎
+
+    后台任务的状态已经显式放在参数中，场面统计由引擎按任务的状态自行维护，
+    因此不会读取到比任务更新的 ``last_game_state``。
+    """
+
+    @staticmethod
+    def _call(helper: Callable[[Dict[str, Any]], Dict[str, Any]], parameters: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return helper(parameters)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def _shop_odds(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        return self._call(shop_odds, parameters)
+
+    def _plan_economy(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        return self._call(plan_economy, parameters)
+
+    def _optimize_position(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        return self._call(optimize_position, parameters)
+
+
+def _publish_advice(advice: Dict[str, Any]):
+    """一类建议算好后立即推送给订阅advice主题的客户端"""
+    websocket_manager.publish_advice()
+
+
+websocket_manager.advice_worker = AdviceWorker(ServiceAdviceEngine(), on_update=_publish_advice)
+
+
+def speculative_advice(kind: str) -> Optional[Dict[str, Any]]:
+    """按最新状态预先算好的建议（"board" 为场面分析），尚未算好或已过期时返回None，类型无效时抛出ValueError"""
+    if kind not in ADVICE_KINDS:
+        raise ValueError(f"未知建议类型: {kind}，可选: {', '.join(ADVICE_KINDS)}")
+    game_state = websocket_manager.last_game_state
+    if game_state is None:
+        return None
+    advice = websocket_manager.advice_worker.lookup(kind, game_state.to_dict(), websocket_manager.ghosts.version)
+    get_metrics().inc("coach_cache_requests_total", cache="advice", result="hit" if advice else "miss")
+    return advice
+
+
+@app.get("/api/advice")
+async def get_advice(kind: str = "buy"):
+    """获取后台预先计算的建议，``advice`` 为null表示尚未算好或状态已变化"""
+    try:
+        advice = speculative_advice(kind)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"kind": kind, "advice": advice, "worker": websocket_manager.advice_worker.stats()}
+
+
+@app.post("/api/optimize-position")
+async def optimize_position_endpoint(request: Request):
+    """搜索我方场面的最佳站位
+
+    请求体为JSON：``opponents``（对手场面列表，每个场面为随从列表，缺省为记录的对手场面）、
+    ``board``（缺省为当前场面）、``seed``、``deadline_ms``（默认1000）、``tier``。
+    """
+    try:
+        parameters = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="请求体不是有效的JSON")
+    if not isinstance(parameters, dict):
+        raise HTTPException(status_code=400, detail="请求体应为JSON对象")
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, optimize_position, parameters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def parse_topics(topics: Any) -> List[str]:
+    """校验订阅消息中的主题：须为已知主题名组成的列表，否则抛出ValueError"""
+    if not isinstance(topics, list) or not all(isinstance(topic, str) for topic in topics):
+        raise ValueError("topics 应为主题名列表")
+    unknown = [topic for topic in topics if topic not in TOPICS]
+    if unknown:
+        raise ValueError(f"未知主题: {', '.join(unknown)}，可选: {', '.join(TOPICS)}")
+    return topics
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket端点"""
-    await websocket_manager.connect(websocket)
+    """WebSocket端点
+
+    可通过查询参数 ``?topics=shop,advice`` 指定初始订阅，``?policy=coalesce&max_lag=5`` 指定本连接的积压策略
+    和延迟阈值，连接后发送 ``{"action": "subscribe" | "unsubscribe", "topics": [...]}`` 调整订阅。
+    """
+    topics_param = websocket.query_params.get("topics")
+    policy = websocket.query_params.get("policy")
+    max_lag = websocket.query_params.get("max_lag")
+    try:
+        # 与subscribe消息相同的校验，未知主题拒绝连接（空值表示不订阅任何主题）
+        topics = DEFAULT_TOPICS if topics_param is None else parse_topics(
+            [topic for topic in topics_param.split(",") if topic])
+        max_lag = float(max_lag) if max_lag is not None else None
+        check_queue_options(websocket_manager.max_queue, policy or websocket_manager.policy,
+                            max_lag if max_lag is not None else websocket_manager.max_lag)
+    except ValueError as e:
+        # 参数无效时拒绝连接（1008：违反策略）
+        await websocket.close(code=1008, reason=str(e))
+        return
+    await websocket_manager.connect(websocket, topics, policy, max_lag)
     try:
-        # 保持连接活跃
         while True:
-            # 等待客户端消息（心跳检测）
             data = await websocket.receive_text()
-            # 可以在这里处理客户端发送的消息
-            print(f"收到客户端消息: {data}")
+            try:
+                message = json.loads(data)
+            except json.JSONDecodeError:
+                # 非JSON消息视为心跳
+                continue
+            if not isinstance(message, dict):
+                continue
+            
+            action = message.get("action")
+            if action in ("subscribe", "unsubscribe"):
+                connection = websocket_manager.connections[websocket]
+                try:
+                    requested = parse_topics(message.get("topics"))
+                except ValueError as e:
+                    # 订阅保持不变
+                    connection.enqueue(json.dumps({"type": "error", "action": action, "message": str(e),
+                                                   "topics": sorted(connection.topics)}, ensure_ascii=False))
+                    continue
+                new_topics = set()
+                if action == "subscribe":
+                    new_topics = websocket_manager.subscribe(websocket, requested)
+                else:
+                    websocket_manager.unsubscribe(websocket, requested)
+                reply = {"type": "subscription", "topics": sorted(connection.topics)}
+                connection.enqueue(json.dumps(reply, ensure_ascii=False))
+                if new_topics:
+                    # 立即补发新订阅主题的当前数据
+                    websocket_manager.send_snapshot(connection, new_topics)
+            elif action == "ping":
+                websocket_manager.connections[websocket].enqueue(json.dumps({"type": "pong"}))
             
     except WebSocketDisconnect:
         websocket_manager.disconnect(websocket)
@@ -132,15 +1054,105 @@ async def websocket_endpoint(websocket: WebSocket):
         websocket_manager.disconnect(websocket)
 
 
+# 帧识别线程池（OpenCV在模板匹配时会释放GIL，线程可以并行利用多核）
+frame_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="frame-worker")
+
+
+def decode_frame(data: bytes, content_type: str, shape: Optional[str] = None) -> np.ndarray:
+    """将请求中的图像字节解码为BGR帧
+
+    支持PNG/JPEG编码图像，以及配合形状（如 ``1080,1920,3``）的原始BGR数据。
+    """
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("application/octet-stream", "image/x-raw-bgr") or shape:
+        if not shape:
+            raise ValueError("原始BGR数据需要提供X-Frame-Shape，例如 1080,1920,3")
+        dims = tuple(int(d) for d in shape.split(","))
+        if len(dims) == 2:
+            dims = (*dims, 3)
+        frame = np.frombuffer(data, dtype=np.uint8)
+        if frame.size != int(np.prod(dims)):
+            raise ValueError(f"数据长度 {frame.size} 与形状 {dims} 不匹配")
+        return frame.reshape(dims)
+    
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError(f"无法解码图像（{content_type or '未知类型'}）")
+    return frame
+
+
+def recognize_frame_bytes(data: bytes, content_type: str, shape: Optional[str] = None) -> Dict[str, Any]:
+    """解码并识别单帧（在工作线程中运行）"""
+    start = time.perf_counter()
+    try:
+        frame = decode_frame(data, content_type, shape)
+    except ValueError:
+        get_metrics().inc("coach_frames_dropped_total", reason="decode")
+        raise
+    decoded = time.perf_counter()
+    try:
+        check_frame(frame)
+    except ValueError:
+        get_metrics().inc("coach_frames_dropped_total", reason="shape")
+        raise
+    game_state = websocket_manager.upload_engine.recognize_frame(frame)
+    done = time.perf_counter()
+    return {
+        "game_state": game_state.to_dict(),
+        "shape": list(frame.shape),
+        "timing_ms": {
+            "decode": round((decoded - start) * 1000, 2),
+            "recognize": round((done - decoded) * 1000, 2),
+        },
+    }
+
+
 @app.post("/api/process-frame")
-async def process_frame_endpoint(frame_data: Dict[str, Any]):
-    """处理游戏帧的HTTP端点（用于测试）"""
+async def process_frame_endpoint(request: Request):
+    """识别上传的游戏帧
+
+    - ``image/png`` / ``image/jpeg``：请求体为单张图像
+    - ``application/octet-stream``：原始BGR数据，需在 ``X-Frame-Shape`` 头中给出形状
+    - ``multipart/form-data``：批量上传，每个文件部分为一帧，原始数据的部分同样使用 ``X-Frame-Shape`` 头
+    """
+    started = time.perf_counter()
+    content_type = request.headers.get("content-type", "")
     try:
-        # 这里应该接收实际的图像数据
-        # 暂时返回模拟数据
-        return {"status": "success", "message": "帧处理请求已接收"}
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            items = []
+            for field, value in form.multi_items():
+                if isinstance(value, str):
+                    continue
+                items.append((value.filename or field, await value.read(),
+                              value.content_type, value.headers.get("x-frame-shape")))
+        else:
+            items = [(None, await request.body(), content_type, request.headers.get("x-frame-shape"))]
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return {"status": "error", "message": f"读取请求失败: {e}"}
+    
+    if not items or not any(data for _, data, _, _ in items):
+        return {"status": "error", "message": "请求中没有图像数据"}
+    
+    loop = asyncio.get_running_loop()
+    futures = [loop.run_in_executor(frame_executor, recognize_frame_bytes, data, ctype, shape)
+               for _, data, ctype, shape in items]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    
+    frames = []
+    for index, ((name, _, _, _), result) in enumerate(zip(items, results)):
+        frame_result = {"index": index, "name": name}
+        if isinstance(result, Exception):
+            frame_result["error"] = str(result)
+        else:
+            frame_result.update(result)
+        frames.append(frame_result)
+    
+    return {
+        "status": "success",
+        "frames": frames,
+        "total_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
 
 
 # 启动函数